@@ -0,0 +1,223 @@
+"""Local HTTP JSON API over the models.
+
+    python api.py --port 8000
+    curl 'localhost:8000/workouts?limit=50&after=200'
+    curl -X POST localhost:8000/users -d '{"name": "Ada", "email": "ada@example.com"}'
+
+Resources are users, exercises, workouts and workout-exercises, each with
+GET /<resource> (a page of rows ordered by id), GET/DELETE /<resource>/<id> and
+POST /<resource>. POST /workouts and /workout-exercises answer 400 if the user,
+workout or exercise they refer to does not exist. A list page carries a "next"
+cursor; pass it back as ?after= to get the page after it. Every GET response has an ETag and honours
+If-None-Match. Responses are cached for FITNESS_API_CACHE_TTL seconds (default
+5), and any write through the API clears that cache.
+
+Each request gets its own Session from the shared pooled engine.
+"""
+import argparse
+import hashlib
+import json
+import os
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+from urllib.parse import parse_qs, urlsplit
+
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from cache import LRUCache
+from commands import RESOURCES, ROW_COLUMNS, model_for
+from instrumentation import enable_from_env
+from models import Session, User, Exercise, Workout, WorkoutExercise, DuplicateEmailError
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def _check_reference(session, body, field, resource):
+    # A row pointing at a missing user, workout or exercise would be stored as an
+    # orphan, since SQLite does not enforce the foreign keys here
+    if model_for(resource).find_by_id(session, body[field]) is None:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{field}: {resource} {body[field]} not found")
+
+def create_workout(session, body):
+    _check_reference(session, body, "user_id", "users")
+    return Workout.create(session, body["name"], body["user_id"])
+
+def create_workout_exercise(session, body):
+    _check_reference(session, body, "workout_id", "workouts")
+    _check_reference(session, body, "exercise_id", "exercises")
+    return WorkoutExercise.create(session, body["workout_id"], body["exercise_id"],
+                                  body.get("sets", 3), body.get("reps", 10), body.get("weight", 0.0))
+
+CREATORS = {
+    "users": lambda session, body: User.create(session, body["name"], body["email"]),
+    "exercises": lambda session, body: Exercise.create(session, body["name"], body.get("description")),
+    "workouts": create_workout,
+    "workout-exercises": create_workout_exercise,
+}
+
+def _int_param(query, name, default):
+    try:
+        return int(query.get(name, [default])[0])
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be an integer")
+
+def list_page(session, resource, after, limit):
+    to_row = RESOURCES[resource][1]
+    rows = [to_row(row) for row in islice(model_for(resource).rows(session, ROW_COLUMNS[resource], limit + 1, after), limit + 1)]
+    page = {"items": rows[:limit], "next": rows[limit - 1]["id"] if len(rows) > limit else None}
+    return page
+
+def get_one(session, resource, id):
+    to_row = RESOURCES[resource][1]
+    instance = model_for(resource).find_by_id(session, id)
+    if instance is None:
+        raise ApiError(HTTPStatus.NOT_FOUND, f"{resource} {id} not found")
+    return to_row(instance)
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY every
+    # keep-alive response waits out the client's delayed ACK
+    disable_nagle_algorithm = True
+    # Set on the server by make_server
+    session_factory = Session
+    response_cache = None
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _route(self):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        if not parts or parts[0] not in RESOURCES or len(parts) > 2:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"no such resource: {url.path}")
+        id = None
+        if len(parts) == 2:
+            if not parts[1].isdigit():
+                raise ApiError(HTTPStatus.NOT_FOUND, f"no such resource: {url.path}")
+            id = int(parts[1])
+        return parts[0], id, parse_qs(url.query)
+
+    def _send(self, status, body=b"", etag=None):
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        if body:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _send_json(self, status, document):
+        self._send(status, json.dumps(document, default=str).encode())
+
+    def _handle(self, action):
+        session = self.session_factory()
+        try:
+            action(session)
+        except ApiError as e:
+            self._send_json(e.status, {"error": str(e)})
+        except DuplicateEmailError as e:
+            self._send_json(HTTPStatus.CONFLICT, {"error": str(e)})
+        except (ValueError, KeyError, TypeError) as e:
+            session.rollback()
+            message = f"missing field {e}" if isinstance(e, KeyError) else str(e)
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": message})
+        except IntegrityError as e:
+            session.rollback()
+            self._send_json(HTTPStatus.CONFLICT, {"error": str(e.orig)})
+        except SQLAlchemyError as e:
+            session.rollback()
+            self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": e.__class__.__name__})
+        finally:
+            session.close()
+
+    def do_GET(self):
+        def get(session):
+            resource, id, query = self._route()
+            key = self.path
+            cached = self.response_cache.get(key)
+            if cached is None:
+                if id is None:
+                    limit = min(max(_int_param(query, "limit", DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+                    document = list_page(session, resource, _int_param(query, "after", 0), limit)
+                else:
+                    document = get_one(session, resource, id)
+                body = json.dumps(document, default=str).encode()
+                cached = (f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"', body)
+                self.response_cache.put(key, cached)
+            etag, body = cached
+            if etag in (tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")):
+                self._send(HTTPStatus.NOT_MODIFIED, etag=etag)
+            else:
+                self._send(HTTPStatus.OK, body, etag)
+        self._handle(get)
+
+    def do_POST(self):
+        def post(session):
+            resource, id, _ = self._route()
+            if id is not None:
+                raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "POST to the collection, not an item")
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError as e:
+                raise ApiError(HTTPStatus.BAD_REQUEST, f"invalid JSON: {e}")
+            if not isinstance(body, dict):
+                raise ApiError(HTTPStatus.BAD_REQUEST, "expected a JSON object")
+            instance = CREATORS[resource](session, body)
+            self.response_cache.invalidate()
+            self._send_json(HTTPStatus.CREATED, RESOURCES[resource][1](instance))
+        self._handle(post)
+
+    def do_DELETE(self):
+        def delete(session):
+            resource, id, _ = self._route()
+            if id is None:
+                raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "DELETE an item, not the collection")
+            if not model_for(resource).delete(session, id):
+                raise ApiError(HTTPStatus.NOT_FOUND, f"{resource} {id} not found")
+            self.response_cache.invalidate()
+            self._send(HTTPStatus.NO_CONTENT)
+        self._handle(delete)
+
+def make_server(host="127.0.0.1", port=8000, session_factory=None, cache_ttl=None, verbose=False):
+    """Create (but do not start) a threaded server; port 0 picks a free port"""
+    if cache_ttl is None:
+        cache_ttl = float(os.environ.get("FITNESS_API_CACHE_TTL", 5))
+    handler = type("Handler", (ApiHandler,), {
+        "session_factory": staticmethod(session_factory or Session),
+        "response_cache": LRUCache(maxsize=4096, ttl=cache_ttl),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.verbose = verbose
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the fitness tracker as a JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--cache-ttl", type=float, help="seconds to cache GET responses (0 disables)")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+    enable_from_env()
+    server = make_server(args.host, args.port, cache_ttl=args.cache_ttl, verbose=args.verbose)
+    print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
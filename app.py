@@ -1,7 +1,14 @@
 # app.py
-from cli import main_menu
+import sys
 
 if __name__ == "__main__":
+    from instrumentation import enable_from_env
+    enable_from_env()
+    if len(sys.argv) > 1:
+        # Subcommands run non-interactively, e.g. `python app.py users list --format jsonl`
+        from commands import main
+        sys.exit(main())
+    from cli import main_menu
     print("Welcome to Fitness Tracker Application")
     print("Starting application...")
     main_menu()
\ No newline at end of file
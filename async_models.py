@@ -0,0 +1,81 @@
+"""Asyncio access to the models for services that serve many requests at once.
+
+Needs the optional asyncio extras: ``pip install sqlalchemy[asyncio] aiosqlite``.
+
+Each call runs the synchronous classmethod from models.py on the AsyncSession's
+underlying Session through run_sync, so validation, personal-record upkeep and
+the catalog cache behave exactly as they do in the CLI:
+
+    async with AsyncSession() as session:
+        user = await users.create(session, "Ada", "ada@example.com")
+        recent = await workouts.get_all(session, load="joined")
+
+Relationships are not lazy-loaded outside run_sync, so ask for them with load=.
+"""
+import weakref
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from db import make_async_engine
+from migrations import LATEST_VERSION, get_version, migrate_atomically
+from models import Base, User, Exercise, Workout, WorkoutExercise
+
+_engine = None
+_upgraded = weakref.WeakSet()
+
+def get_async_engine():
+    global _engine
+    if _engine is None:
+        _engine = make_async_engine()
+    return _engine
+
+async def upgrade(engine):
+    """Bring the schema of engine's database up to date once per process"""
+    if engine in _upgraded:
+        return
+    # As in migrations.upgrade, a current database costs one PRAGMA read
+    async with engine.connect() as connection:
+        version = await connection.run_sync(get_version)
+    if version < LATEST_VERSION:
+        async with engine.connect() as connection:
+            connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+            await connection.run_sync(migrate_atomically, Base.metadata)
+    _upgraded.add(engine)
+
+class _LazyAsyncSessionmaker(async_sessionmaker):
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None and "bind" not in local_kw:
+            self.configure(bind=get_async_engine())
+        return super().__call__(**local_kw)
+
+# Instances stay readable after commit: lazy refreshes cannot run outside run_sync
+AsyncSession = _LazyAsyncSessionmaker(expire_on_commit=False)
+
+class AsyncModel:
+    """Awaitable versions of one model's classmethods"""
+    def __init__(self, model):
+        self.model = model
+
+    async def _run(self, session, method, *args, **kwargs):
+        await upgrade(session.bind)
+        return await session.run_sync(lambda sync_session: method(sync_session, *args, **kwargs))
+
+    async def create(self, session, *args, **kwargs):
+        return await self._run(session, self.model.create, *args, **kwargs)
+
+    async def get_all(self, session, load=None, relationships=None):
+        return await self._run(session, self.model.get_all, load, relationships)
+
+    async def find_by_id(self, session, id, load=None, relationships=None):
+        return await self._run(session, self.model.find_by_id, id, load, relationships)
+
+    async def delete(self, session, id):
+        return await self._run(session, self.model.delete, id)
+
+    async def delete_many(self, session, ids):
+        return await self._run(session, self.model.delete_many, ids)
+
+users = AsyncModel(User)
+exercises = AsyncModel(Exercise)
+workouts = AsyncModel(Workout)
+workout_exercises = AsyncModel(WorkoutExercise)
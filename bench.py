@@ -0,0 +1,1155 @@
+"""Benchmarks for the fitness tracker data layer.
+
+Each benchmark runs against a scratch SQLite database in a temporary directory,
+never against fitness.db. Run ``python bench.py <benchmark> --help`` for options.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from db import make_engine
+from migrations import upgrade
+from models import Base, User, Exercise, Workout, WorkoutExercise, BULK_BATCH_SIZE
+
+def scratch_session(directory, name="bench.db", tuned=True):
+    """Create an empty database in directory and return a session bound to it"""
+    url = f"sqlite:///{os.path.join(directory, name)}"
+    engine = make_engine({"url": url}) if tuned else create_engine(url)
+    upgrade(engine, Base.metadata)
+    return sessionmaker(bind=engine)()
+
+def report(label, count, elapsed, unit="rows"):
+    rate = count / elapsed if elapsed else float("inf")
+    print(f"{label:<32} {count:>10,} {unit} in {elapsed:8.3f}s  ({rate:,.0f} {unit}/sec)")
+
+def write_sample_file(path, rows, workout_ids, exercise_ids, seed=0):
+    """Write rows random workout exercises as CSV or JSONL depending on the extension"""
+    rng = random.Random(seed)
+    with open(path, "w", newline="") as f:
+        columns = ["workout_id", "exercise_id", "sets", "reps", "weight"]
+        writer = csv.writer(f) if path.endswith(".csv") else None
+        if writer:
+            writer.writerow(columns)
+        for _ in range(rows):
+            values = [rng.choice(workout_ids), rng.choice(exercise_ids),
+                      rng.randint(1, 6), rng.randint(1, 15), rng.randint(0, 80) * 2.5]
+            if writer:
+                writer.writerow(values)
+            else:
+                f.write(json.dumps(dict(zip(columns, values))) + "\n")
+
+def bench_bulk_insert(args):
+    from importer import import_workout_exercises
+    with tempfile.TemporaryDirectory() as directory:
+        session = scratch_session(directory)
+        user = User.create(session, "Bench User", "bench@example.com")
+        exercise_ids = [Exercise.create(session, f"Exercise {i}").id for i in range(8)]
+        workout_ids = [Workout.create(session, f"Workout {i}", user.id).id for i in range(50)]
+
+        rng = random.Random(0)
+        rows = [{"workout_id": rng.choice(workout_ids), "exercise_id": rng.choice(exercise_ids),
+                 "sets": 3, "reps": 10, "weight": 60.0} for _ in range(args.rows)]
+        start = time.perf_counter()
+        WorkoutExercise.bulk_create(session, rows, args.batch_size)
+        elapsed = time.perf_counter() - start
+        report("bulk_create (in memory)", args.rows, elapsed)
+        if args.rows / elapsed < args.min_rate:
+            raise SystemExit(f"FAIL  bulk_create ran below {args.min_rate:,} rows/sec")
+
+        for extension in (".csv", ".jsonl"):
+            path = os.path.join(directory, "sample" + extension)
+            write_sample_file(path, args.rows, workout_ids, exercise_ids)
+            start = time.perf_counter()
+            import_workout_exercises(session, path, args.batch_size)
+            report(f"import {extension}", args.rows, time.perf_counter() - start)
+
+        if args.compare_orm:
+            sample = rows[:args.compare_orm]
+            start = time.perf_counter()
+            for row in sample:
+                WorkoutExercise.create(session, **row)
+            report("WorkoutExercise.create", len(sample), time.perf_counter() - start)
+        session.close()
+
+def configure_bulk_insert(parser):
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    parser.add_argument("--min-rate", type=int, default=50000, metavar="ROWS",
+                        help="fail if bulk_create inserts fewer rows per second than this")
+    parser.add_argument("--compare-orm", type=int, default=1000, metavar="N",
+                        help="also time N single-row WorkoutExercise.create calls (0 to skip)")
+
+def populate(session, users, workouts_per_user, exercises_per_workout, exercises=8, seed=0):
+    """Fill a scratch database with a deterministic training history using seed.generate"""
+    import logging
+    from seed import generate
+    logging.getLogger("seed").setLevel(logging.WARNING)
+    return generate(session, users, workouts_per_user, exercises_per_workout, exercises, seed)
+
+def bench_reports(args):
+    import reports
+    with tempfile.TemporaryDirectory() as directory:
+        session = scratch_session(directory)
+        rows = args.users * args.workouts_per_user * args.exercises_per_workout
+        start = time.perf_counter()
+        populate(session, args.users, args.workouts_per_user, args.exercises_per_workout)
+        report("populate", rows, time.perf_counter() - start)
+        for name in ("volume_by_user", "volume_by_exercise", "volume_by_week"):
+            start = time.perf_counter()
+            getattr(reports, name)(session)
+            report(f"reports.{name}", rows, time.perf_counter() - start)
+        session.close()
+
+def configure_reports(parser):
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--workouts-per-user", type=int, default=200)
+    parser.add_argument("--exercises-per-workout", type=int, default=5)
+
+def bench_parallel_reports(args):
+    import reports
+    from parallel_reports import REPORTS, ReportPool
+    with tempfile.TemporaryDirectory() as directory:
+        session = scratch_session(directory)
+        populate(session, args.users, args.workouts_per_user, args.exercises_per_workout)
+        url = session.get_bind().url.render_as_string()
+        start = time.perf_counter()
+        expected = {name: getattr(reports, name)(session) for name in REPORTS}
+        serial = time.perf_counter() - start
+        session.close()
+        print(f"{'in-process':<32} {serial:8.3f}s")
+        failures = []
+        for workers in range(1, args.max_workers + 1):
+            with ReportPool(workers, url) as pool:
+                # The first run starts the workers and warms their page caches
+                pool.run()
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    results = pool.run()
+                elapsed = (time.perf_counter() - start) / args.repeat
+            print(f"{f'{workers} workers':<32} {elapsed:8.3f}s  ({serial / elapsed:.2f}x in-process)")
+            # Rows with equal volumes may come back in either order
+            failures += [(workers, name) for name in REPORTS
+                         if sorted(map(tuple, results[name])) != sorted(map(tuple, expected[name]))
+                         or len(results[name]) != len(expected[name])]
+    if failures:
+        for workers, name in failures:
+            print(f"FAIL  {name} with {workers} workers differs from the in-process report")
+        raise SystemExit(1)
+    print("ok    every report matches the in-process result")
+
+def configure_parallel_reports(parser):
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--workouts-per-user", type=int, default=200)
+    parser.add_argument("--exercises-per-workout", type=int, default=5)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+
+def bench_cache(args):
+    from sqlalchemy import event
+    from models import catalog_cache
+    with tempfile.TemporaryDirectory() as directory:
+        session = scratch_session(directory)
+        populate(session, 10, 2, 1, exercises=args.exercises)
+        ids = [exercise.id for exercise in Exercise.get_all(session)]
+        statements = []
+        event.listen(session.get_bind(), "before_cursor_execute", lambda *_: statements.append(1))
+        session.close()
+        for label, ttl in (("uncached", 0), ("cached", catalog_cache.ttl)):
+            catalog_cache.ttl = ttl
+            catalog_cache.invalidate()
+            catalog_cache.hits = catalog_cache.misses = 0
+            statements.clear()
+            start = time.perf_counter()
+            for i in range(args.lookups):
+                # One "Add Exercise to Workout" screen: list the catalog, then validate the pick
+                session = sessionmaker(bind=session.get_bind())()
+                Exercise.get_all(session)
+                Exercise.find_by_id(session, ids[i % len(ids)])
+                User.find_by_id(session, 1)
+                session.close()
+            report(label, args.lookups, time.perf_counter() - start, "screens")
+            print(f"{'':<32} {len(statements):,} SQL statements, cache {catalog_cache.stats()}")
+
+def configure_cache(parser):
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--exercises", type=int, default=50)
+
+def _timed(results, size, name, ops, func):
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    results.append({"size": size, "name": name, "ops": ops, "seconds": round(seconds, 6),
+                    "ops_per_sec": round(ops / seconds, 1) if seconds else None})
+    print(f"{size:>10,}  {name:<40} {ops:>9,} ops {seconds:9.4f}s", file=sys.stderr)
+
+def _crud_cases(session, ops):
+    """(name, ops, callable) for every CRUD classmethod on every model"""
+    user_ids = [u.id for u in session.query(User.id).order_by(User.id).limit(ops)]
+    workout_ids = [w.id for w in session.query(Workout.id).order_by(Workout.id).limit(ops)]
+    exercise_ids = [e.id for e in session.query(Exercise.id).order_by(Exercise.id)]
+    created = {}
+
+    def create(model, make):
+        created[model] = [make(i).id for i in range(ops)]
+
+    def delete(model):
+        for id in created[model]:
+            model.delete(session, id)
+
+    def find(model, ids):
+        for i in range(ops):
+            model.find_by_id(session, ids[i % len(ids)])
+
+    we_ids = [we.id for we in session.query(WorkoutExercise.id).order_by(WorkoutExercise.id).limit(ops)]
+    return [
+        ("User.create", ops, lambda: create(User, lambda i: User.create(session, "Bench User", f"bench{i}@example.com"))),
+        ("User.get_all", 1, lambda: User.get_all(session)),
+        ("User.find_by_id", ops, lambda: find(User, user_ids)),
+        ("User.delete", ops, lambda: delete(User)),
+        ("Exercise.create", ops, lambda: create(Exercise, lambda i: Exercise.create(session, f"Bench {i}"))),
+        ("Exercise.get_all", 1, lambda: Exercise.get_all(session)),
+        ("Exercise.find_by_id", ops, lambda: find(Exercise, exercise_ids)),
+        ("Exercise.delete", ops, lambda: delete(Exercise)),
+        ("Workout.create", ops, lambda: create(Workout, lambda i: Workout.create(session, "Bench", user_ids[0]))),
+        ("Workout.get_all", 1, lambda: Workout.get_all(session)),
+        ("Workout.find_by_id", ops, lambda: find(Workout, workout_ids)),
+        ("Workout.delete", ops, lambda: delete(Workout)),
+        ("WorkoutExercise.create", ops, lambda: create(WorkoutExercise, lambda i: WorkoutExercise.create(
+            session, workout_ids[i % len(workout_ids)], exercise_ids[0], 3, 10, 50.0))),
+        ("WorkoutExercise.get_all", 1, lambda: WorkoutExercise.get_all(session)),
+        ("WorkoutExercise.find_by_id", ops, lambda: find(WorkoutExercise, we_ids)),
+        ("WorkoutExercise.delete", ops, lambda: delete(WorkoutExercise)),
+    ]
+
+def _list_view_cases(session):
+    """(name, ops, callable) rendering each CLI list screen in full into a buffer"""
+    import contextlib
+    import io
+    import cli
+
+    def render(rows, format_row):
+        with contextlib.redirect_stdout(io.StringIO()):
+            cli.show_paged(rows, format_row, page_size=sys.maxsize)
+
+    counts = {model: session.query(func.count(model.id)).scalar() for model in (User, Exercise, Workout, WorkoutExercise)}
+    return [
+        ("cli.users list", counts[User], lambda: render(User.rows(session, batch_size=cli.PAGE_SIZE), cli.format_user)),
+        ("cli.exercises list", counts[Exercise], lambda: render(Exercise.rows(session, batch_size=cli.PAGE_SIZE), cli.format_exercise)),
+        ("cli.workouts list", counts[Workout], lambda: render(
+            Workout.rows(session, batch_size=cli.PAGE_SIZE), cli.format_workout)),
+        ("cli.workout exercises list", counts[WorkoutExercise], lambda: render(
+            WorkoutExercise.rows(session, batch_size=cli.PAGE_SIZE), cli.format_workout_exercise)),
+    ]
+
+def _report_cases(session):
+    import reports
+    return [(f"reports.{name}", 1, lambda name=name: getattr(reports, name)(session))
+            for name in ("volume_by_user", "volume_by_exercise", "volume_by_week")]
+
+def bench_suite(args):
+    import platform
+    import sqlite3
+    import sqlalchemy
+    results = []
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            session = scratch_session(directory)
+            counts = populate(session, size, args.workouts_per_user, args.exercises_per_workout, seed=args.seed)
+            session.close()
+            session = sessionmaker(bind=session.get_bind())()
+            for name, ops, run in (*_crud_cases(session, args.ops), *_list_view_cases(session), *_report_cases(session)):
+                _timed(results, size, name, ops, run)
+                session.expunge_all()
+            results.append({"size": size, "name": "rows", "counts": counts})
+            session.close()
+    document = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "sqlite": sqlite3.sqlite_version,
+            "workouts_per_user": args.workouts_per_user,
+            "exercises_per_workout": args.exercises_per_workout,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+    else:
+        json.dump(document, sys.stdout, indent=2)
+        print()
+
+def configure_suite(parser):
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000], help="user counts to run at")
+    parser.add_argument("--workouts-per-user", type=int, default=10)
+    parser.add_argument("--exercises-per-workout", type=int, default=5)
+    parser.add_argument("--ops", type=int, default=200, help="calls per single-row CRUD benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+
+async def _async_readers(engine, readers, seconds, user_ids):
+    import asyncio
+    from async_models import AsyncSession, users, workouts, upgrade as upgrade_async
+    await upgrade_async(engine)
+    deadline = time.perf_counter() + seconds
+
+    async def reader(seed):
+        rng = random.Random(seed)
+        done = 0
+        async with AsyncSession(bind=engine) as session:
+            while time.perf_counter() < deadline:
+                await users.find_by_id(session, rng.choice(user_ids))
+                await workouts.find_by_id(session, rng.randint(1, len(user_ids)), load="joined")
+                session.expunge_all()
+                done += 2
+        return done
+
+    return sum(await asyncio.gather(*(reader(i) for i in range(readers))))
+
+def bench_async_readers(args):
+    import asyncio
+    from db import make_async_engine
+    from models import catalog_cache
+    with tempfile.TemporaryDirectory() as directory:
+        session = scratch_session(directory)
+        populate(session, args.users, args.workouts_per_user, 3)
+        user_ids = [id for (id,) in session.query(User.id)]
+        url = session.get_bind().url.render_as_string()
+        session.close()
+        for readers in args.readers:
+            engine = make_async_engine({"url": url, "pool_size": readers, "max_overflow": 0})
+            # A zero TTL makes every lookup reach the database
+            catalog_cache.ttl, ttl = 0, catalog_cache.ttl
+            try:
+                start = time.perf_counter()
+                operations = asyncio.run(_async_readers(engine, readers, args.seconds, user_ids))
+                report(f"{readers} concurrent readers", operations, time.perf_counter() - start, "lookups")
+            finally:
+                catalog_cache.ttl = ttl
+                asyncio.run(engine.dispose())
+
+def configure_async_readers(parser):
+    parser.add_argument("--readers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--seconds", type=float, default=3.0, help="how long each reader count runs")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--workouts-per-user", type=int, default=10)
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def _http_client(host, port, deadline, max_ids, seed, latencies):
+    import http.client
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection(host, port)
+    etags = {}
+    resources = ("users", "exercises", "workouts", "workout-exercises")
+    while time.perf_counter() < deadline:
+        resource = rng.choice(resources)
+        if rng.random() < 0.7:
+            path = f"/{resource}?limit=50&after={rng.randint(0, max_ids[resource]) // 50 * 50}"
+        else:
+            path = f"/{resource}/{rng.randint(1, max_ids[resource])}"
+        headers = {"If-None-Match": etags[path]} if path in etags and rng.random() < 0.5 else {}
+        start = time.perf_counter()
+        connection.request("GET", path, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        if response.getheader("ETag"):
+            etags[path] = response.getheader("ETag")
+    connection.close()
+
+def bench_http_load(args):
+    import threading
+    from urllib.parse import urlsplit
+    import api
+    with tempfile.TemporaryDirectory() as directory:
+        server = None
+        if args.url:
+            url = urlsplit(args.url)
+            host, port = url.hostname, url.port or 80
+            max_ids = dict.fromkeys(("users", "exercises", "workouts", "workout-exercises"), args.max_id)
+        else:
+            session = scratch_session(directory)
+            populate(session, args.users, args.workouts_per_user, args.exercises_per_workout)
+            max_ids = {resource: session.query(func.max(model.id)).scalar()
+                       for resource, model in (("users", User), ("exercises", Exercise),
+                                               ("workouts", Workout), ("workout-exercises", WorkoutExercise))}
+            server = api.make_server(port=0, session_factory=sessionmaker(bind=session.get_bind()),
+                                     cache_ttl=args.cache_ttl)
+            session.close()
+            host, port = server.server_address
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            latencies = []
+            deadline = time.perf_counter() + args.seconds
+            clients = [threading.Thread(target=_http_client, args=(host, port, deadline, max_ids, i, latencies))
+                       for i in range(args.clients)]
+            start = time.perf_counter()
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+    latencies.sort()
+    report(f"{args.clients} clients", len(latencies), elapsed, "requests")
+    print(f"latency  p50 {_percentile(latencies, 0.5) * 1000:7.2f} ms  p90 {_percentile(latencies, 0.9) * 1000:7.2f} ms  "
+          f"p99 {_percentile(latencies, 0.99) * 1000:7.2f} ms  max {latencies[-1] * 1000:7.2f} ms")
+
+def configure_http_load(parser):
+    parser.add_argument("--url", help="load an already running server instead of starting one on a scratch database")
+    parser.add_argument("--max-id", type=int, default=1000, help="highest id to request when using --url")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent keep-alive connections")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--cache-ttl", type=float, default=5.0, help="response cache TTL for the scratch server")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--workouts-per-user", type=int, default=20)
+    parser.add_argument("--exercises-per-workout", type=int, default=5)
+
+SEARCH_QUERIES = ("squat", "barbell shoulders", "hamstring curl", "chest push", "zzyzx")
+
+def bench_search(args):
+    from sqlalchemy import insert, or_, and_, select
+    import logging
+    import re
+    from search import search
+    from seed import seed_exercises
+    logging.getLogger("seed").setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        session = scratch_session(directory)
+        samples = [(e.name, e.description) for e in seed_exercises(session)]
+        words = sorted({w.lower() for _, d in samples for w in re.findall(r"[a-z]+", d)}) + ["hamstring", "curl"]
+        rng = random.Random(0)
+        start = time.perf_counter()
+        for offset in range(0, args.rows, BULK_BATCH_SIZE):
+            session.execute(insert(Exercise.__table__), [
+                {"name": f"{rng.choice(samples)[0]} {i}", "description": " ".join(rng.choices(words, k=rng.randint(8, 24)))}
+                for i in range(offset, min(offset + BULK_BATCH_SIZE, args.rows))])
+            session.commit()
+        report("insert (with FTS triggers)", args.rows, time.perf_counter() - start)
+        failures = []
+        for query in SEARCH_QUERIES:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                results = search(session, query, limit=args.limit, kind="exercise")
+            fts = (time.perf_counter() - start) / args.repeat
+            like = and_(*(or_(Exercise.name.ilike(f"%{w}%"), Exercise.description.ilike(f"%{w}%"))
+                          for w in re.findall(r"\w+", query)))
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                session.execute(select(Exercise.id, Exercise.name).where(like).limit(args.limit)).all()
+            like_first = (time.perf_counter() - start) / args.repeat
+            start = time.perf_counter()
+            matches = session.execute(select(func.count()).select_from(Exercise).where(like)).scalar()
+            like_all = time.perf_counter() - start
+            print(f"{query!r:<22} {matches:>9,} matches  FTS top {args.limit}: {fts * 1000:8.2f} ms  "
+                  f"LIKE first {args.limit}: {like_first * 1000:8.2f} ms  LIKE all: {like_all * 1000:8.2f} ms")
+            # Prefix matching and stemming let FTS find more rows than LIKE, never fewer
+            if len(results) < min(args.limit, matches):
+                failures.append(query)
+        session.close()
+    if failures:
+        raise SystemExit(f"FAIL  FTS found fewer hits than LIKE for {', '.join(map(repr, failures))}")
+    print("ok    FTS finds as many hits as the LIKE scan")
+
+def configure_search(parser):
+    parser.add_argument("--rows", type=int, default=1000000, help="exercises to index")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+
+def bench_rollups(args):
+    from datetime import timedelta
+    from models import DailyRollup, WeeklyRollup, ExerciseRollup
+    with tempfile.TemporaryDirectory() as directory:
+        session = scratch_session(directory)
+        rows = args.users * args.workouts_per_user * args.exercises_per_workout
+        start = time.perf_counter()
+        populate(session, args.users, args.workouts_per_user, args.exercises_per_workout)
+        report("populate (with rollups)", rows, time.perf_counter() - start)
+        user_ids = [id for (id,) in session.query(User.id)]
+        volume = func.sum(WorkoutExercise.sets * WorkoutExercise.reps * WorkoutExercise.weight)
+        week = func.strftime("%Y-%W", Workout.date)
+        cases = [
+            ("weekly, all users, rollup", lambda: session.query(WeeklyRollup.user_id, WeeklyRollup.period,
+                                                               WeeklyRollup.workouts, WeeklyRollup.volume).all()),
+            ("weekly, all users, GROUP BY", lambda: session.query(Workout.user_id, week, func.count(func.distinct(Workout.id)), volume)
+             .outerjoin(WorkoutExercise, WorkoutExercise.workout_id == Workout.id).group_by(Workout.user_id, week).all()),
+            ("weekly, one user, rollup", lambda: [WeeklyRollup.for_user(session, id) for id in user_ids[:args.lookups]]),
+            ("weekly, one user, GROUP BY", lambda: [
+                session.query(week, func.count(func.distinct(Workout.id)), volume)
+                .outerjoin(WorkoutExercise, WorkoutExercise.workout_id == Workout.id)
+                .filter(Workout.user_id == id).group_by(week).all() for id in user_ids[:args.lookups]]),
+        ]
+        for label, run in cases:
+            start = time.perf_counter()
+            run()
+            report(label, args.lookups if "one user" in label else 1, time.perf_counter() - start, "queries")
+        latest = session.query(func.max(Workout.date)).scalar()
+        start = time.perf_counter()
+        for id in user_ids[:args.lookups]:
+            Workout.between(session, id, latest - timedelta(days=30), latest)
+        report("Workout.between (30 days)", args.lookups, time.perf_counter() - start, "queries")
+        if (DailyRollup.check_consistency(session) or WeeklyRollup.check_consistency(session)
+                or ExerciseRollup.check_consistency(session)):
+            raise SystemExit("FAIL  rollups do not match a recompute")
+        print("ok    rollups match a full recompute")
+        session.close()
+
+def configure_rollups(parser):
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--workouts-per-user", type=int, default=200)
+    parser.add_argument("--exercises-per-workout", type=int, default=5)
+    parser.add_argument("--lookups", type=int, default=100, help="per-user queries to time")
+
+def bench_recommendations(args):
+    import recommendations
+    from types import SimpleNamespace
+    from models import TrainingStats
+    with tempfile.TemporaryDirectory() as directory:
+        session = scratch_session(directory)
+        populate(session, args.users, args.workouts_per_user, args.exercises_per_workout)
+        # Bulk loads leave the stats of the pairs they touch stale; catch up once
+        TrainingStats.refresh(session)
+        user_ids = [id for (id,) in session.query(User.id).limit(args.lookups)]
+        names = dict(session.query(Exercise.id, Exercise.name))
+
+        def from_history(user_id):
+            # What the stats table saves: re-read and fold the user's full history
+            computed = TrainingStats._computed(session, Workout.user_id == user_id)
+            return sorted(((names[exercise_id], exercise_id,
+                            recommendations.suggest(SimpleNamespace(**stats)))
+                           for (_, exercise_id), stats in computed.items()))
+
+        start = time.perf_counter()
+        incremental = [recommendations.recommend(session, id) for id in user_ids]
+        report("recommend (rolling stats)", len(user_ids), time.perf_counter() - start, "users")
+        start = time.perf_counter()
+        replayed = [from_history(id) for id in user_ids]
+        report("recommend (full history)", len(user_ids), time.perf_counter() - start, "users")
+        mismatched = [id for id, have, want in zip(user_ids, incremental, replayed)
+                      if [(r.exercise_id, (r.sets, r.reps, r.weight, r.reason)) for r in have]
+                      != [(exercise_id, suggestion) for _, exercise_id, suggestion in want]]
+        if mismatched or TrainingStats.check_consistency(session):
+            raise SystemExit(f"FAIL  stats differ from the history for users {mismatched[:10]}")
+        print("ok    rolling stats match a replay of the history")
+        session.close()
+
+def configure_recommendations(parser):
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--workouts-per-user", type=int, default=200)
+    parser.add_argument("--exercises-per-workout", type=int, default=5)
+    parser.add_argument("--lookups", type=int, default=100, help="users to recommend for")
+
+def bench_email_lookup(args):
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        session = scratch_session(directory)
+        rows = [{"name": f"User {i}", "email": f"user{i}@example.com"} for i in range(args.users)]
+        start = time.perf_counter()
+        User.bulk_create(session, rows)
+        report("User.bulk_create (checked)", args.users, time.perf_counter() - start)
+        emails = [rng.choice(rows)["email"].upper() for _ in range(args.lookups)]
+        start = time.perf_counter()
+        indexed = [User.find_by_email(session, email).id for email in emails]
+        report("find_by_email", len(emails), time.perf_counter() - start, "lookups")
+        scan_emails = emails[:args.scan_lookups]
+        start = time.perf_counter()
+        # What finding a user by email took before: list every user and compare in Python
+        scanned = [next(user.id for user in User.get_all(session) if user.email.lower() == email.lower())
+                   for email in scan_emails]
+        report("get_all + scan", len(scan_emails), time.perf_counter() - start, "lookups")
+        session.close()
+    if indexed[:len(scanned)] != scanned:
+        raise SystemExit("FAIL  find_by_email and the scan found different users")
+    print("ok    find_by_email matches the scan")
+
+def configure_email_lookup(parser):
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--lookups", type=int, default=10000)
+    parser.add_argument("--scan-lookups", type=int, default=5, help="lookups timed with the full scan")
+
+def bench_projections(args):
+    import tracemalloc
+    with tempfile.TemporaryDirectory() as directory:
+        session = scratch_session(directory)
+        populate(session, args.users, args.workouts_per_user, args.exercises_per_workout)
+        total = session.query(func.count(WorkoutExercise.id)).scalar()
+        print(f"{total:,} workout exercises; time and peak traced memory per 100k rows")
+        paths = [
+            ("get_all joined", lambda: WorkoutExercise.get_all(session, load="joined")),
+            ("iter_all joined", lambda: WorkoutExercise.iter_all(session, args.batch_size, load="joined")),
+            ("rows", lambda: WorkoutExercise.rows(session, batch_size=args.batch_size)),
+        ]
+        for label, query in paths:
+            # Touch the names the CLI formatter prints, through each path's own attributes
+            if label == "rows":
+                consume = lambda: sum(1 for we in query() if we.workout_name and we.exercise_name)
+            else:
+                consume = lambda: sum(1 for we in query() if we.workout.name and we.exercise.name)
+            session.expunge_all()
+            start = time.perf_counter()
+            rows = consume()
+            elapsed = time.perf_counter() - start
+            # A second pass under tracemalloc, which would skew the timing
+            session.expunge_all()
+            tracemalloc.start()
+            consume()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            scale = 100000 / rows
+            print(f"{label:<32} {elapsed * scale:8.3f}s  {peak * scale / 2**20:8.1f} MB")
+        session.close()
+
+def configure_projections(parser):
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--workouts-per-user", type=int, default=100)
+    parser.add_argument("--exercises-per-workout", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=1000)
+
+def _export_worker(job):
+    """Export in a fresh process so its peak RSS belongs to this path alone"""
+    import resource
+    path, url, directory, chunk_size = job
+    engine = make_engine({"url": url})
+    start = time.perf_counter()
+    if path == "columnar":
+        from export import export_snapshot
+        rows = sum(table["rows"] for table in export_snapshot(engine, directory, chunk_size=chunk_size)["tables"].values())
+    else:
+        # The ORM dump this replaces: materialise every instance, write its columns as CSV
+        session = sessionmaker(bind=engine)()
+        rows = 0
+        os.makedirs(directory, exist_ok=True)
+        for mapper in Base.registry.mappers:
+            model = mapper.class_
+            columns = [column.key for column in mapper.column_attrs]
+            with open(os.path.join(directory, f"{model.__tablename__}.csv"), "w", newline="") as f:
+                writer = csv.writer(f)
+                for instance in session.query(model).all():
+                    writer.writerow([getattr(instance, column) for column in columns])
+                    rows += 1
+        session.close()
+    elapsed = time.perf_counter() - start
+    return rows, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _verify_snapshot(session, directory):
+    from sqlalchemy import select
+    from export import load_table, read_manifest
+    manifest = read_manifest(directory)
+    mismatches = []
+    for name, table in Base.metadata.tables.items():
+        columns = load_table(directory, name, manifest)
+        expected = session.execute(select(table).order_by(*table.primary_key.columns))
+        got = zip(*(columns[column.name] for column in table.columns))
+        for row, loaded in zip(expected, got):
+            if tuple(row) != loaded:
+                mismatches.append((name, tuple(row), loaded))
+                break
+        if manifest["tables"][name]["rows"] != session.execute(select(func.count()).select_from(table)).scalar():
+            mismatches.append((name, "row count", None))
+    return mismatches
+
+def bench_export(args):
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        session = scratch_session(directory)
+        populate(session, args.users, args.workouts_per_user, args.exercises_per_workout)
+        url = session.get_bind().url.render_as_string()
+        for path in ("orm", "columnar"):
+            with context.Pool(1) as pool:
+                rows, elapsed, peak_kb = pool.apply(_export_worker, ((path, url, os.path.join(directory, path), args.chunk_size),))
+            report(f"export via {path}", rows, elapsed)
+            print(f"{'':<32} peak RSS {peak_kb / 1024:,.0f} MB")
+        mismatches = _verify_snapshot(session, os.path.join(directory, "columnar"))
+        session.close()
+    if mismatches:
+        for mismatch in mismatches:
+            print("FAIL ", *mismatch)
+        raise SystemExit(1)
+    print("ok    every table round-trips through the snapshot")
+
+def configure_export(parser):
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--workouts-per-user", type=int, default=100)
+    parser.add_argument("--exercises-per-workout", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+
+def _table_contents(session):
+    from models import PersonalRecord
+    return {model.__tablename__: sorted(tuple(row) for row in session.execute(model.__table__.select()))
+            for model in (User, Exercise, Workout, WorkoutExercise, PersonalRecord)}
+
+def _orm_cascade_delete(session, model, ids):
+    # The previous delete path: load each object and let the ORM cascade remove its children
+    from models import PersonalRecord
+    pairs = set()
+    for id in ids:
+        instance = session.get(model, id)
+        if instance is None:
+            continue
+        if model is Workout:
+            pairs |= {(instance.user_id, we.exercise_id) for we in instance.workout_exercises}
+        elif model is User:
+            session.query(PersonalRecord).filter_by(user_id=id).delete()
+        elif model is Exercise:
+            session.query(PersonalRecord).filter_by(exercise_id=id).delete()
+        session.delete(instance)
+    session.flush()
+    PersonalRecord.refresh_pairs(session, pairs)
+    session.commit()
+
+def bench_bulk_delete(args):
+    from models import PersonalRecord, DailyRollup, WeeklyRollup, ExerciseRollup
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        sessions = {}
+        for name in ("orm", "bulk"):
+            sessions[name] = scratch_session(directory, f"{name}.db")
+            populate(sessions[name], args.users, args.workouts_per_user, args.exercises_per_workout, seed=args.seed)
+        session = sessions["bulk"]
+        plan = [
+            (Workout, rng.sample([id for (id,) in session.query(Workout.id)], args.workouts)),
+            (User, rng.sample([id for (id,) in session.query(User.id)], args.delete_users)),
+            (Exercise, rng.sample([id for (id,) in session.query(Exercise.id)], 1)),
+        ]
+        failures = 0
+        for model, ids in plan:
+            start = time.perf_counter()
+            _orm_cascade_delete(sessions["orm"], model, ids)
+            report(f"ORM cascade {model.__name__}", len(ids), time.perf_counter() - start)
+            start = time.perf_counter()
+            model.delete_many(session, ids)
+            report(f"{model.__name__}.delete_many", len(ids), time.perf_counter() - start)
+            if _table_contents(sessions["orm"]) != _table_contents(session):
+                print(f"FAIL  {model.__name__}: remaining rows differ from the ORM cascade")
+                failures += 1
+            if PersonalRecord.check_consistency(session):
+                print(f"FAIL  {model.__name__}: personal records out of date")
+                failures += 1
+            if (DailyRollup.check_consistency(session) or WeeklyRollup.check_consistency(session)
+                    or ExerciseRollup.check_consistency(session)):
+                print(f"FAIL  {model.__name__}: rollups out of date")
+                failures += 1
+        for name in sessions:
+            sessions[name].close()
+    if failures:
+        raise SystemExit(1)
+    print("ok    delete_many leaves the same rows as the ORM cascade")
+
+def configure_bulk_delete(parser):
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--workouts-per-user", type=int, default=200)
+    parser.add_argument("--exercises-per-workout", type=int, default=5)
+    parser.add_argument("--workouts", type=int, default=200, help="random workouts to delete")
+    parser.add_argument("--delete-users", type=int, default=5, help="random users to delete")
+    parser.add_argument("--seed", type=int, default=0)
+
+def _natural_contents(session):
+    # Every table keyed by values rather than ids, which differ between synced databases
+    from sqlalchemy import select
+    sets = (select(User.email, Workout.name, Workout.date, Exercise.name,
+                   WorkoutExercise.sets, WorkoutExercise.reps, WorkoutExercise.weight)
+            .join(Workout, WorkoutExercise.workout_id == Workout.id)
+            .join(User, Workout.user_id == User.id)
+            .join(Exercise, WorkoutExercise.exercise_id == Exercise.id))
+    return {"users": sorted(session.execute(select(User.email, User.name)).all()),
+            "exercises": sorted(session.execute(select(Exercise.name, Exercise.description)).all()),
+            "workouts": sorted(session.execute(select(User.email, Workout.name, Workout.date)
+                                               .join(User, Workout.user_id == User.id)).all()),
+            "workout_exercises": sorted(session.execute(sets).all())}
+
+def _full_import(source, target, chunk_size=50000):
+    # The previous way to merge: copy every row of every table, then rebuild the records
+    from sqlalchemy import select
+    from models import PersonalRecord
+    for model in (User, Exercise, Workout, WorkoutExercise):
+        columns = [column for column in model.__table__.columns if column.computed is None]
+        result = source.execute(select(*columns).order_by(model.id)).mappings()
+        while rows := result.fetchmany(chunk_size):
+            target.execute(model.__table__.insert(), [dict(row) for row in rows])
+    PersonalRecord.rebuild(target)
+
+def bench_sync(args):
+    import sync
+    from models import PersonalRecord
+    with tempfile.TemporaryDirectory() as directory:
+        gym_a = scratch_session(directory, "a.db")
+        gym_b = scratch_session(directory, "b.db")
+        populate(gym_a, args.users, args.workouts_per_user, args.exercises_per_workout)
+        start = time.perf_counter()
+        result = sync.pull(gym_b, gym_a, args.batch_size)
+        report("initial pull", result.pulled, time.perf_counter() - start, "changes")
+
+        rng = random.Random(0)
+        workout_ids = [id for (id,) in gym_a.query(Workout.id)]
+        exercise_ids = [id for (id,) in gym_a.query(Exercise.id)]
+        rows = [{"workout_id": rng.choice(workout_ids), "exercise_id": rng.choice(exercise_ids),
+                 "sets": rng.randint(1, 6), "reps": rng.randint(1, 15), "weight": rng.randint(0, 80) * 2.5}
+                for _ in range(args.delta)]
+        start = time.perf_counter()
+        WorkoutExercise.bulk_create(gym_a, rows)
+        report("bulk_create delta (logged)", args.delta, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        result = sync.pull(gym_b, gym_a, args.batch_size)
+        report("incremental pull", result.pulled, time.perf_counter() - start, "changes")
+        total = gym_a.query(func.count(WorkoutExercise.id)).scalar()
+        gym_c = scratch_session(directory, "c.db")
+        start = time.perf_counter()
+        _full_import(gym_a, gym_c)
+        report("full re-import", total, time.perf_counter() - start)
+        gym_c.close()
+
+        failures = []
+        if _natural_contents(gym_a) != _natural_contents(gym_b):
+            failures.append("the synced database differs from its source")
+        if PersonalRecord.check_consistency(gym_b):
+            failures.append("personal records out of date after sync")
+        if sync.pull(gym_b, gym_a).applied or sync.pull(gym_a, gym_b).applied:
+            failures.append("a second sync applied changes again")
+        gym_a.close()
+        gym_b.close()
+        failures += _sync_email_chain(directory)
+    if failures:
+        for failure in failures:
+            print(f"FAIL  {failure}")
+        raise SystemExit(1)
+    print("ok    the synced database matches its source")
+
+def _sync_email_chain(directory):
+    # A takes an email B already has; B keeps its own owner, and C pulling B must agree
+    import sync
+    gym_a, gym_b, gym_c = (scratch_session(directory, f"chain-{name}.db") for name in "abc")
+    user = User.create(gym_a, "Chain User", "chain@example.com")
+    sync.pull(gym_b, gym_a)
+    User.create(gym_b, "Taken User", "taken@example.com")
+    user.email = "Taken@example.com"
+    gym_a.commit()
+    failures = []
+    try:
+        sync.pull(gym_b, gym_a)
+        sync.pull(gym_c, gym_b)
+    except Exception as e:
+        failures.append(f"a clashing email update broke a sync further down the chain: {e!r}")
+    else:
+        if _natural_contents(gym_b) != _natural_contents(gym_c):
+            failures.append("a clashing email update left B and C different")
+        if gym_b.query(User.email).filter_by(name="Chain User").scalar() != "chain@example.com":
+            failures.append("a clashing email update took the email from its owner")
+    for session in (gym_a, gym_b, gym_c):
+        session.close()
+    return failures
+
+def configure_sync(parser):
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--workouts-per-user", type=int, default=100)
+    parser.add_argument("--exercises-per-workout", type=int, default=5)
+    parser.add_argument("--delta", type=int, default=200000, help="workout exercises added after the first sync")
+    parser.add_argument("--batch-size", type=int, default=10000, help="changes applied per transaction")
+
+def _import_times_us(module):
+    """Cumulative import time of module and of everything it imported, by module
+    name, in a fresh interpreter, from -X importtime"""
+    import subprocess
+    import sys
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as directory:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {here!r}); import {module}"],
+            cwd=directory, capture_output=True, text=True, check=True)
+        if os.listdir(directory):
+            raise SystemExit(f"importing {module} touched the database: {os.listdir(directory)}")
+    times = {}
+    for line in result.stderr.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[1].isdigit():
+            times[fields[2]] = int(fields[1])
+    if module not in times:
+        raise SystemExit(f"no import time reported for {module}")
+    return times
+
+def bench_startup(args):
+    # The limit is a fraction of what importing the baseline (the models, and with
+    # them SQLAlchemy) costs on this machine, so it holds on slow and fast ones
+    import statistics
+    baseline_ms = statistics.median(_import_times_us(args.baseline)[args.baseline] for _ in range(args.runs)) / 1000
+    limit_ms = baseline_ms * args.max_ratio
+    print(f"      import {args.baseline:<10} median {baseline_ms:7.1f} ms (baseline)")
+    failures = 0
+    for module in args.modules:
+        runs = [_import_times_us(module) for _ in range(args.runs)]
+        samples = sorted(times[module] for times in runs)
+        median_ms = statistics.median(samples) / 1000
+        eager = sorted({name for times in runs for name in times if name.split(".")[0] in args.deferred})
+        ok = median_ms <= limit_ms and not eager
+        failures += not ok
+        print(f"{'ok' if ok else 'FAIL':<5} import {module:<10} median {median_ms:7.1f} ms "
+              f"(min {samples[0] / 1000:.1f}, max {samples[-1] / 1000:.1f}, limit {limit_ms:.0f} ms)"
+              + (f", imports {', '.join(eager[:3])}" if eager else ""))
+    if failures:
+        raise SystemExit(f"{failures} module(s) exceeded the startup budget")
+
+def configure_startup(parser):
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--baseline", default="models", help="module whose import time the limit is relative to")
+    parser.add_argument("--max-ratio", type=float, default=0.25,
+                        help="fail if a module's median cumulative import time exceeds this fraction of the baseline's")
+    parser.add_argument("--deferred", nargs="+", default=["sqlalchemy", "models"],
+                        help="fail if a module imports any of these at startup")
+    parser.add_argument("--modules", nargs="+", default=["cli", "commands", "seed"])
+
+def explain(session, query):
+    """Return the EXPLAIN QUERY PLAN detail lines for an ORM query"""
+    sql = str(query.statement.compile(session.get_bind(), compile_kwargs={"literal_binds": True}))
+    return [row[-1] for row in session.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + sql)]
+
+def check_query_plans(args):
+    with tempfile.TemporaryDirectory() as directory:
+        session = scratch_session(directory)
+        checks = [
+            ("user's workouts", session.query(Workout).filter(Workout.user_id == 1),
+             "ix_workouts_user_id_date"),
+            ("user's workouts by date", session.query(Workout).filter(Workout.user_id == 1)
+             .order_by(Workout.date), "ix_workouts_user_id_date"),
+            ("workout's exercises", session.query(WorkoutExercise).filter(WorkoutExercise.workout_id == 1),
+             "ix_workout_exercises_workout_id"),
+            ("exercise usage", session.query(WorkoutExercise).filter(WorkoutExercise.exercise_id == 1),
+             "ix_workout_exercises_exercise_id_workout_id"),
+            ("user by email", session.query(User).filter(User.email_key == "ann@example.com"),
+             "ix_users_email_key"),
+            ("bulk email check", session.query(User.email_key, User.id)
+             .filter(User.email_key.in_(["ann@example.com", "bo@example.com"])), "ix_users_email_key"),
+        ]
+        failures = 0
+        for label, query, index in checks:
+            plan = explain(session, query)
+            used = any(index in line for line in plan)
+            failures += not used
+            print(f"{'ok' if used else 'FAIL':<5} {label:<26} {' | '.join(plan)}")
+        session.close()
+    if failures:
+        raise SystemExit(f"{failures} query plan(s) did not use the expected index")
+
+def configure_query_plans(parser):
+    pass
+
+# Each CLI list screen as (menu, answers to its choice and id prompts)
+LIST_SCREENS = {
+    "users list": ("user_menu", ["2"]),
+    "user's workouts": ("user_menu", ["5", "1"]),
+    "exercises list": ("exercise_menu", ["2"]),
+    "workouts list": ("workout_menu", ["2"]),
+    "workout's exercises": ("workout_menu", ["5", "1"]),
+    "workout exercises list": ("workout_exercise_menu", ["2"]),
+}
+
+def _list_screen_data(session, rows):
+    # rows users and exercises; user 1 has rows workouts and workout 1 has rows exercises
+    from sqlalchemy import insert
+    User.bulk_create(session, [{"name": f"User {i}", "email": f"user{i}@example.com"} for i in range(rows)])
+    session.execute(insert(Exercise.__table__), [{"name": f"Exercise {i}"} for i in range(rows)])
+    session.execute(insert(Workout.__table__), [{"name": f"Workout {i}", "user_id": 1} for i in range(rows)])
+    session.commit()
+    WorkoutExercise.bulk_create(session, [{"workout_id": 1, "exercise_id": i + 1, "sets": 3, "reps": 5,
+                                           "weight": 50.0 + i} for i in range(rows)])
+
+def _screen_statements(engine, menu, answers):
+    # Drive the real menu with scripted input and count the SQL statements it runs
+    import contextlib
+    import io
+    from unittest import mock
+    from sqlalchemy import event
+    import cli
+    from models import Session, catalog_cache
+    script = list(answers) + ["0"]
+
+    def answer(prompt=""):
+        if "Press Enter" in prompt:
+            return ""
+        return script.pop(0)
+
+    statements = []
+    count = lambda *_: statements.append(1)
+    catalog_cache.invalidate()
+    previous = Session.kw.get("bind")
+    Session.configure(bind=engine)
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        with mock.patch("builtins.input", answer), contextlib.redirect_stdout(io.StringIO()):
+            getattr(cli, menu)()
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+        Session.configure(bind=previous)
+    return len(statements)
+
+def check_list_statements(args):
+    import cli
+    if 2 * args.rows > cli.PAGE_SIZE:
+        raise SystemExit(f"--rows must be at most {cli.PAGE_SIZE // 2} so every list fits on one page")
+    counts = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in (args.rows, 2 * args.rows):
+            session = scratch_session(directory, f"rows-{rows}.db")
+            _list_screen_data(session, rows)
+            engine = session.get_bind()
+            session.close()
+            counts[rows] = {label: _screen_statements(engine, menu, answers)
+                            for label, (menu, answers) in LIST_SCREENS.items()}
+            engine.dispose()
+    failures = 0
+    for label in LIST_SCREENS:
+        low, high = counts[args.rows][label], counts[2 * args.rows][label]
+        failures += high > low
+        print(f"{'ok' if high <= low else 'FAIL':<5} {label:<26} {low} statements at {args.rows} rows, "
+              f"{high} at {2 * args.rows}")
+    if failures:
+        raise SystemExit(f"{failures} list screen(s) ran more statements for more rows")
+
+def configure_list_statements(parser):
+    parser.add_argument("--rows", type=int, default=8, help="rows per list on the smaller database")
+
+def bench_workout_session(args):
+    from workout_session import WorkoutSession
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        session = scratch_session(directory)
+        journals = os.path.join(directory, "drafts")
+        user = User.create(session, "Bench User", "bench@example.com")
+        exercise_ids = [Exercise.create(session, f"Exercise {i}").id for i in range(8)]
+        start = time.perf_counter()
+        for i in range(args.workouts):
+            log = WorkoutSession(f"Workout {i}", user.id, journal_dir=journals)
+            for _ in range(args.entries):
+                log.add(rng.choice(exercise_ids), rng.randint(1, 5), rng.randint(1, 12), rng.randint(0, 80) * 2.5)
+            log.commit(session)
+        report("journal + commit", args.workouts * args.entries, time.perf_counter() - start)
+
+        def crash(log):
+            # Die part way through writing the next entry
+            with open(log.path, "a") as f:
+                f.write('{"op": "add", "exercise_id": %d, "se' % exercise_ids[0])
+
+        log = WorkoutSession("Crashed twice", user.id, journal_dir=journals)
+        log.add(exercise_ids[0], 5, 5, 100.0)
+        crash(log)
+        log = WorkoutSession.open(log.path)
+        log.add(exercise_ids[1], 3, 8, 60.0)
+        crash(log)
+        log = WorkoutSession.open(log.path)
+        expected = [(exercise_ids[0], 5, 5, 100.0), (exercise_ids[1], 3, 8, 60.0)]
+        resumed = [(row["exercise_id"], row["sets"], row["reps"], row["weight"]) for row in log.entries]
+        workout = log.commit(session)
+        saved = [(row.exercise_id, row.sets, row.reps, row.weight)
+                 for row in session.query(WorkoutExercise).filter_by(workout_id=workout.id).order_by(WorkoutExercise.id)]
+        session.close()
+    if resumed != expected or saved != expected:
+        raise SystemExit(f"FAIL  crash, resume, add, crash again: resumed {resumed}, saved {saved}, expected {expected}")
+    print("ok    crash, resume, add, crash again keeps every completed entry")
+
+def configure_workout_session(parser):
+    parser.add_argument("--workouts", type=int, default=200)
+    parser.add_argument("--entries", type=int, default=8, help="exercises logged per workout")
+    parser.add_argument("--seed", type=int, default=0)
+
+def _commit_worker(job):
+    path, tuned, commits, workout_id, exercise_id = job
+    url = f"sqlite:///{path}"
+    engine = make_engine({"url": url}) if tuned else create_engine(url)
+    session = sessionmaker(bind=engine)()
+    locked = 0
+    for _ in range(commits):
+        try:
+            WorkoutExercise.create(session, workout_id, exercise_id, 3, 10, 60.0)
+        except OperationalError:
+            session.rollback()
+            locked += 1
+    session.close()
+    engine.dispose()
+    return locked
+
+def bench_commit_throughput(args):
+    for tuned in (False, True):
+        with tempfile.TemporaryDirectory() as directory:
+            session = scratch_session(directory, tuned=tuned)
+            user = User.create(session, "Bench User", "bench@example.com")
+            exercise = Exercise.create(session, "Bench Press")
+            workout = Workout.create(session, "Bench Day", user.id)
+            jobs = [(os.path.join(directory, "bench.db"), tuned, args.commits, workout.id, exercise.id)] * args.processes
+            session.close()
+
+            start = time.perf_counter()
+            if args.processes == 1:
+                locked = [_commit_worker(jobs[0])]
+            else:
+                with multiprocessing.Pool(args.processes) as pool:
+                    locked = pool.map(_commit_worker, jobs)
+            elapsed = time.perf_counter() - start
+            label = "tuned (make_engine)" if tuned else "defaults (create_engine)"
+            report(label, args.commits * args.processes - sum(locked), elapsed, "commits")
+            if sum(locked):
+                print(f"{'':<32} {sum(locked):>10,} commits failed with 'database is locked'")
+
+def configure_commit_throughput(parser):
+    parser.add_argument("--commits", type=int, default=2000, help="single-row commits per process")
+    parser.add_argument("--processes", type=int, default=1, help="concurrent writer processes")
+
+BENCHMARKS = {
+    "bulk-insert": (bench_bulk_insert, configure_bulk_insert, "bulk_create and CSV/JSONL import throughput"),
+    "commit-throughput": (bench_commit_throughput, configure_commit_throughput,
+                          "single-row commit rate with default vs tuned engine settings"),
+    "reports": (bench_reports, configure_reports, "volume reports over a generated history"),
+    "parallel-reports": (bench_parallel_reports, configure_parallel_reports,
+                         "per-user reports sharded over 1..N worker processes against one process"),
+    "cache": (bench_cache, configure_cache, "exercise catalog and user lookups with and without the cache"),
+    "startup": (bench_startup, configure_startup, "import time of the entry points, with a regression threshold"),
+    "bulk-delete": (bench_bulk_delete, configure_bulk_delete,
+                    "delete_many against the ORM cascade, checking both leave the same rows"),
+    "async-readers": (bench_async_readers, configure_async_readers,
+                      "lookup throughput of N concurrent asyncio readers on one WAL database"),
+    "http-load": (bench_http_load, configure_http_load, "p50/p99 latency of the JSON API under concurrent clients"),
+    "search": (bench_search, configure_search, "FTS5 search against the equivalent LIKE scan"),
+    "rollups": (bench_rollups, configure_rollups, "weekly rollup tables against GROUP BY over the raw rows"),
+    "recommendations": (bench_recommendations, configure_recommendations,
+                        "next-session suggestions from the rolling stats against replaying the history"),
+    "email-lookup": (bench_email_lookup, configure_email_lookup,
+                     "case-insensitive find_by_email through its index against get_all and a scan"),
+    "projections": (bench_projections, configure_projections,
+                    "named-tuple rows() against ORM get_all/iter_all, time and memory per 100k rows"),
+    "export": (bench_export, configure_export, "columnar snapshot round trip, rows/sec and peak RSS against the ORM dump"),
+    "sync": (bench_sync, configure_sync, "incremental change-log sync of a large delta against a full re-import"),
+    "suite": (bench_suite, configure_suite, "CRUD, CLI list and report timings at several sizes, as JSON"),
+    "query-plans": (check_query_plans, configure_query_plans, "assert lookups use the foreign key indexes"),
+    "workout-session": (bench_workout_session, configure_workout_session,
+                        "journaled workout logging, and resuming a journal after repeated crashes"),
+    "list-statements": (check_list_statements, configure_list_statements,
+                        "assert each CLI list screen runs the same number of statements at N and 2N rows"),
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fitness tracker benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    for name, (run, configure, help_text) in BENCHMARKS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        configure(subparser)
+        subparser.set_defaults(run=run)
+    args = parser.parse_args(argv)
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
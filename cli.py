@@ -1,6 +1,12 @@
-from models import Session, User, Exercise, Workout, WorkoutExercise
+# The models (and SQLAlchemy) are imported by each menu as it opens
+from datetime import datetime, timedelta
+from instrumentation import span
+from contextlib import nullcontext
+from itertools import islice
 import sys
 
+PAGE_SIZE = 20
+
 def clear_screen():
     print("\n" * 5)
 
@@ -14,6 +20,14 @@ def print_menu(title, options):
     choice = input("\nEnter your choice: ")
     return choice
 
+def menu_action(title, options, choice):
+    """Name a menu choice is timed under, e.g. cli.USER MANAGEMENT: Delete User"""
+    if choice == "0":
+        return f"cli.{title}: Back"
+    if choice.isdigit() and 1 <= int(choice) <= len(options):
+        return f"cli.{title}: {options[int(choice) - 1]}"
+    return f"cli.{title}: invalid choice"
+
 def safe_input(prompt, validator=None, error_msg=None):
     while True:
         value = input(prompt)
@@ -21,12 +35,55 @@ def safe_input(prompt, validator=None, error_msg=None):
             return value
         print(error_msg or "Invalid input, please try again.")
 
+def format_user(user):
+    return f"ID: {user.id}, Name: {user.name}, Email: {user.email}"
+
+def format_exercise(exercise):
+    return f"ID: {exercise.id}, Name: {exercise.name}, Description: {exercise.description}"
+
+# The formatters take the named tuples from Model.rows(), so list screens never
+# build ORM instances
+
+def format_workout(workout):
+    return f"ID: {workout.id}, Name: {workout.name}, Date: {workout.date}, User: {workout.user_name}"
+
+def format_workout_exercise(we):
+    return (f"ID: {we.id}, Workout: {we.workout_name}, Exercise: {we.exercise_name}, "
+            f"Sets: {we.sets}, Reps: {we.reps}, Weight: {we.weight}")
+
+def find_row(model, session, id):
+    return next(model.rows(session, ids=[id]), None)
+
+def show_paged(rows, format_row, page_size=PAGE_SIZE, action=None):
+    """Print rows one page at a time, returning how many were shown. Fetching each
+    page is timed under action, if given, but not the wait at the page prompt."""
+    rows = iter(rows)
+
+    def next_page():
+        if action is None:
+            return list(islice(rows, page_size))
+        with span(action):
+            return list(islice(rows, page_size))
+
+    page = next_page()
+    shown = 0
+    while page:
+        for row in page:
+            print(format_row(row))
+        shown += len(page)
+        page = next_page()
+        if page and input("\nPress Enter for next page, or 'q' to stop: ").strip().lower() == "q":
+            break
+    return shown
+
 def main_menu():
     options = [
         "User Management",
         "Exercise Management",
         "Workout Management",
         "Workout Exercise Management",
+        "Reports",
+        "Search",
         "Exit"
     ]
     
@@ -41,13 +98,35 @@ def main_menu():
             workout_menu()
         elif choice == "4":
             workout_exercise_menu()
-        elif choice == "5" or choice == "0":
+        elif choice == "5":
+            reports_menu()
+        elif choice == "6":
+            search_screen()
+        elif choice == "7" or choice == "0":
             print("Goodbye!")
             sys.exit(0)
         else:
             input("Invalid choice. Press Enter to continue...")
 
+def search_screen():
+    from models import Session
+    from search import search
+    session = Session()
+    try:
+        query = input("\nSearch exercises and workouts: ")
+        with span("cli.SEARCH"):
+            results = search(session, query, limit=PAGE_SIZE * 5)
+        print(f"\nResults for '{query}':")
+        if not show_paged(results, lambda r: f"{r.kind.title()} ID: {r.id}, Name: {r.name}"
+                                             + (f" - {r.snippet}" if r.kind == "exercise" and r.snippet else ""),
+                          action="cli.SEARCH"):
+            print("No matches.")
+    finally:
+        session.close()
+    input("Press Enter to continue...")
+
 def user_menu():
+    from models import Session, User, DuplicateEmailError
     session = Session()
     
     options = [
@@ -55,59 +134,69 @@ def user_menu():
         "View All Users",
         "Find User by ID",
         "Delete User",
-        "View User's Workouts"
+        "View User's Workouts",
+        "Find User by Email"
     ]
     
     while True:
         choice = print_menu("USER MANAGEMENT", options)
+        # Only the work a choice does is timed, not the prompts it waits at
+        action = menu_action("USER MANAGEMENT", options, choice)
         
         if choice == "1":
             try:
                 name = safe_input("Enter name: ", lambda x: len(x) >= 2, "Name must be at least 2 characters")
                 email = safe_input("Enter email: ", lambda x: '@' in x, "Email must contain @")
-                user = User.create(session, name, email)
+                with span(action):
+                    user = User.create(session, name, email)
                 print(f"User created with ID {user.id}")
+            except DuplicateEmailError as e:
+                print(f"Error: {e}")
+                with span(action):
+                    existing = User.find_by_email(session, email)
+                if existing:
+                    print(f"Existing user: {format_user(existing)}")
             except ValueError as e:
                 print(f"Error: {e}")
             input("Press Enter to continue...")
-            
+        
         elif choice == "2":
-            users = User.get_all(session)
-            if users:
-                print("\nAll Users:")
-                for user in users:
-                    print(f"ID: {user.id}, Name: {user.name}, Email: {user.email}")
-            else:
+            print("\nAll Users:")
+            if not show_paged(User.rows(session, batch_size=PAGE_SIZE), format_user, action=action):
                 print("No users found.")
             input("Press Enter to continue...")
-            
+        
         elif choice == "3":
             try:
                 id = int(safe_input("Enter user ID: ", lambda x: x.isdigit(), "ID must be a number"))
-                user = User.find_by_id(session, id)
+                with span(action):
+                    user = find_row(User, session, id)
                 if user:
-                    print(f"ID: {user.id}, Name: {user.name}, Email: {user.email}")
+                    print(format_user(user))
                 else:
                     print("User not found.")
             except ValueError:
                 print("Invalid ID format.")
             input("Press Enter to continue...")
-            
+        
         elif choice == "4":
             try:
                 id = int(safe_input("Enter user ID to delete: ", lambda x: x.isdigit(), "ID must be a number"))
-                if User.delete(session, id):
+                with span(action):
+                    deleted = User.delete(session, id)
+                if deleted:
                     print("User deleted successfully.")
                 else:
                     print("User not found.")
             except ValueError:
                 print("Invalid ID format.")
             input("Press Enter to continue...")
-            
+        
         elif choice == "5":
             try:
                 id = int(safe_input("Enter user ID: ", lambda x: x.isdigit(), "ID must be a number"))
-                user = User.find_by_id(session, id)
+                with span(action):
+                    user = User.find_by_id(session, id, load="selectin")
                 if user:
                     if user.workouts:
                         print(f"\nWorkouts for {user.name}:")
@@ -120,7 +209,17 @@ def user_menu():
             except ValueError:
                 print("Invalid ID format.")
             input("Press Enter to continue...")
-            
+        
+        elif choice == "6":
+            email = safe_input("Enter email: ", lambda x: '@' in x, "Email must contain @")
+            with span(action):
+                user = User.find_by_email(session, email)
+            if user:
+                print(format_user(user))
+            else:
+                print("User not found.")
+            input("Press Enter to continue...")
+        
         elif choice == "0":
             session.close()
             return
@@ -128,6 +227,7 @@ def user_menu():
             input("Invalid choice. Press Enter to continue...")
 
 def exercise_menu():
+    from models import Session, Exercise
     session = Session()
     
     options = [
@@ -140,54 +240,57 @@ def exercise_menu():
     
     while True:
         choice = print_menu("EXERCISE MANAGEMENT", options)
+        # Only the work a choice does is timed, not the prompts it waits at
+        action = menu_action("EXERCISE MANAGEMENT", options, choice)
         
         if choice == "1":
             try:
                 name = safe_input("Enter exercise name: ", lambda x: len(x) >= 2, "Name must be at least 2 characters")
                 description = input("Enter description (optional): ")
-                exercise = Exercise.create(session, name, description)
+                with span(action):
+                    exercise = Exercise.create(session, name, description)
                 print(f"Exercise created with ID {exercise.id}")
             except ValueError as e:
                 print(f"Error: {e}")
             input("Press Enter to continue...")
-            
+        
         elif choice == "2":
-            exercises = Exercise.get_all(session)
-            if exercises:
-                print("\nAll Exercises:")
-                for exercise in exercises:
-                    print(f"ID: {exercise.id}, Name: {exercise.name}, Description: {exercise.description}")
-            else:
+            print("\nAll Exercises:")
+            if not show_paged(Exercise.rows(session, batch_size=PAGE_SIZE), format_exercise, action=action):
                 print("No exercises found.")
             input("Press Enter to continue...")
-            
+        
         elif choice == "3":
             try:
                 id = int(safe_input("Enter exercise ID: ", lambda x: x.isdigit(), "ID must be a number"))
-                exercise = Exercise.find_by_id(session, id)
+                with span(action):
+                    exercise = find_row(Exercise, session, id)
                 if exercise:
-                    print(f"ID: {exercise.id}, Name: {exercise.name}, Description: {exercise.description}")
+                    print(format_exercise(exercise))
                 else:
                     print("Exercise not found.")
             except ValueError:
                 print("Invalid ID format.")
             input("Press Enter to continue...")
-            
+        
         elif choice == "4":
             try:
                 id = int(safe_input("Enter exercise ID to delete: ", lambda x: x.isdigit(), "ID must be a number"))
-                if Exercise.delete(session, id):
+                with span(action):
+                    deleted = Exercise.delete(session, id)
+                if deleted:
                     print("Exercise deleted successfully.")
                 else:
                     print("Exercise not found.")
             except ValueError:
                 print("Invalid ID format.")
             input("Press Enter to continue...")
-            
+        
         elif choice == "5":
             try:
                 id = int(safe_input("Enter exercise ID: ", lambda x: x.isdigit(), "ID must be a number"))
-                exercise = Exercise.find_by_id(session, id)
+                with span(action):
+                    exercise = Exercise.find_by_id(session, id, load="selectin")
                 if exercise:
                     if exercise.workout_exercises:
                         print(f"\nWorkouts containing {exercise.name}:")
@@ -200,7 +303,7 @@ def exercise_menu():
             except ValueError:
                 print("Invalid ID format.")
             input("Press Enter to continue...")
-            
+        
         elif choice == "0":
             session.close()
             return
@@ -208,6 +311,7 @@ def exercise_menu():
             input("Invalid choice. Press Enter to continue...")
 
 def workout_menu():
+    from models import Session, User, Workout
     session = Session()
     
     options = [
@@ -220,77 +324,81 @@ def workout_menu():
     
     while True:
         choice = print_menu("WORKOUT MANAGEMENT", options)
+        # Only the work a choice does is timed, not the prompts it waits at
+        action = menu_action("WORKOUT MANAGEMENT", options, choice)
         
         if choice == "1":
             try:
                 name = safe_input("Enter workout name: ", lambda x: len(x) >= 2, "Name must be at least 2 characters")
-                
+            
                 # Show users to choose from
-                users = User.get_all(session)
-                if not users:
+                print("\nAvailable Users:")
+                if not show_paged(User.rows(session, ("id", "name"), PAGE_SIZE),
+                                  lambda user: f"ID: {user.id}, Name: {user.name}", action=action):
                     print("No users found. Please create a user first.")
                     input("Press Enter to continue...")
                     continue
-                
-                print("\nAvailable Users:")
-                for user in users:
-                    print(f"ID: {user.id}, Name: {user.name}")
-                
+            
                 user_id = int(safe_input("Enter user ID: ", lambda x: x.isdigit(), "ID must be a number"))
-                if not User.find_by_id(session, user_id):user = User.find_by_id(session, user_id)
+                with span(action):
+                    user = User.find_by_id(session, user_id)
                 if not user:
                     print("User not found.")
                     input("Press Enter to continue...")
                     continue
-                
-                workout = Workout.create(session, name, user_id)
+            
+                with span(action):
+                    workout = Workout.create(session, name, user_id)
                 print(f"Workout created with ID {workout.id}")
             except ValueError as e:
                 print(f"Error: {e}")
             input("Press Enter to continue...")
-            
+        
         elif choice == "2":
-            workouts = Workout.get_all(session)
-            if workouts:
-                print("\nAll Workouts:")
-                for workout in workouts:
-                    print(f"ID: {workout.id}, Name: {workout.name}, Date: {workout.date}, User: {workout.user.name}")
-            else:
+            print("\nAll Workouts:")
+            if not show_paged(Workout.rows(session, batch_size=PAGE_SIZE), format_workout, action=action):
                 print("No workouts found.")
             input("Press Enter to continue...")
-            
+        
         elif choice == "3":
             try:
                 id = int(safe_input("Enter workout ID: ", lambda x: x.isdigit(), "ID must be a number"))
-                workout = Workout.find_by_id(session, id)
+                with span(action):
+                    workout = find_row(Workout, session, id)
                 if workout:
-                    print(f"ID: {workout.id}, Name: {workout.name}, Date: {workout.date}, User: {workout.user.name}")
+                    print(format_workout(workout))
                 else:
                     print("Workout not found.")
             except ValueError:
                 print("Invalid ID format.")
             input("Press Enter to continue...")
-            
+        
         elif choice == "4":
             try:
                 id = int(safe_input("Enter workout ID to delete: ", lambda x: x.isdigit(), "ID must be a number"))
-                if Workout.delete(session, id):
+                with span(action):
+                    deleted = Workout.delete(session, id)
+                if deleted:
                     print("Workout deleted successfully.")
                 else:
                     print("Workout not found.")
             except ValueError:
                 print("Invalid ID format.")
             input("Press Enter to continue...")
-            
+        
         elif choice == "5":
             try:
                 id = int(safe_input("Enter workout ID: ", lambda x: x.isdigit(), "ID must be a number"))
-                workout = Workout.find_by_id(session, id)
+                with span(action):
+                    workout = Workout.find_by_id(session, id, load="selectin",
+                                                 relationships=("workout_exercises.exercise",))
                 if workout:
                     if workout.workout_exercises:
                         print(f"\nExercises in '{workout.name}':")
                         for we in workout.workout_exercises:
                             print(f"Exercise: {we.exercise.name}, Sets: {we.sets}, Reps: {we.reps}, Weight: {we.weight}")
+                        with span(action):
+                            show_recommendations(session, workout)
                     else:
                         print(f"Workout '{workout.name}' doesn't have any exercises.")
                 else:
@@ -298,14 +406,26 @@ def workout_menu():
             except ValueError:
                 print("Invalid ID format.")
             input("Press Enter to continue...")
-            
+        
         elif choice == "0":
             session.close()
             return
         else:
             input("Invalid choice. Press Enter to continue...")
 
+def show_recommendations(session, workout):
+    from recommendations import recommend
+    if workout.user_id is None:
+        return
+    exercise_ids = {we.exercise_id for we in workout.workout_exercises}
+    recommendations = recommend(session, workout.user_id, exercise_ids)
+    if recommendations:
+        print("\nSuggested for next session:")
+        for r in recommendations:
+            print(f"Exercise: {r.exercise_name}, Sets: {r.sets}, Reps: {r.reps}, Weight: {r.weight} ({r.reason})")
+
 def workout_exercise_menu():
+    from models import Session, Exercise, Workout, WorkoutExercise
     session = Session()
     
     options = [
@@ -313,114 +433,329 @@ def workout_exercise_menu():
         "View All Workout Exercises",
         "Find Workout Exercise by ID",
         "Update Sets/Reps/Weight",
-        "Remove Exercise from Workout"
+        "Remove Exercise from Workout",
+        "Bulk Update Sets/Reps/Weight",
+        "Log Workout Session"
     ]
     
     while True:
         choice = print_menu("WORKOUT EXERCISE MANAGEMENT", options)
+        # Only the work a choice does is timed, not the prompts it waits at
+        action = menu_action("WORKOUT EXERCISE MANAGEMENT", options, choice)
         
         if choice == "1":
             try:
                 # Show workouts to choose from
-                workouts = Workout.get_all(session)
-                if not workouts:
+                print("\nAvailable Workouts:")
+                if not show_paged(Workout.rows(session, ("id", "name", "user_name"), PAGE_SIZE),
+                                  lambda workout: f"ID: {workout.id}, Name: {workout.name}, User: {workout.user_name}",
+                                  action=action):
                     print("No workouts found. Please create a workout first.")
                     input("Press Enter to continue...")
                     continue
-                
-                print("\nAvailable Workouts:")
-                for workout in workouts:
-                    print(f"ID: {workout.id}, Name: {workout.name}, User: {workout.user.name}")
-                
+            
                 workout_id = int(safe_input("Enter workout ID: ", lambda x: x.isdigit(), "ID must be a number"))
-                if not Workout.find_by_id(session, workout_id):
+                with span(action):
+                    workout = Workout.find_by_id(session, workout_id)
+                if not workout:
                     print("Workout not found.")
                     input("Press Enter to continue...")
                     continue
-                
+            
                 # Show exercises to choose from
-                exercises = Exercise.get_all(session)
+                with span(action):
+                    exercises = Exercise.get_all(session)
                 if not exercises:
                     print("No exercises found. Please create an exercise first.")
                     input("Press Enter to continue...")
                     continue
-                
+            
                 print("\nAvailable Exercises:")
                 for exercise in exercises:
                     print(f"ID: {exercise.id}, Name: {exercise.name}")
-                
+            
                 exercise_id = int(safe_input("Enter exercise ID: ", lambda x: x.isdigit(), "ID must be a number"))
-                if not Exercise.find_by_id(session, exercise_id):
+                with span(action):
+                    exercise = Exercise.find_by_id(session, exercise_id)
+                if not exercise:
                     print("Exercise not found.")
                     input("Press Enter to continue...")
                     continue
-                
+            
                 sets = int(safe_input("Enter number of sets: ", lambda x: x.isdigit(), "Sets must be a number"))
                 reps = int(safe_input("Enter number of reps: ", lambda x: x.isdigit(), "Reps must be a number"))
                 weight = float(safe_input("Enter weight (kg): ", lambda x: x.replace('.', '', 1).isdigit(), "Weight must be a number"))
-                
-                workout_exercise = WorkoutExercise.create(session, workout_id, exercise_id, sets, reps, weight)
+            
+                with span(action):
+                    workout_exercise = WorkoutExercise.create(session, workout_id, exercise_id, sets, reps, weight)
                 print(f"Exercise added to workout with ID {workout_exercise.id}")
             except ValueError as e:
                 print(f"Error: {e}")
             input("Press Enter to continue...")
-            
+        
         elif choice == "2":
-            workout_exercises = WorkoutExercise.get_all(session)
-            if workout_exercises:
-                print("\nAll Workout Exercises:")
-                for we in workout_exercises:
-                    print(f"ID: {we.id}, Workout: {we.workout.name}, Exercise: {we.exercise.name}, " 
-                          f"Sets: {we.sets}, Reps: {we.reps}, Weight: {we.weight}")
-            else:
+            print("\nAll Workout Exercises:")
+            if not show_paged(WorkoutExercise.rows(session, batch_size=PAGE_SIZE), format_workout_exercise, action=action):
                 print("No workout exercises found.")
             input("Press Enter to continue...")
-            
+        
         elif choice == "3":
             try:
                 id = int(safe_input("Enter workout exercise ID: ", lambda x: x.isdigit(), "ID must be a number"))
-                we = WorkoutExercise.find_by_id(session, id)
+                with span(action):
+                    we = find_row(WorkoutExercise, session, id)
                 if we:
-                    print(f"ID: {we.id}, Workout: {we.workout.name}, Exercise: {we.exercise.name}, "
-                          f"Sets: {we.sets}, Reps: {we.reps}, Weight: {we.weight}")
+                    print(format_workout_exercise(we))
                 else:
                     print("Workout exercise not found.")
             except ValueError:
                 print("Invalid ID format.")
             input("Press Enter to continue...")
-            
+        
         elif choice == "4":
             try:
                 id = int(safe_input("Enter workout exercise ID: ", lambda x: x.isdigit(), "ID must be a number"))
-                we = WorkoutExercise.find_by_id(session, id)
+                with span(action):
+                    we = WorkoutExercise.find_by_id(session, id)
                 if we:
                     print(f"Current: Sets: {we.sets}, Reps: {we.reps}, Weight: {we.weight}")
                     sets = int(safe_input("Enter new number of sets: ", lambda x: x.isdigit(), "Sets must be a number"))
                     reps = int(safe_input("Enter new number of reps: ", lambda x: x.isdigit(), "Reps must be a number"))
                     weight = float(safe_input("Enter new weight (kg): ", lambda x: x.replace('.', '', 1).isdigit(), "Weight must be a number"))
-                    
-                    we.set_sets(sets)
-                    we.set_reps(reps)
-                    we.set_weight(weight)
-                    session.commit()
+                
+                    with span(action):
+                        we.set_sets(sets)
+                        we.set_reps(reps)
+                        we.set_weight(weight)
+                        session.commit()
                     print("Workout exercise updated successfully.")
                 else:
                     print("Workout exercise not found.")
             except ValueError as e:
                 print(f"Error: {e}")
             input("Press Enter to continue...")
-            
+        
         elif choice == "5":
             try:
                 id = int(safe_input("Enter workout exercise ID to remove: ", lambda x: x.isdigit(), "ID must be a number"))
-                if WorkoutExercise.delete(session, id):
+                with span(action):
+                    deleted = WorkoutExercise.delete(session, id)
+                if deleted:
                     print("Exercise removed from workout successfully.")
                 else:
                     print("Workout exercise not found.")
             except ValueError:
                 print("Invalid ID format.")
             input("Press Enter to continue...")
-            
+        
+        elif choice == "6":
+            try:
+                print("\nChoose which workout exercises to change (leave blank to not filter):")
+                filters = {name: ask_optional_id(f"{label} ID: ") for name, label in
+                           (("workout_id", "Workout"), ("user_id", "User"), ("exercise_id", "Exercise"))}
+                print("\nFor each value enter a new value, +N or -N to change it by N, or leave blank to keep it:")
+                sets, add_sets = ask_change("Sets: ", int)
+                reps, add_reps = ask_change("Reps: ", int)
+                weight, add_weight = ask_change("Weight (kg): ", float)
+                with span(action):
+                    updated = WorkoutExercise.update_many(session, **filters, sets=sets, reps=reps, weight=weight,
+                                                          add_sets=add_sets, add_reps=add_reps, add_weight=add_weight)
+                print(f"Updated {updated} workout exercises.")
+            except ValueError as e:
+                session.rollback()
+                print(f"Error: {e}")
+            input("Press Enter to continue...")
+        
+        elif choice == "7":
+            log_workout_screen(session, action)
+            input("Press Enter to continue...")
+        
+        elif choice == "0":
+            session.close()
+            return
+        else:
+            input("Invalid choice. Press Enter to continue...")
+
+def log_workout_screen(session, action=None):
+    """Log a whole workout, saving it in one transaction at the end. Every entry
+    is journalled as it is typed, so an interrupted workout can be resumed. The
+    lookups and the save are timed under action."""
+    from models import User, Exercise
+    from workout_session import WorkoutSession, pending
+    timed = (lambda: span(action)) if action else nullcontext
+    drafts = pending()
+    log = None
+    if drafts:
+        print("\nUnsaved workouts:")
+        for i, draft in enumerate(drafts, 1):
+            print(f"{i}. {draft.name} (user {draft.user_id}, started {draft.date:%Y-%m-%d %H:%M}, "
+                  f"{len(draft.entries)} exercises)")
+        value = safe_input("Enter a number to resume it, or leave blank to start a new workout: ",
+                           lambda x: x == "" or (x.isdigit() and 1 <= int(x) <= len(drafts)),
+                           f"Enter a number from 1 to {len(drafts)}")
+        if value:
+            log = drafts[int(value) - 1]
+    if log is None:
+        try:
+            name = safe_input("Enter workout name: ", lambda x: len(x) >= 2, "Name must be at least 2 characters")
+            print("\nAvailable Users:")
+            if not show_paged(User.rows(session, ("id", "name"), PAGE_SIZE),
+                              lambda user: f"ID: {user.id}, Name: {user.name}", action=action):
+                print("No users found. Please create a user first.")
+                return
+            user_id = int(safe_input("Enter user ID: ", lambda x: x.isdigit(), "ID must be a number"))
+            with timed():
+                user = User.find_by_id(session, user_id)
+            if not user:
+                print("User not found.")
+                return
+            log = WorkoutSession(name, user_id)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+    
+    # The exercise list is shown once for the whole workout
+    with timed():
+        exercises = {exercise.id: exercise.name for exercise in Exercise.get_all(session)}
+    if not exercises:
+        print("No exercises found. Please create an exercise first.")
+        log.discard()
+        return
+    print("\nAvailable Exercises:")
+    for id, name in exercises.items():
+        print(f"ID: {id}, Name: {name}")
+    for row in log.entries:
+        print(f"Logged: {exercises.get(row['exercise_id'], row['exercise_id'])}, "
+              f"Sets: {row['sets']}, Reps: {row['reps']}, Weight: {row['weight']}")
+    
+    print("\nEnter an exercise ID to log it, 'u' to undo the last one, 's' to save the workout,")
+    print("or 'q' to stop and keep the workout for later.")
+    while True:
+        command = input("Exercise ID: ").strip().lower()
+        try:
+            if command == "s":
+                with timed():
+                    workout = log.commit(session)
+                print(f"Workout saved with ID {workout.id} and {len(log.entries)} exercises.")
+                return
+            if command == "q":
+                print("Workout kept; choose Log Workout Session again to resume it.")
+                return
+            if command == "u":
+                log.remove(-1)
+                print("Removed the last exercise.")
+                continue
+            if not command.isdigit() or int(command) not in exercises:
+                print("Exercise not found.")
+                continue
+            sets = int(safe_input("Enter number of sets: ", lambda x: x.isdigit(), "Sets must be a number"))
+            reps = int(safe_input("Enter number of reps: ", lambda x: x.isdigit(), "Reps must be a number"))
+            weight = float(safe_input("Enter weight (kg): ", lambda x: x.replace('.', '', 1).isdigit(), "Weight must be a number"))
+            log.add(int(command), sets, reps, weight)
+        except ValueError as e:
+            print(f"Error: {e}")
+
+def ask_optional_id(prompt):
+    value = safe_input(prompt, lambda x: x == "" or x.isdigit(), "ID must be a number")
+    return int(value) if value else None
+
+def ask_change(prompt, convert):
+    """Read a new value, or a +N/-N change to the current one, as (value, delta)"""
+    while True:
+        value = input(prompt).strip()
+        try:
+            if not value:
+                return None, None
+            if value[0] in "+-":
+                return None, convert(value)
+            return convert(value), None
+        except ValueError:
+            print("Enter a number, +N or -N.")
+
+def ask_optional_user_id():
+    return ask_optional_id("Enter user ID (blank for all users): ")
+
+def reports_menu():
+    import reports
+    from models import Session, Exercise, Workout, PersonalRecord, WeeklyRollup
+    session = Session()
+    
+    options = [
+        "Total Volume by User",
+        "Volume by User and Exercise",
+        "Weekly Volume by User",
+        "Personal Records for User",
+        "Weekly Activity for User",
+        "Recent Workouts for User"
+    ]
+    
+    while True:
+        choice = print_menu("REPORTS", options)
+        # Only the work a choice does is timed, not the prompts it waits at
+        action = menu_action("REPORTS", options, choice)
+        
+        if choice == "1":
+            user_id = ask_optional_user_id()
+            with span(action):
+                rows = reports.volume_by_user(session, user_id)
+            print("\nTotal Volume by User:")
+            if not show_paged(rows, lambda row: f"User: {row.name} (ID {row.user_id}), Volume: {row.volume:,.1f} kg",
+                              action=action):
+                print("No volume recorded.")
+            input("Press Enter to continue...")
+        
+        elif choice == "2":
+            user_id = ask_optional_user_id()
+            with span(action):
+                rows = reports.volume_by_exercise(session, user_id)
+            print("\nVolume by User and Exercise:")
+            if not show_paged(rows, lambda row: f"User ID: {row.user_id}, Exercise: {row.exercise_name}, Volume: {row.volume:,.1f} kg",
+                              action=action):
+                print("No volume recorded.")
+            input("Press Enter to continue...")
+        
+        elif choice == "3":
+            user_id = ask_optional_user_id()
+            with span(action):
+                rows = reports.volume_by_week(session, user_id)
+            print("\nWeekly Volume by User:")
+            if not show_paged(rows, lambda row: f"User ID: {row.user_id}, Week: {row.week}, Volume: {row.volume:,.1f} kg",
+                              action=action):
+                print("No volume recorded.")
+            input("Press Enter to continue...")
+        
+        elif choice == "4":
+            id = int(safe_input("Enter user ID: ", lambda x: x.isdigit(), "ID must be a number"))
+            with span(action):
+                records = PersonalRecord.for_user(session, id)
+                names = {exercise.id: exercise.name for exercise in Exercise.get_all(session)}
+            print("\nPersonal Records:")
+            if not show_paged(records, lambda pr: f"Exercise: {names.get(pr.exercise_id)}, Best Weight: {pr.best_weight} kg, "
+                                                  f"Estimated 1RM: {pr.best_e1rm:.1f} kg", action=action):
+                print("No personal records yet.")
+            input("Press Enter to continue...")
+        
+        elif choice == "5":
+            id = int(safe_input("Enter user ID: ", lambda x: x.isdigit(), "ID must be a number"))
+            print("\nWeekly Activity:")
+            with span(action):
+                rows = WeeklyRollup.for_user(session, id)
+            if not show_paged(rows, lambda r: f"Week: {r.period}, Workouts: {r.workouts}, Volume: {r.volume:,.1f} kg",
+                              action=action):
+                print("No workouts recorded.")
+            input("Press Enter to continue...")
+        
+        elif choice == "6":
+            id = int(safe_input("Enter user ID: ", lambda x: x.isdigit(), "ID must be a number"))
+            days = int(safe_input("Show the last how many days? ", lambda x: x.isdigit(), "Days must be a number"))
+            end = datetime.now()
+            with span(action):
+                workouts = Workout.between(session, id, end - timedelta(days=days), end)
+            print(f"\nWorkouts in the last {days} days:")
+            if not show_paged(workouts, lambda w: f"ID: {w.id}, Name: {w.name}, Date: {w.date}", action=action):
+                print("No workouts in that period.")
+            input("Press Enter to continue...")
+        
         elif choice == "0":
             session.close()
             return
@@ -0,0 +1,370 @@
+"""Non-interactive command-line interface.
+
+    python app.py users list --format jsonl
+    python app.py workouts add "Leg Day" --user-id 3
+    python app.py workout-exercises add --workout-id 7 --exercise-id 2 --sets 5 --reps 5 --weight 100
+    python app.py run commands.txt
+    python app.py sync other-gym.db --both
+
+``run`` executes one command per line of a file (or ``-`` for stdin) in the same
+process and database session. List commands stream rows as they are read.
+SQLAlchemy and the models are only imported once a command runs, so --help and
+usage errors start quickly.
+"""
+import argparse
+import csv
+import json
+import os
+import shlex
+import sys
+from functools import lru_cache
+from itertools import islice
+
+from instrumentation import span
+
+FORMATS = ("text", "jsonl", "csv")
+LIST_BATCH_SIZE = 1000
+
+def user_row(user):
+    return {"id": user.id, "name": user.name, "email": user.email}
+
+def exercise_row(exercise):
+    return {"id": exercise.id, "name": exercise.name, "description": exercise.description}
+
+def workout_row(workout):
+    return {"id": workout.id, "name": workout.name, "date": workout.date, "user_id": workout.user_id}
+
+def workout_exercise_row(we):
+    return {"id": we.id, "workout_id": we.workout_id, "exercise_id": we.exercise_id,
+            "sets": we.sets, "reps": we.reps, "weight": we.weight}
+
+# Models by class name, looked up in models.py when a command runs
+RESOURCES = {
+    "users": ("User", user_row),
+    "exercises": ("Exercise", exercise_row),
+    "workouts": ("Workout", workout_row),
+    "workout-exercises": ("WorkoutExercise", workout_exercise_row),
+}
+
+def model_for(resource):
+    """The model class behind a resource name, e.g. Workout for workouts"""
+    import models
+    return getattr(models, RESOURCES[resource][0])
+
+# The columns each *_row function reads, so listings can select just those with
+# Model.rows() instead of loading ORM instances
+ROW_COLUMNS = {
+    "users": ("id", "name", "email"),
+    "exercises": ("id", "name", "description"),
+    "workouts": ("id", "name", "date", "user_id"),
+    "workout-exercises": ("id", "workout_id", "exercise_id", "sets", "reps", "weight"),
+}
+
+class CommandError(Exception):
+    pass
+
+class RowWriter:
+    """Write row dicts to a stream as text, JSON lines or CSV, one line at a time"""
+    def __init__(self, out, format="text"):
+        self.out = out
+        self.format = format
+        self._csv = csv.writer(out) if format == "csv" else None
+        self._header_written = False
+
+    def write(self, row):
+        if self.format == "jsonl":
+            self.out.write(json.dumps(row, default=str) + "\n")
+        elif self.format == "csv":
+            if not self._header_written:
+                self._csv.writerow(row.keys())
+                self._header_written = True
+            self._csv.writerow(row.values())
+        else:
+            self.out.write(", ".join(f"{key}: {value}" for key, value in row.items()) + "\n")
+
+    def write_all(self, rows):
+        count = 0
+        for row in rows:
+            self.write(row)
+            count += 1
+        return count
+
+def _find(session, resource, id):
+    instance = model_for(resource).find_by_id(session, id)
+    if instance is None:
+        raise CommandError(f"{resource} {id} not found")
+    return instance
+
+def cmd_list(session, args, out):
+    to_row = RESOURCES[args.resource][1]
+    rows = model_for(args.resource).rows(session, ROW_COLUMNS[args.resource], args.batch_size, args.after_id)
+    if args.limit is not None:
+        rows = islice(rows, args.limit)
+    RowWriter(out, args.format).write_all(map(to_row, rows))
+
+def cmd_get(session, args, out):
+    _, to_row = RESOURCES[args.resource]
+    RowWriter(out, args.format).write(to_row(_find(session, args.resource, args.id)))
+
+def cmd_delete(session, args, out):
+    ids = set(args.ids)
+    deleted = model_for(args.resource).delete_many(session, ids)
+    if deleted < len(ids):
+        raise CommandError(f"{len(ids) - deleted} of {len(ids)} {args.resource} not found")
+
+def cmd_add_user(session, args, out):
+    from models import User
+    RowWriter(out, args.format).write(user_row(User.create(session, args.name, args.email)))
+
+def cmd_user_by_email(session, args, out):
+    from models import User
+    user = User.find_by_email(session, args.email)
+    if user is None:
+        raise CommandError(f"no user with email {args.email}")
+    RowWriter(out, args.format).write(user_row(user))
+
+def cmd_add_exercise(session, args, out):
+    from models import Exercise
+    exercise = Exercise.create(session, args.name, args.description)
+    RowWriter(out, args.format).write(exercise_row(exercise))
+
+def cmd_add_workout(session, args, out):
+    from models import Workout
+    _find(session, "users", args.user_id)
+    RowWriter(out, args.format).write(workout_row(Workout.create(session, args.name, args.user_id)))
+
+def cmd_add_workout_exercise(session, args, out):
+    from models import WorkoutExercise
+    _find(session, "workouts", args.workout_id)
+    _find(session, "exercises", args.exercise_id)
+    we = WorkoutExercise.create(session, args.workout_id, args.exercise_id, args.sets, args.reps, args.weight)
+    RowWriter(out, args.format).write(workout_exercise_row(we))
+
+def cmd_update_workout_exercise(session, args, out):
+    we = _find(session, "workout-exercises", args.id)
+    try:
+        if args.sets is not None:
+            we.set_sets(args.sets)
+        if args.reps is not None:
+            we.set_reps(args.reps)
+        if args.weight is not None:
+            we.set_weight(args.weight)
+    except ValueError:
+        session.rollback()
+        raise
+    session.commit()
+    RowWriter(out, args.format).write(workout_exercise_row(we))
+
+def cmd_update_many_workout_exercises(session, args, out):
+    from models import WorkoutExercise
+    try:
+        updated = WorkoutExercise.update_many(
+            session, workout_id=args.workout_id, user_id=args.user_id, exercise_id=args.exercise_id,
+            sets=args.sets, reps=args.reps, weight=args.weight,
+            add_sets=args.add_sets, add_reps=args.add_reps, add_weight=args.add_weight)
+    except ValueError:
+        session.rollback()
+        raise
+    RowWriter(out, args.format).write({"updated": updated})
+
+def cmd_user_workouts(session, args, out):
+    user = _find(session, "users", args.id)
+    RowWriter(out, args.format).write_all(map(workout_row, user.workouts))
+
+def cmd_workout_exercises(session, args, out):
+    workout = _find(session, "workouts", args.id)
+    RowWriter(out, args.format).write_all(map(workout_exercise_row, workout.workout_exercises))
+
+def cmd_import(session, args, out):
+    from importer import import_workout_exercises
+    from models import BULK_BATCH_SIZE
+    count = import_workout_exercises(session, args.path, args.batch_size or BULK_BATCH_SIZE)
+    RowWriter(out, args.format).write({"imported": count})
+
+def cmd_export(session, args, out):
+    from export import export_snapshot
+    manifest = export_snapshot(session.get_bind(), args.directory, args.tables, args.chunk_size)
+    RowWriter(out, args.format).write_all({"table": name, "rows": table["rows"]}
+                                          for name, table in manifest["tables"].items())
+
+def cmd_sync(session, args, out):
+    from sync import open_database, pull
+    if not os.path.exists(args.peer):
+        raise CommandError(f"{args.peer}: no such database")
+    peer = open_database(args.peer)
+    try:
+        writer = RowWriter(out, args.format)
+        writer.write(dict(direction="pulled", **pull(session, peer, args.batch_size)._asdict()))
+        if args.both:
+            writer.write(dict(direction="pushed", **pull(peer, session, args.batch_size)._asdict()))
+    finally:
+        peer.close()
+        peer.get_bind().dispose()
+
+def cmd_run(session, args, out):
+    stream = sys.stdin if args.path == "-" else open(args.path)
+    try:
+        for number, line in enumerate(stream, 1):
+            argv = shlex.split(line, comments=True)
+            if not argv:
+                continue
+            if argv[0] == "run":
+                raise CommandError(f"line {number}: run cannot be nested")
+            status = execute(session, argv, out)
+            if status and not args.keep_going:
+                raise CommandError(f"line {number}: command failed, stopping")
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def _add_format(parser):
+    parser.add_argument("--format", choices=FORMATS, default="text")
+
+@lru_cache(maxsize=None)
+def build_parser():
+    parser = argparse.ArgumentParser(prog="fitness", description="Fitness tracker batch interface")
+    resources = parser.add_subparsers(dest="resource", required=True)
+
+    for resource in RESOURCES:
+        commands = resources.add_parser(resource).add_subparsers(dest="command", required=True)
+
+        list_parser = commands.add_parser("list", help=f"stream all {resource}")
+        _add_format(list_parser)
+        list_parser.add_argument("--after-id", type=int, default=0, help="start after this id")
+        list_parser.add_argument("--limit", type=int)
+        list_parser.add_argument("--batch-size", type=int, default=LIST_BATCH_SIZE)
+        list_parser.set_defaults(handler=cmd_list)
+
+        get_parser = commands.add_parser("get", help="show one row by id")
+        _add_format(get_parser)
+        get_parser.add_argument("id", type=int)
+        get_parser.set_defaults(handler=cmd_get)
+
+        delete_parser = commands.add_parser("delete", help="delete rows by id, with everything they own")
+        delete_parser.add_argument("ids", type=int, nargs="+", metavar="id")
+        delete_parser.set_defaults(handler=cmd_delete)
+
+        add_parser = commands.add_parser("add", help="create a row")
+        _add_format(add_parser)
+        if resource == "users":
+            add_parser.add_argument("name")
+            add_parser.add_argument("email")
+            add_parser.set_defaults(handler=cmd_add_user)
+        elif resource == "exercises":
+            add_parser.add_argument("name")
+            add_parser.add_argument("--description")
+            add_parser.set_defaults(handler=cmd_add_exercise)
+        elif resource == "workouts":
+            add_parser.add_argument("name")
+            add_parser.add_argument("--user-id", type=int, required=True)
+            add_parser.set_defaults(handler=cmd_add_workout)
+        else:
+            add_parser.add_argument("--workout-id", type=int, required=True)
+            add_parser.add_argument("--exercise-id", type=int, required=True)
+            add_parser.add_argument("--sets", type=int, default=3)
+            add_parser.add_argument("--reps", type=int, default=10)
+            add_parser.add_argument("--weight", type=float, default=0.0)
+            add_parser.set_defaults(handler=cmd_add_workout_exercise)
+
+        if resource == "users":
+            workouts_parser = commands.add_parser("workouts", help="list a user's workouts")
+            _add_format(workouts_parser)
+            workouts_parser.add_argument("id", type=int)
+            workouts_parser.set_defaults(handler=cmd_user_workouts)
+
+            by_email_parser = commands.add_parser("by-email", help="show the user with an email, ignoring case")
+            _add_format(by_email_parser)
+            by_email_parser.add_argument("email")
+            by_email_parser.set_defaults(handler=cmd_user_by_email)
+        elif resource == "workouts":
+            exercises_parser = commands.add_parser("exercises", help="list a workout's exercises")
+            _add_format(exercises_parser)
+            exercises_parser.add_argument("id", type=int)
+            exercises_parser.set_defaults(handler=cmd_workout_exercises)
+        elif resource == "workout-exercises":
+            update_parser = commands.add_parser("update", help="change sets, reps or weight")
+            _add_format(update_parser)
+            update_parser.add_argument("id", type=int)
+            update_parser.add_argument("--sets", type=int)
+            update_parser.add_argument("--reps", type=int)
+            update_parser.add_argument("--weight", type=float)
+            update_parser.set_defaults(handler=cmd_update_workout_exercise)
+
+            update_many_parser = commands.add_parser(
+                "update-many", help="set or shift sets, reps or weight on every match with one statement")
+            _add_format(update_many_parser)
+            for name in ("workout", "user", "exercise"):
+                update_many_parser.add_argument(f"--{name}-id", type=int, help=f"only this {name}'s rows")
+            update_many_parser.add_argument("--sets", type=int)
+            update_many_parser.add_argument("--reps", type=int)
+            update_many_parser.add_argument("--weight", type=float)
+            update_many_parser.add_argument("--add-sets", type=int, metavar="N", help="change sets by N")
+            update_many_parser.add_argument("--add-reps", type=int, metavar="N", help="change reps by N")
+            update_many_parser.add_argument("--add-weight", type=float, metavar="KG", help="change weight by KG")
+            update_many_parser.set_defaults(handler=cmd_update_many_workout_exercises)
+
+    import_parser = resources.add_parser("import", help="bulk-import workout exercises from CSV or JSONL")
+    _add_format(import_parser)
+    import_parser.add_argument("path")
+    import_parser.add_argument("--batch-size", type=int, help="rows per transaction (default: models.BULK_BATCH_SIZE)")
+    import_parser.set_defaults(handler=cmd_import)
+
+    export_parser = resources.add_parser("export", help="write a columnar snapshot (.npy per column) to a directory")
+    _add_format(export_parser)
+    export_parser.add_argument("directory")
+    export_parser.add_argument("--tables", nargs="+", help="tables to export (default: all)")
+    export_parser.add_argument("--chunk-size", type=int, default=50000, help="rows read per fetch")
+    export_parser.set_defaults(handler=cmd_export)
+
+    sync_parser = resources.add_parser("sync", help="copy in another database's new changes")
+    _add_format(sync_parser)
+    sync_parser.add_argument("peer", help="path of the other database file")
+    sync_parser.add_argument("--both", action="store_true", help="also send it this database's changes")
+    sync_parser.add_argument("--batch-size", type=int, default=10000, help="changes applied per transaction")
+    sync_parser.set_defaults(handler=cmd_sync)
+
+    run_parser = resources.add_parser("run", help="run one command per line from a file ('-' for stdin)")
+    run_parser.add_argument("path")
+    run_parser.add_argument("--keep-going", action="store_true", help="continue after a failed command")
+    run_parser.set_defaults(handler=cmd_run)
+    return parser
+
+def _parse(argv):
+    try:
+        return build_parser().parse_args(argv), 0
+    except SystemExit as e:
+        return None, e.code
+
+def _span_name(args):
+    return " ".join(["command", args.resource] + ([args.command] if getattr(args, "command", None) else []))
+
+def _dispatch(session, args, out):
+    from sqlalchemy.exc import SQLAlchemyError
+    try:
+        with span(_span_name(args)):
+            args.handler(session, args, out)
+    except (CommandError, ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except SQLAlchemyError as e:
+        session.rollback()
+        print(f"Error: {e.__class__.__name__}: {e.orig if getattr(e, 'orig', None) else e}", file=sys.stderr)
+        return 1
+    return 0
+
+def execute(session, argv, out=sys.stdout):
+    """Run one command in an existing session, returning its exit status"""
+    args, status = _parse(argv)
+    return status if args is None else _dispatch(session, args, out)
+
+def main(argv=None):
+    # Parse before opening a session so --help and usage errors never touch the database
+    args, status = _parse(sys.argv[1:] if argv is None else argv)
+    if args is None:
+        return status
+    from models import Session
+    session = Session()
+    try:
+        return _dispatch(session, args, sys.stdout)
+    finally:
+        session.close()
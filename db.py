@@ -0,0 +1,91 @@
+"""Engine configuration for the fitness tracker database.
+
+Settings come from DEFAULT_SETTINGS, then the JSON file named by the
+FITNESS_DB_CONFIG environment variable, then individual FITNESS_DB_<KEY>
+variables (e.g. FITNESS_DB_URL, FITNESS_DB_SYNCHRONOUS), then any overrides
+passed to make_engine. A pragma set to None is left at SQLite's default.
+"""
+import json
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool, StaticPool
+
+DEFAULT_SETTINGS = {
+    "url": "sqlite:///fitness.db",
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+    "pool_size": 5,
+    "max_overflow": 10,
+}
+
+PRAGMAS = ("journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store", "busy_timeout")
+
+def _coerce(key, value):
+    default = DEFAULT_SETTINGS[key]
+    if value.lower() in ("", "none", "default"):
+        return None
+    return int(value) if isinstance(default, int) else value
+
+def load_settings(overrides=None):
+    """Return the effective engine settings"""
+    settings = dict(DEFAULT_SETTINGS)
+    path = os.environ.get("FITNESS_DB_CONFIG")
+    if path:
+        with open(path) as f:
+            settings.update(json.load(f))
+    for key in DEFAULT_SETTINGS:
+        value = os.environ.get(f"FITNESS_DB_{key.upper()}")
+        if value is not None:
+            settings[key] = _coerce(key, value)
+    settings.update(overrides or {})
+    unknown = set(settings) - set(DEFAULT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown database settings: {', '.join(sorted(unknown))}")
+    return settings
+
+def _is_memory(url):
+    return url in ("sqlite://", "sqlite:///:memory:")
+
+def make_engine(overrides=None):
+    """Create an engine whose connections are tuned with the configured pragmas"""
+    settings = load_settings(overrides)
+    url = settings["url"]
+    if _is_memory(url):
+        # Every checkout must see the same in-memory database
+        engine = create_engine(url, poolclass=StaticPool, connect_args={"check_same_thread": False})
+    else:
+        engine = create_engine(url, poolclass=QueuePool,
+                               pool_size=settings["pool_size"], max_overflow=settings["max_overflow"])
+
+    _set_pragmas_on_connect(engine, settings)
+    return engine
+
+def make_async_engine(overrides=None):
+    """Create an asyncio engine on the aiosqlite driver with the same settings and pragmas.
+
+    Needs the optional aiosqlite package (``pip install sqlalchemy[asyncio] aiosqlite``).
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+    settings = load_settings(overrides)
+    url = settings["url"]
+    async_url = url.replace("sqlite://", "sqlite+aiosqlite://", 1) if url.startswith("sqlite://") else url
+    if _is_memory(url):
+        engine = create_async_engine(async_url, poolclass=StaticPool)
+    else:
+        engine = create_async_engine(async_url, pool_size=settings["pool_size"], max_overflow=settings["max_overflow"])
+    _set_pragmas_on_connect(engine.sync_engine, settings)
+    return engine
+
+def _set_pragmas_on_connect(engine, settings):
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in PRAGMAS:
+            if settings[pragma] is not None:
+                cursor.execute(f"PRAGMA {pragma} = {settings[pragma]}")
+        cursor.close()
@@ -0,0 +1,195 @@
+"""Columnar snapshots of the database for offline analysis.
+
+export_snapshot streams each table through a Core select in chunks and writes
+one file per column, never building ORM instances:
+
+    <table>.<column>.npy           integers (int64), floats (float64) or dates (datetime64[us])
+    <table>.<column>.valid.npy     bool mask, only for columns that contain NULLs
+    <table>.<column>.offsets.npy   for text: int64 start offsets (rows + 1 of them)
+    <table>.<column>.utf8          for text: the UTF-8 bytes, back to back
+    manifest.json                  row counts and column kinds
+
+The .npy files are plain NumPy format, so numpy.load(path, mmap_mode="r") reads
+them directly; load_table does the same with the standard library, memory-mapping
+every file instead of reading it.
+"""
+import json
+import mmap
+import os
+import sys
+from array import array
+from ast import literal_eval
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from sqlalchemy import DateTime, Float, Integer, String, func, select
+
+from models import Base
+
+FORMAT_VERSION = 1
+DEFAULT_CHUNK_SIZE = 50000
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+_ORDER = "<" if sys.byteorder == "little" else ">"
+
+KINDS = {
+    "int": ("q", f"{_ORDER}i8"),
+    "float": ("d", f"{_ORDER}f8"),
+    "datetime": ("q", f"{_ORDER}M8[us]"),
+}
+
+def column_kind(column):
+    if isinstance(column.type, Integer):
+        return "int"
+    if isinstance(column.type, Float):
+        return "float"
+    if isinstance(column.type, DateTime):
+        return "datetime"
+    if isinstance(column.type, String):
+        return "string"
+    raise ValueError(f"Cannot export column {column} of type {column.type}")
+
+def _npy_header(descr, rows):
+    header = repr({"descr": descr, "fortran_order": False, "shape": (rows,)})
+    # Magic (6) + version (2) + length (2) + header + newline, padded to 64 bytes
+    padding = -(10 + len(header) + 1) % 64
+    header = (header + " " * padding + "\n").encode("latin1")
+    return b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header
+
+class _ColumnWriter:
+    def __init__(self, directory, table, column, rows):
+        self.kind = column_kind(column)
+        self.prefix = os.path.join(directory, f"{table}.{column.name}")
+        self.nullable = column.nullable and not column.primary_key
+        self.has_nulls = False
+        self.rows = rows
+        if self.kind == "string":
+            self.values = open(self.prefix + ".offsets.npy", "wb")
+            self.values.write(_npy_header(f"{_ORDER}i8", rows + 1))
+            array("q", [0]).tofile(self.values)
+            self.blob = open(self.prefix + ".utf8", "wb")
+            self.offset = 0
+        else:
+            self.values = open(self.prefix + ".npy", "wb")
+            self.values.write(_npy_header(KINDS[self.kind][1], rows))
+        if self.nullable:
+            self.mask = open(self.prefix + ".valid.npy", "wb")
+            self.mask.write(_npy_header("|b1", rows))
+
+    def write(self, values):
+        if self.nullable:
+            valid = bytes(value is not None for value in values)
+            self.mask.write(valid)
+            if not all(valid):
+                self.has_nulls = True
+        if self.kind == "string":
+            encoded = [value.encode() if value is not None else b"" for value in values]
+            self.blob.write(b"".join(encoded))
+            array("q", accumulate(map(len, encoded), initial=self.offset))[1:].tofile(self.values)
+            self.offset += sum(map(len, encoded))
+            return
+        if self.kind == "datetime":
+            values = [(value - EPOCH) // MICROSECOND if value is not None else 0 for value in values]
+        elif self.has_nulls:
+            values = [0 if value is None else value for value in values]
+        array(KINDS[self.kind][0], values).tofile(self.values)
+
+    def close(self):
+        self.values.close()
+        if self.kind == "string":
+            self.blob.close()
+        if self.nullable:
+            self.mask.close()
+            if not self.has_nulls:
+                os.remove(self.prefix + ".valid.npy")
+        return {"kind": self.kind, "nulls": self.has_nulls}
+
+def export_snapshot(engine, directory, tables=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write tables (default: every mapped table) to directory and return the manifest"""
+    os.makedirs(directory, exist_ok=True)
+    names = tables or sorted(Base.metadata.tables)
+    manifest = {"format": FORMAT_VERSION, "created": datetime.now().isoformat(timespec="seconds"), "tables": {}}
+    # One read transaction so the row counts and the rows come from the same snapshot
+    with engine.connect() as connection, connection.begin():
+        for name in names:
+            if name not in Base.metadata.tables:
+                raise ValueError(f"Unknown table: {name}")
+            table = Base.metadata.tables[name]
+            rows = connection.execute(select(func.count()).select_from(table)).scalar()
+            writers = [_ColumnWriter(directory, name, column, rows) for column in table.columns]
+            written = 0
+            result = connection.execution_options(yield_per=chunk_size).execute(
+                select(table).order_by(*table.primary_key.columns))
+            for chunk in result.partitions():
+                for writer, values in zip(writers, zip(*chunk)):
+                    writer.write(values)
+                written += len(chunk)
+            if written != rows:
+                raise RuntimeError(f"{name}: counted {rows} rows but read {written}")
+            manifest["tables"][name] = {"rows": rows,
+                                        "columns": {column.name: writer.close()
+                                                    for column, writer in zip(table.columns, writers)}}
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def _map(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b"")
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+def _map_npy(path, code):
+    data = _map(path)
+    if bytes(data[:6]) != b"\x93NUMPY":
+        raise ValueError(f"{path} is not a .npy file")
+    length = int.from_bytes(data[8:10], "little")
+    header = literal_eval(bytes(data[10:10 + length]).decode("latin1"))
+    if header["descr"][0] not in ("|", _ORDER):
+        raise ValueError(f"{path} was written with the other byte order")
+    return data[10 + length:].cast(code)
+
+class ColumnView:
+    """A memory-mapped column; indexing gives Python values, with None for NULL"""
+    def __init__(self, kind, values, valid=None, blob=None):
+        self.kind = kind
+        self.values = values
+        self.valid = valid
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.values) - 1 if self.kind == "string" else len(self.values)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if self.valid is not None and not self.valid[i]:
+            return None
+        if self.kind == "string":
+            return bytes(self.blob[self.values[i]:self.values[i + 1]]).decode()
+        if self.kind == "datetime":
+            return EPOCH + self.values[i] * MICROSECOND
+        return self.values[i]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+def read_manifest(directory):
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format')}")
+    return manifest
+
+def load_table(directory, table, manifest=None):
+    """Map every column of an exported table, returning {column name: ColumnView}"""
+    manifest = manifest or read_manifest(directory)
+    columns = {}
+    for name, info in manifest["tables"][table]["columns"].items():
+        prefix = os.path.join(directory, f"{table}.{name}")
+        valid = _map_npy(prefix + ".valid.npy", "B") if info["nulls"] else None
+        if info["kind"] == "string":
+            columns[name] = ColumnView("string", _map_npy(prefix + ".offsets.npy", "q"), valid, _map(prefix + ".utf8"))
+        else:
+            columns[name] = ColumnView(info["kind"], _map_npy(prefix + ".npy", KINDS[info["kind"]][0]), valid)
+    return columns
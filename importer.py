@@ -0,0 +1,61 @@
+import csv
+import json
+import os
+
+from models import WorkoutExercise, BULK_BATCH_SIZE
+
+COLUMN_TYPES = {
+    "workout_id": int,
+    "exercise_id": int,
+    "sets": int,
+    "reps": int,
+    "weight": float,
+}
+
+def _convert(pairs, line):
+    """Convert (column, raw value) pairs, dropping blanks so model defaults apply"""
+    row = {}
+    for column, value in pairs:
+        if value is None or value == "":
+            continue
+        try:
+            row[column] = COLUMN_TYPES[column](value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Line {line}: invalid {column} {value!r}")
+    return row
+
+def read_csv(path):
+    """Stream rows from a CSV file with a header line"""
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        positions = [(index, column) for index, column in enumerate(header) if column in COLUMN_TYPES]
+        for record in reader:
+            if record:
+                yield _convert([(column, record[index] if index < len(record) else None)
+                                for index, column in positions], reader.line_num)
+
+def read_jsonl(path):
+    """Stream rows from a file with one JSON object per line"""
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if line.strip():
+                record = json.loads(line)
+                yield _convert([(column, record.get(column)) for column in COLUMN_TYPES], number)
+
+READERS = {
+    ".csv": read_csv,
+    ".jsonl": read_jsonl,
+    ".ndjson": read_jsonl,
+}
+
+def read_rows(path):
+    """Pick a reader from the file extension"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise ValueError(f"Unsupported import format: {extension or path}")
+    return READERS[extension](path)
+
+def import_workout_exercises(session, path, batch_size=BULK_BATCH_SIZE):
+    """Import workout exercises from a CSV or JSONL file, returning the number of rows inserted"""
+    return WorkoutExercise.bulk_create(session, read_rows(path), batch_size)
@@ -0,0 +1,204 @@
+"""Opt-in timing of SQL statements, model operations and CLI menu actions.
+
+Set FITNESS_INSTRUMENT=table (or json) and call enable_from_env(), as app.py and
+seed.py do, to collect stats and print them to stderr on exit.
+FITNESS_INSTRUMENT_FILE writes them to a file instead.
+FITNESS_SLOW_QUERY_MS (default 100) sets the threshold above which a statement
+is logged to the "fitness.sql" logger. When instrumentation is off, span() costs
+one attribute check, nothing is hooked into SQLAlchemy and SQLAlchemy is not
+even imported.
+"""
+import atexit
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is open-ended
+BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+MODEL_OPERATIONS = ("create", "get_all", "find_by_id", "delete", "delete_many", "update_many")
+
+slow_query_logger = logging.getLogger("fitness.sql")
+
+class OperationStats:
+    """Call count, timings and a latency histogram for one named operation"""
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, seconds, queries=0, sql_time=0.0):
+        self.calls += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.queries += queries
+        self.sql_time += sql_time
+        ms = seconds * 1000
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "total_ms": round(self.total * 1000, 3),
+            "mean_ms": round(self.total * 1000 / self.calls, 3) if self.calls else 0.0,
+            "max_ms": round(self.max * 1000, 3),
+            "queries": self.queries,
+            "sql_ms": round(self.sql_time * 1000, 3),
+            "histogram": dict(zip(_bucket_labels(), self.buckets)),
+        }
+
+def _bucket_labels():
+    return [f"<={bound}ms" for bound in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+
+class Instrumentation:
+    def __init__(self, slow_query_ms=100.0):
+        self.enabled = False
+        self.slow_query_ms = slow_query_ms
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._wrapped = []
+
+    def record(self, name, seconds, queries=0, sql_time=0.0):
+        with self._lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = OperationStats()
+            stats.add(seconds, queries, sql_time)
+
+    def _spans(self):
+        spans = getattr(self._local, "spans", None)
+        if spans is None:
+            spans = self._local.spans = []
+        return spans
+
+    @contextmanager
+    def span(self, name):
+        """Time the enclosed block under name, counting the SQL it runs"""
+        if not self.enabled:
+            yield
+            return
+        spans = self._spans()
+        counters = [0, 0.0]
+        spans.append(counters)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            spans.pop()
+            self.record(name, elapsed, counters[0], counters[1])
+            # Nested spans charge their queries to the enclosing spans as well
+            for outer in spans:
+                outer[0] += counters[0]
+                outer[1] += counters[1]
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("fitness_query_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["fitness_query_start"].pop()
+        self.record(f"sql.{statement.split(None, 1)[0].lower()}", elapsed, 1, elapsed)
+        spans = self._spans()
+        if spans:
+            spans[-1][0] += 1
+            spans[-1][1] += elapsed
+        if elapsed * 1000 >= self.slow_query_ms:
+            slow_query_logger.warning("slow query (%.1f ms): %s %r", elapsed * 1000, " ".join(statement.split()),
+                                      parameters if not executemany else f"<{len(parameters)} rows>")
+
+    def _wrap_operations(self):
+        import models
+        for cls in (models.User, models.Exercise, models.Workout, models.WorkoutExercise):
+            for operation in MODEL_OPERATIONS:
+                original = cls.__dict__.get(operation)
+                if original is None:
+                    continue
+                self._wrapped.append((cls, operation, original))
+                setattr(cls, operation, classmethod(self._timed(f"{cls.__name__}.{operation}", original.__func__)))
+
+    def _timed(self, name, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def enable(self):
+        if self.enabled:
+            return
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+        self._wrap_operations()
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled:
+            return
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        event.remove(Engine, "before_cursor_execute", self._before_cursor_execute)
+        event.remove(Engine, "after_cursor_execute", self._after_cursor_execute)
+        for cls, operation, original in reversed(self._wrapped):
+            setattr(cls, operation, original)
+        self._wrapped.clear()
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+    def as_dict(self):
+        with self._lock:
+            return {name: self.stats[name].as_dict() for name in sorted(self.stats)}
+
+    def format_table(self):
+        rows = self.as_dict()
+        labels = _bucket_labels()
+        header = (f"{'operation':<44} {'calls':>8} {'total ms':>10} {'mean ms':>9} {'max ms':>9} "
+                  f"{'queries':>8} {'sql ms':>10}  " + " ".join(f"{label:>9}" for label in labels))
+        lines = [header, "-" * len(header)]
+        for name, row in rows.items():
+            lines.append(f"{name:<44} {row['calls']:>8} {row['total_ms']:>10.1f} {row['mean_ms']:>9.3f} "
+                         f"{row['max_ms']:>9.3f} {row['queries']:>8} {row['sql_ms']:>10.1f}  "
+                         + " ".join(f"{row['histogram'][label]:>9}" for label in labels))
+        return "\n".join(lines)
+
+    def dump(self, format="table", out=None):
+        text = json.dumps(self.as_dict(), indent=2) if format == "json" else self.format_table()
+        if out is None:
+            print(text, file=sys.stderr)
+        else:
+            with open(out, "w") as f:
+                f.write(text + "\n")
+
+instrumentation = Instrumentation()
+span = instrumentation.span
+
+def enable_from_env():
+    """Turn instrumentation on if FITNESS_INSTRUMENT is set, dumping stats at exit"""
+    format = os.environ.get("FITNESS_INSTRUMENT", "").lower()
+    if format in ("", "0", "off"):
+        return False
+    if format not in ("table", "json"):
+        format = "table"
+    instrumentation.slow_query_ms = float(os.environ.get("FITNESS_SLOW_QUERY_MS", 100))
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.WARNING)
+    instrumentation.enable()
+    atexit.register(instrumentation.dump, format, os.environ.get("FITNESS_INSTRUMENT_FILE"))
+    return True
@@ -0,0 +1,318 @@
+"""Versioned schema migrations for the SQLite database.
+
+The schema version lives in SQLite's ``PRAGMA user_version``. A fresh database
+starts at 0 and runs every migration; an existing fitness.db only runs the ones
+it has not seen yet. Migration 1 creates the tables from the current models, so
+every later migration must be idempotent (it may find its change already there).
+"""
+import weakref
+
+def _create_tables(connection, metadata):
+    metadata.create_all(connection)
+
+def _index_creator(*names):
+    def create_indexes(connection, metadata):
+        indexes = {index.name: index for table in metadata.tables.values() for index in table.indexes}
+        for name in names:
+            indexes[name].create(connection, checkfirst=True)
+    return create_indexes
+
+def _table_creator(name, backfill=None):
+    def create_table(connection, metadata):
+        metadata.tables[name].create(connection, checkfirst=True)
+        if backfill:
+            connection.exec_driver_sql(backfill)
+    return create_table
+
+PERSONAL_RECORDS_BACKFILL = """
+INSERT OR REPLACE INTO personal_records (user_id, exercise_id, best_weight, best_e1rm)
+SELECT w.user_id, we.exercise_id, MAX(we.weight), MAX(we.weight * (1 + we.reps / 30.0))
+FROM workout_exercises we JOIN workouts w ON w.id = we.workout_id
+WHERE w.user_id IS NOT NULL AND we.exercise_id IS NOT NULL AND we.sets > 0 AND we.reps > 0
+GROUP BY w.user_id, we.exercise_id
+"""
+
+def _sql_runner(*statements):
+    def run_sql(connection, metadata):
+        for statement in statements:
+            connection.exec_driver_sql(statement)
+    return run_sql
+
+# Full-text index over exercise names/descriptions and workout names. The rowid
+# encodes the source row as id * 2 + kind (0 exercise, 1 workout) so the triggers
+# update and delete by rowid instead of scanning the index.
+SEARCH_INDEX = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "name, description, tokenize = 'porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS exercises_search_insert AFTER INSERT ON exercises BEGIN "
+    "INSERT INTO search_index (rowid, name, description) VALUES (new.id * 2, new.name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS exercises_search_update AFTER UPDATE OF name, description ON exercises BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 2; "
+    "INSERT INTO search_index (rowid, name, description) VALUES (new.id * 2, new.name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS exercises_search_delete AFTER DELETE ON exercises BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 2; END",
+    "CREATE TRIGGER IF NOT EXISTS workouts_search_insert AFTER INSERT ON workouts BEGIN "
+    "INSERT INTO search_index (rowid, name) VALUES (new.id * 2 + 1, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS workouts_search_update AFTER UPDATE OF name ON workouts BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 2 + 1; "
+    "INSERT INTO search_index (rowid, name) VALUES (new.id * 2 + 1, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS workouts_search_delete AFTER DELETE ON workouts BEGIN "
+    "DELETE FROM search_index WHERE rowid = old.id * 2 + 1; END",
+    # Rebuild from scratch so rerunning the migration cannot duplicate entries
+    "DELETE FROM search_index",
+    "INSERT INTO search_index (rowid, name, description) SELECT id * 2, name, description FROM exercises",
+    "INSERT INTO search_index (rowid, name) SELECT id * 2 + 1, name FROM workouts",
+)
+
+def _rollup_triggers(table, period):
+    """Triggers keeping table's per-(user_id, period) workout count and volume
+    current as workouts are moved or deleted and sets are edited or deleted, where
+    period is an SQL expression over a workout date as {date}"""
+    workout_volume = "(SELECT COALESCE(SUM(sets * reps * weight), 0.0) FROM workout_exercises WHERE workout_id = {id})"
+    workout_column = "(SELECT {column} FROM workouts WHERE id = {id})"
+
+    def add(row, volume):
+        bucket = period.format(date=f"{row}.date")
+        return (f"INSERT INTO {table} (user_id, period, workouts, volume) "
+                f"SELECT {row}.user_id, {bucket}, 1, {volume} WHERE {row}.user_id IS NOT NULL AND {bucket} IS NOT NULL "
+                f"ON CONFLICT (user_id, period) DO UPDATE SET workouts = workouts + 1, volume = volume + excluded.volume;")
+
+    def remove(row, volume):
+        where = f"user_id = {row}.user_id AND period = {period.format(date=f'{row}.date')}"
+        return (f"UPDATE {table} SET workouts = workouts - 1, volume = volume - {volume} WHERE {where}; "
+                f"DELETE FROM {table} WHERE {where} AND workouts <= 0;")
+
+    def change_volume(workout_id, sign, amount):
+        user_id = workout_column.format(column="user_id", id=workout_id)
+        bucket = period.format(date=workout_column.format(column="date", id=workout_id))
+        return f"UPDATE {table} SET volume = volume {sign} {amount} WHERE user_id = {user_id} AND period = {bucket};"
+
+    old_set, new_set = "old.sets * old.reps * old.weight", "new.sets * new.reps * new.weight"
+    return (
+        # A workout deleted before its sets (raw SQL) takes their volume with it;
+        # the ORM cascade and delete_many remove the sets first
+        f"CREATE TRIGGER IF NOT EXISTS {table}_workout_delete AFTER DELETE ON workouts BEGIN "
+        f"{remove('old', workout_volume.format(id='old.id'))} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_workout_move AFTER UPDATE OF user_id, date ON workouts BEGIN "
+        f"{remove('old', workout_volume.format(id='old.id'))} {add('new', workout_volume.format(id='new.id'))} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_set_delete AFTER DELETE ON workout_exercises BEGIN "
+        f"{change_volume('old.workout_id', '-', old_set)} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_set_update AFTER UPDATE OF workout_id, sets, reps, weight "
+        f"ON workout_exercises BEGIN "
+        f"{change_volume('old.workout_id', '-', old_set)} {change_volume('new.workout_id', '+', new_set)} END",
+    )
+
+def _rollup_backfill(table, period):
+    bucket = period.format(date="w.date")
+    return (
+        f"DELETE FROM {table}",
+        f"INSERT INTO {table} (user_id, period, workouts, volume) "
+        f"SELECT w.user_id, {bucket}, COUNT(*), COALESCE(SUM(v.volume), 0.0) FROM workouts w "
+        f"LEFT JOIN (SELECT workout_id, SUM(sets * reps * weight) AS volume FROM workout_exercises "
+        f"GROUP BY workout_id) v ON v.workout_id = w.id "
+        f"WHERE w.user_id IS NOT NULL AND w.date IS NOT NULL GROUP BY w.user_id, {bucket}",
+    )
+
+DAILY_PERIOD = "date({date})"
+WEEKLY_PERIOD = "strftime('%Y-%W', {date})"
+
+def _create_rollups(connection, metadata):
+    for table, period in (("daily_rollups", DAILY_PERIOD), ("weekly_rollups", WEEKLY_PERIOD)):
+        metadata.tables[table].create(connection, checkfirst=True)
+        for statement in (*_rollup_triggers(table, period), *_rollup_backfill(table, period)):
+            connection.exec_driver_sql(statement)
+
+def _exercise_rollup_statements():
+    user_of = "(SELECT user_id FROM workouts WHERE id = {id})"
+
+    def add(row):
+        user_id = user_of.format(id=f"{row}.workout_id")
+        return ("INSERT INTO exercise_rollups (user_id, exercise_id, entries, volume) "
+                f"SELECT {user_id}, {row}.exercise_id, 1, {row}.sets * {row}.reps * {row}.weight "
+                f"WHERE {user_id} IS NOT NULL AND {row}.exercise_id IS NOT NULL "
+                "ON CONFLICT (user_id, exercise_id) DO UPDATE SET entries = entries + 1, "
+                "volume = volume + excluded.volume;")
+
+    def remove(row):
+        where = f"user_id = {user_of.format(id=f'{row}.workout_id')} AND exercise_id = {row}.exercise_id"
+        return (f"UPDATE exercise_rollups SET entries = entries - 1, "
+                f"volume = volume - {row}.sets * {row}.reps * {row}.weight WHERE {where}; "
+                f"DELETE FROM exercise_rollups WHERE {where} AND entries <= 0;")
+
+    # Moves and raw-SQL deletes of a workout carry all of its sets at once
+    workout_sets = ("FROM workout_exercises WHERE workout_id = {id} "
+                    "AND exercise_id = exercise_rollups.exercise_id")
+    take_workout = ("UPDATE exercise_rollups SET entries = entries - (SELECT COUNT(*) {sets}), "
+                    "volume = volume - (SELECT COALESCE(SUM(sets * reps * weight), 0.0) {sets}) "
+                    "WHERE user_id = old.user_id AND exercise_id IN "
+                    "(SELECT exercise_id FROM workout_exercises WHERE workout_id = {id}); "
+                    "DELETE FROM exercise_rollups WHERE user_id = old.user_id AND entries <= 0;")
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS exercise_rollups_set_delete AFTER DELETE ON workout_exercises BEGIN "
+        f"{remove('old')} END",
+        "CREATE TRIGGER IF NOT EXISTS exercise_rollups_set_update AFTER UPDATE OF workout_id, exercise_id, "
+        f"sets, reps, weight ON workout_exercises BEGIN {remove('old')} {add('new')} END",
+        "CREATE TRIGGER IF NOT EXISTS exercise_rollups_workout_delete AFTER DELETE ON workouts BEGIN "
+        f"{take_workout.format(id='old.id', sets=workout_sets.format(id='old.id'))} END",
+        "CREATE TRIGGER IF NOT EXISTS exercise_rollups_workout_move AFTER UPDATE OF user_id ON workouts BEGIN "
+        f"{take_workout.format(id='new.id', sets=workout_sets.format(id='new.id'))} "
+        "INSERT INTO exercise_rollups (user_id, exercise_id, entries, volume) "
+        "SELECT new.user_id, exercise_id, COUNT(*), COALESCE(SUM(sets * reps * weight), 0.0) "
+        "FROM workout_exercises WHERE workout_id = new.id AND new.user_id IS NOT NULL AND exercise_id IS NOT NULL "
+        "GROUP BY exercise_id ON CONFLICT (user_id, exercise_id) DO UPDATE SET "
+        "entries = entries + excluded.entries, volume = volume + excluded.volume; END",
+        "DELETE FROM exercise_rollups",
+        "INSERT INTO exercise_rollups (user_id, exercise_id, entries, volume) "
+        "SELECT w.user_id, we.exercise_id, COUNT(*), COALESCE(SUM(we.sets * we.reps * we.weight), 0.0) "
+        "FROM workout_exercises we JOIN workouts w ON w.id = we.workout_id "
+        "WHERE w.user_id IS NOT NULL AND we.exercise_id IS NOT NULL GROUP BY w.user_id, we.exercise_id",
+    )
+
+def _create_exercise_rollups(connection, metadata):
+    metadata.tables["exercise_rollups"].create(connection, checkfirst=True)
+    for statement in _exercise_rollup_statements():
+        connection.exec_driver_sql(statement)
+
+# Smoothed trend of each (user, exercise)'s estimated one-rep max, by Holt's
+# linear smoothing: models.TrainingStats.fold_sets folds every new set into level
+# and trend as it is inserted. Editing or deleting a set cannot be undone that
+# way, so these triggers only mark the pair stale and models.TrainingStats
+# recomputes stale pairs from their history.
+LEVEL_SMOOTHING = 0.5
+TREND_SMOOTHING = 0.3
+
+def _training_stats_statements():
+    mark_stale = ("UPDATE training_stats SET stale = 1 WHERE exercise_id = {row}.exercise_id "
+                  "AND user_id = (SELECT user_id FROM workouts WHERE id = {row}.workout_id);")
+    return (
+        "CREATE TRIGGER IF NOT EXISTS training_stats_set_delete AFTER DELETE ON workout_exercises BEGIN "
+        f"{mark_stale.format(row='old')} END",
+        "CREATE TRIGGER IF NOT EXISTS training_stats_set_update AFTER UPDATE OF workout_id, exercise_id, "
+        "sets, reps, weight ON workout_exercises BEGIN "
+        f"{mark_stale.format(row='old')} {mark_stale.format(row='new')} END",
+        "CREATE TRIGGER IF NOT EXISTS training_stats_workout_move AFTER UPDATE OF user_id ON workouts BEGIN "
+        "UPDATE training_stats SET stale = 1 WHERE user_id IN (old.user_id, new.user_id) "
+        "AND exercise_id IN (SELECT exercise_id FROM workout_exercises WHERE workout_id = new.id); END",
+        # Existing history is only marked stale here; each user's pairs are
+        # computed the first time their stats are read
+        "INSERT OR IGNORE INTO training_stats (user_id, exercise_id, observations, level, trend, "
+        "last_sets, last_reps, last_weight, stale) "
+        "SELECT DISTINCT w.user_id, we.exercise_id, 0, 0.0, 0.0, 0, 0, 0.0, 1 "
+        "FROM workout_exercises we JOIN workouts w ON w.id = we.workout_id "
+        "WHERE w.user_id IS NOT NULL AND we.exercise_id IS NOT NULL AND we.sets > 0 AND we.reps > 0",
+    )
+
+def _create_training_stats(connection, metadata):
+    metadata.tables["training_stats"].create(connection, checkfirst=True)
+    for statement in _training_stats_statements():
+        connection.exec_driver_sql(statement)
+
+# Rows are logged as JSON objects of their non-key columns, as models._log_rows does
+LOGGED_TABLES = ("users", "exercises", "workouts", "workout_exercises")
+
+def _create_change_log(connection, metadata):
+    for name in ("change_log", "sync_state", "sync_ids"):
+        metadata.tables[name].create(connection, checkfirst=True)
+    connection.exec_driver_sql(
+        "INSERT INTO sync_state (database_id, is_self, pulled_seq, applied_seq) "
+        "SELECT lower(hex(randomblob(16))), 1, 0, 0 WHERE NOT EXISTS (SELECT 1 FROM sync_state WHERE is_self = 1)")
+    # Rows from before the log existed enter it as inserts, parents first, so a
+    # peer syncing from seq 0 gets everything
+    if connection.exec_driver_sql("SELECT COUNT(*) FROM change_log").scalar():
+        return
+    for name in LOGGED_TABLES:
+        columns = [column.name for column in metadata.tables[name].columns
+                   if not column.primary_key and column.computed is None]
+        data = ", ".join(f"'{column}', {column}" for column in columns)
+        connection.exec_driver_sql(
+            f"INSERT INTO change_log (table_name, row_id, op, data) "
+            f"SELECT '{name}', id, 'insert', json_object({data}) FROM {name} ORDER BY id")
+
+def _add_email_key(connection, metadata):
+    columns = [row[1] for row in connection.exec_driver_sql("PRAGMA table_xinfo(users)")]
+    if "email_key" not in columns:
+        connection.exec_driver_sql(
+            "ALTER TABLE users ADD COLUMN email_key VARCHAR GENERATED ALWAYS AS (lower(trim(email))) VIRTUAL")
+    clashes = connection.exec_driver_sql(
+        "SELECT group_concat(email, ', ') FROM users GROUP BY email_key HAVING COUNT(*) > 1").scalars().all()
+    if clashes:
+        raise RuntimeError("Users share an email in different letter cases; merge or change them before "
+                           f"upgrading: {'; '.join(clashes)}")
+    _index_creator("ix_users_email_key")(connection, metadata)
+
+# Inserted workouts and sets are counted into the rollups and training stats a
+# batch at a time by models.py instead; an insert trigger on workout_exercises,
+# even one that does nothing, slows bulk inserts by about a third
+ROW_INSERT_TRIGGERS = ("daily_rollups_workout_insert", "weekly_rollups_workout_insert",
+                       "daily_rollups_set_insert", "weekly_rollups_set_insert", "training_stats_set_insert",
+                       "exercise_rollups_set_insert")
+
+def _drop_row_insert_triggers(connection, metadata):
+    for name in ROW_INSERT_TRIGGERS:
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+
+MIGRATIONS = [
+    _create_tables,
+    _index_creator(
+        "ix_workouts_user_id_date",
+        "ix_workouts_date",
+        "ix_workout_exercises_workout_id",
+        "ix_workout_exercises_exercise_id_workout_id",
+    ),
+    _table_creator("personal_records", PERSONAL_RECORDS_BACKFILL),
+    _sql_runner(*SEARCH_INDEX),
+    _create_rollups,
+    _create_training_stats,
+    _create_change_log,
+    _add_email_key,
+    _create_exercise_rollups,
+    _drop_row_insert_triggers,
+]
+
+LATEST_VERSION = len(MIGRATIONS)
+
+# Engines already checked in this process
+_current_engines = weakref.WeakSet()
+
+def get_version(connection):
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+def upgrade(engine, metadata):
+    """Apply any pending migrations in one transaction and return the new version"""
+    if engine in _current_engines:
+        return LATEST_VERSION
+    # An up-to-date database only costs one PRAGMA read, outside any transaction
+    with engine.connect() as connection:
+        version = get_version(connection)
+    if version < LATEST_VERSION:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            version = migrate_atomically(connection, metadata)
+    _current_engines.add(engine)
+    return max(version, LATEST_VERSION)
+
+def migrate_atomically(connection, metadata):
+    """Run migrate() inside an explicit BEGIN ... COMMIT on a connection in
+    AUTOCOMMIT mode, returning the version it started from.
+
+    pysqlite only opens a transaction before DML and commits any DDL run
+    outside one straight away, so under engine.begin() a failing migration would
+    leave the tables and triggers of the migrations before it behind. BEGIN
+    IMMEDIATE also takes the write lock before the version is read, so two
+    processes cannot both run the same migrations."""
+    connection.exec_driver_sql("BEGIN IMMEDIATE")
+    try:
+        version = migrate(connection, metadata)
+    except BaseException:
+        connection.exec_driver_sql("ROLLBACK")
+        raise
+    connection.exec_driver_sql("COMMIT")
+    return version
+
+def migrate(connection, metadata):
+    """Apply pending migrations on a connection that is already in a transaction,
+    returning the version it started from"""
+    version = get_version(connection)
+    for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+        migration(connection, metadata)
+        connection.exec_driver_sql(f"PRAGMA user_version = {number}")
+    return version
@@ -1,11 +1,402 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, DateTime
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy import event, inspect, bindparam, insert, select, update, delete, tuple_, func, literal, Column, Computed, Integer, String, Float, ForeignKey, DateTime, Index
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session as BaseSession, declarative_base, relationship, sessionmaker, joinedload, selectinload, object_session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from collections import namedtuple
 from datetime import datetime
+from functools import lru_cache
+from itertools import groupby, islice
+import json
+import os
+import string
+
+from cache import LRUCache
+from db import make_engine
+from migrations import upgrade, LEVEL_SMOOTHING, LOGGED_TABLES, TREND_SMOOTHING
 
 Base = declarative_base()
-engine = create_engine('sqlite:///fitness.db')
-Session = sessionmaker(bind=engine)
+
+# The engine is created, and the schema version checked, on first use rather
+# than at import so that commands which never touch the database start fast
+_engine = None
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        engine = make_engine()
+        upgrade(engine, Base.metadata)
+        _engine = engine
+    return _engine
+
+class _LazySessionmaker(sessionmaker):
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None and "bind" not in local_kw:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
+
+Session = _LazySessionmaker()
+
+def __getattr__(name):
+    # Keep `from models import engine` working without creating it at import
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+BULK_BATCH_SIZE = 10000
+
+# Read-through cache for the exercise catalog and user lookups, keyed by
+# (engine id, model name, id or "all"). Entries hold plain column snapshots
+# so they can be handed to any session.
+catalog_cache = LRUCache(maxsize=int(os.environ.get("FITNESS_CACHE_SIZE", 1024)),
+                         ttl=float(os.environ.get("FITNESS_CACHE_TTL", 300)))
+
+LOADER_STRATEGIES = {
+    "joined": joinedload,
+    "selectin": selectinload,
+}
+
+def _loader(cls, path, strategy):
+    # Chain loaders along a dotted relationship path, e.g. "workout_exercises.exercise"
+    option = None
+    for name in path.split("."):
+        attr = getattr(cls, name)
+        option = strategy(attr) if option is None else getattr(option, strategy.__name__)(attr)
+        cls = attr.property.mapper.class_
+    return option
+
+def _query(session, cls, load=None, relationships=None):
+    # Eagerly load cls.eager_relationships (or the given relationship paths) so
+    # that list views don't issue one lazy SELECT per row per relationship.
+    query = session.query(cls)
+    if load is None:
+        return query
+    if load not in LOADER_STRATEGIES:
+        raise ValueError(f"Unknown loading strategy: {load}")
+    if relationships is None:
+        relationships = cls.eager_relationships
+    return query.options(*[_loader(cls, path, LOADER_STRATEGIES[load]) for path in relationships])
+
+def _iter_keyset(session, cls, batch_size=100, after_id=0, load=None, relationships=None):
+    # Keyset pagination on the primary key: each batch is an indexed range scan
+    # starting after the last id seen, so memory stays bounded by batch_size.
+    if batch_size < 1:
+        raise ValueError("Batch size must be at least 1")
+    while True:
+        batch = (_query(session, cls, load, relationships)
+                 .filter(cls.id > after_id)
+                 .order_by(cls.id)
+                 .limit(batch_size)
+                 .all())
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        after_id = batch[-1].id
+
+@lru_cache(maxsize=None)
+def _row_type(name, fields):
+    return namedtuple(name, fields)
+
+def _iter_rows(session, cls, columns=None, batch_size=1000, after_id=0, ids=None):
+    # Like _iter_keyset, but selects plain columns into read-only named tuples
+    # instead of building ORM instances. cls.row_fields() maps each column name
+    # to (expression, joins it needs); joined tables are outer joined once.
+    if batch_size < 1:
+        raise ValueError("Batch size must be at least 1")
+    fields = cls.row_fields()
+    names = tuple(columns or fields)
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise ValueError(f"Unknown {cls.__name__} columns: {', '.join(unknown)}")
+    Row = _row_type(f"{cls.__name__}Row", names)
+    query = select(*(fields[name][0] for name in names), cls.id).select_from(cls)
+    joined = []
+    for name in names:
+        for target, onclause in fields[name][1]:
+            if target not in joined:
+                query = query.outerjoin(target, onclause)
+                joined.append(target)
+    if ids is not None:
+        query = query.where(cls.id.in_(ids))
+    while True:
+        batch = session.execute(query.where(cls.id > after_id).order_by(cls.id).limit(batch_size)).all()
+        for row in batch:
+            yield Row._make(row[:-1])
+        if len(batch) < batch_size:
+            return
+        after_id = batch[-1][-1]
+
+def _cache_key(session, cls, what):
+    return (id(session.get_bind()), cls.__name__, what)
+
+def _snapshot(instance):
+    return {attr.key: getattr(instance, attr.key) for attr in instance.__mapper__.column_attrs}
+
+def _from_snapshot(session, cls, values):
+    # Reuse the session's own instance if it has one, otherwise attach a clean
+    # copy built from the snapshot without going back to the database
+    key = cls.__mapper__.identity_key_from_primary_key([values["id"]])
+    existing = session.identity_map.get(key)
+    if existing is not None:
+        return existing
+    instance = cls.__mapper__.class_manager.new_instance()
+    for name, value in values.items():
+        set_committed_value(instance, name, value)
+    make_transient_to_detached(instance)
+    session.add(instance)
+    return instance
+
+def _cached_find(session, cls, id):
+    key = _cache_key(session, cls, id)
+    values = catalog_cache.get(key)
+    if values is not None:
+        return _from_snapshot(session, cls, values)
+    instance = session.query(cls).filter_by(id=id).first()
+    if instance is not None:
+        catalog_cache.put(key, _snapshot(instance))
+    return instance
+
+def _cached_all(session, cls):
+    key = _cache_key(session, cls, "all")
+    snapshots = catalog_cache.get(key)
+    if snapshots is not None:
+        return [_from_snapshot(session, cls, values) for values in snapshots]
+    instances = session.query(cls).all()
+    catalog_cache.put(key, [_snapshot(instance) for instance in instances])
+    return instances
+
+def invalidate_cache(cls):
+    catalog_cache.invalidate(lambda key: key[1] == cls.__name__)
+
+def _delete_where(session, cls, condition):
+    # Set-based delete; "fetch" marks any loaded instances of the deleted rows as
+    # deleted in the session instead of leaving them stale in the identity map
+    statement = delete(cls).where(condition).execution_options(synchronize_session="fetch")
+    return session.execute(statement).rowcount
+
+def exercise_pairs(session, *conditions):
+    """The distinct (user_id, exercise_id) pairs of the workout exercises matching conditions"""
+    query = (select(Workout.user_id, WorkoutExercise.exercise_id).distinct()
+             .join(Workout, WorkoutExercise.workout_id == Workout.id)
+             .where(*conditions))
+    return [tuple(row) for row in session.execute(query)]
+
+@event.listens_for(BaseSession, "after_flush")
+def _note_cached_changes(session, flush_context):
+    changed = {type(instance).__name__ for instance in (*session.new, *session.dirty, *session.deleted)}
+    session.info.setdefault("cache_dirty", set()).update(changed)
+
+@event.listens_for(BaseSession, "after_commit")
+def _invalidate_cached_changes(session):
+    # Edits made through attributes or setters reach other sessions once committed
+    changed = session.info.pop("cache_dirty", None)
+    if changed:
+        catalog_cache.invalidate(lambda key: key[1] in changed)
+
+# Change log for sync.py. Every insert, update and delete of a LOGGED_TABLES row
+# made through a Session is appended to change_log in the same transaction:
+# unit-of-work changes after each flush, set-based statements (bulk inserts,
+# update_many, delete_many) as they execute. The derived tables (records,
+# rollups, training stats, search) are not logged; each database keeps its own.
+# A session with info["sync_replay"] set is applying a peer's changes, which
+# sync.py logs itself.
+
+def _logged_columns(table):
+    # Generated columns (users.email_key) follow from the others, so they are left out
+    return [column for column in table.columns if not column.primary_key and column.computed is None]
+
+def _row_json(instance):
+    return json.dumps({column.key: getattr(instance, column.key)
+                       for column in _logged_columns(instance.__table__)}, default=str)
+
+def _lock_for_write(connection):
+    # pysqlite only opens a transaction at the first write, so a max(id) or id list
+    # read before it can miss rows another connection commits before our statement
+    # runs. Take the write lock first so the read and the write see the same rows.
+    if not connection.connection.driver_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+def _log_rows(table, op, condition):
+    # INSERT ... SELECT that logs the matching rows of table, building their JSON in SQL
+    data = func.json_object(*[part for column in _logged_columns(table) for part in (column.name, column)])
+    return insert(Change.__table__).from_select(
+        ["table_name", "row_id", "op", "data"],
+        select(literal(table.name), table.c.id, literal(op), data).where(condition).order_by(table.c.id))
+
+@event.listens_for(BaseSession, "after_flush")
+def _log_flushed_changes(session, flush_context):
+    if session.info.get("sync_replay"):
+        return
+    changes = []
+    for op, instances in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for instance in instances:
+            table = getattr(instance, "__table__", None)
+            if table is None or table.name not in LOGGED_TABLES:
+                continue
+            if op == "update" and not session.is_modified(instance, include_collections=False):
+                continue
+            changes.append({"table_name": table.name, "row_id": instance.id, "op": op,
+                            "data": None if op == "delete" else _row_json(instance)})
+    if changes:
+        # Parents are inserted before their children and deleted after them
+        def position(change):
+            depth = LOGGED_TABLES.index(change["table_name"])
+            return (("insert", "update", "delete").index(change["op"]),
+                    -depth if change["op"] == "delete" else depth, change["row_id"])
+        changes.sort(key=position)
+        session.connection().execute(insert(Change.__table__), changes)
+
+@event.listens_for(BaseSession, "do_orm_execute")
+def _log_statement_changes(state):
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return None
+    table = state.statement.table
+    replay = state.session.info.get("sync_replay")
+    if table.name not in LOGGED_TABLES or (replay and not state.is_insert):
+        return None
+    connection = state.session.connection()
+    _lock_for_write(connection)
+    if state.is_insert:
+        # Inserts take ids above the current maximum
+        last_id = connection.execute(select(func.max(table.c.id))).scalar() or 0
+        result = state.invoke_statement()
+        if not replay:
+            connection.execute(_log_rows(table, "insert", table.c.id > last_id))
+        model = FOLDED_MODELS.get(table.name)
+        if model is not None:
+            model.fold_inserted(state.session, last_id + 1, connection.execute(select(func.max(table.c.id))).scalar())
+        return result
+    query = select(table.c.id)
+    if state.statement.whereclause is not None:
+        query = query.where(state.statement.whereclause)
+    ids = connection.execute(query.order_by(table.c.id)).scalars().all()
+    result = state.invoke_statement()
+    for chunk in batched(ids, 500):
+        if state.is_update:
+            connection.execute(_log_rows(table, "update", table.c.id.in_(chunk)))
+        else:
+            connection.execute(insert(Change.__table__),
+                               [{"table_name": table.name, "row_id": id, "op": "delete"} for id in chunk])
+    return result
+
+# Inserted workouts and workout exercises reach the rollups and training stats a
+# batch at a time rather than through per-row insert triggers: any trigger on
+# workout_exercises costs bulk inserts about a third of their speed. Rows added
+# through the ORM are folded in after each flush, and rows inserted by a Core
+# statement through a Session as it executes (FOLDED_MODELS); Workout.insert_rows
+# and WorkoutExercise.insert_rows handle their own batches. Edits and deletes are
+# still handled by the triggers of migrations 5, 6 and 9. Rows inserted outside
+# a Session (the sqlite3 shell) are missed until the tables are rebuilt.
+
+def _inserted(model):
+    # Rows of model with ids from :first_id to :last_id, just inserted
+    return model.id.between(bindparam("first_id"), bindparam("last_id"))
+
+def _insert_logged(session, table, values, raw=False):
+    """Insert row dicts into a LOGGED_TABLES table with one executemany, logging
+    them for sync, and return the (first, last) ids they took. raw skips
+    SQLAlchemy's parameter processing, which costs more than the insert itself;
+    only for rows of plain numbers and strings."""
+    connection = session.connection()
+    _lock_for_write(connection)
+    first_id = (connection.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+    if raw:
+        columns = list(values[0])
+        connection.exec_driver_sql(f"INSERT INTO {table.name} ({', '.join(columns)}) "
+                                   f"VALUES ({', '.join(':' + column for column in columns)})", values)
+    else:
+        connection.execute(insert(table), values)
+    if not session.info.get("sync_replay"):
+        connection.execute(_log_rows(table, "insert", table.c.id >= first_id))
+    return first_id, connection.execute(select(func.max(table.c.id))).scalar()
+
+def _id_runs(ids):
+    # Consecutive ids as [first, last] ranges; a flush usually inserts one run
+    runs = []
+    for id in sorted(ids):
+        if runs and id == runs[-1][1] + 1:
+            runs[-1][1] = id
+        else:
+            runs.append([id, id])
+    return runs
+
+@event.listens_for(BaseSession, "after_flush")
+def _fold_flushed_rows(session, flush_context):
+    # Workouts first: add_sets only updates the periods their workouts created
+    for first_id, last_id in _id_runs(instance.id for instance in session.new if isinstance(instance, Workout)):
+        for rollup in (DailyRollup, WeeklyRollup):
+            rollup.add_workouts(session, first_id, last_id)
+    for first_id, last_id in _id_runs(instance.id for instance in session.new if isinstance(instance, WorkoutExercise)):
+        PersonalRecord.add_sets(session, first_id, last_id)
+        for rollup in (DailyRollup, WeeklyRollup, ExerciseRollup):
+            rollup.add_sets(session, first_id, last_id)
+        TrainingStats.fold_sets(session, first_id, last_id)
+
+def _moved(instance, *keys):
+    return any(inspect(instance).attrs[key].history.has_changes() for key in keys)
+
+def _pairs_of(session, set_ids, workout_ids):
+    return {pair for column, ids in ((WorkoutExercise.id, set_ids), (WorkoutExercise.workout_id, workout_ids))
+            for chunk in batched(ids, 500) for pair in exercise_pairs(session, column.in_(chunk))}
+
+@event.listens_for(BaseSession, "before_flush")
+def _note_moved_rows(session, flush_context, instances):
+    # The setters keep the records current as sets, reps and weight change. A set
+    # moved to another workout or exercise, or a workout moved to another user,
+    # takes its lifts from one (user, exercise) pair to another: note the pairs the
+    # rows are in before the flush, and recompute them with the new ones after it
+    set_ids = [instance.id for instance in session.dirty if isinstance(instance, WorkoutExercise)
+               and _moved(instance, "workout_id", "exercise_id", "workout", "exercise")]
+    workout_ids = [instance.id for instance in session.dirty if isinstance(instance, Workout)
+                   and _moved(instance, "user_id", "user")]
+    session.info["moved_rows"] = (set_ids, workout_ids, _pairs_of(session, set_ids, workout_ids))
+
+@event.listens_for(BaseSession, "after_flush")
+def _refresh_moved_records(session, flush_context):
+    set_ids, workout_ids, pairs = session.info.pop("moved_rows", ((), (), set()))
+    if set_ids or workout_ids:
+        PersonalRecord.refresh_pairs(session, pairs | _pairs_of(session, set_ids, workout_ids))
+
+def batched(iterable, size):
+    """Yield lists of up to size items from iterable, for insert batches and IN (...) chunks"""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+class DuplicateEmailError(ValueError):
+    """Another user already has the email, compared ignoring letter case"""
+
+# What SQLite's lower(trim(email)) gives, which users.email_key stores: trim()
+# strips spaces only and lower() folds ASCII letters only
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+def normalize_email(email):
+    """The form emails are compared in, so Ann@Example.com and ann@example.com match"""
+    return email.strip(" ").translate(_ASCII_LOWER)
+
+def validate_name(name):
+    if not name or len(name) < 2:
+        raise ValueError("Name must be at least 2 characters")
+    return name
+
+def validate_email(email):
+    if not email or '@' not in email:
+        raise ValueError("Invalid email format")
+    return email
+
+def validate_sets(sets):
+    if sets < 0:
+        raise ValueError("Sets cannot be negative")
+    return sets
+
+def validate_reps(reps):
+    if reps < 0:
+        raise ValueError("Reps cannot be negative")
+    return reps
+
+def validate_weight(weight):
+    if weight < 0:
+        raise ValueError("Weight cannot be negative")
+    return weight
 
 class User(Base):
     __tablename__ = 'users'
@@ -13,47 +404,150 @@ class User(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
     email = Column(String, unique=True, nullable=False)
+    # Generated by SQLite from email, so every write path keeps it current
+    email_key = Column(String, Computed("lower(trim(email))"))
+    
+    __table_args__ = (
+        Index('ix_users_email_key', 'email_key', unique=True),
+    )
     
     # Relationships
     workouts = relationship("Workout", back_populates="user", cascade="all, delete-orphan")
+    eager_relationships = ("workouts",)
     
     def __init__(self, name, email):
         self.set_name(name)
         self.set_email(email)
     
     def set_name(self, name):
-        if not name or len(name) < 2:
-            raise ValueError("Name must be at least 2 characters")
-        self.name = name
+        self.name = validate_name(name)
     
     def set_email(self, email):
-        if not email or '@' not in email:
-            raise ValueError("Invalid email format")
-        self.email = email
+        self.email = validate_email(email)
+    
+    @staticmethod
+    def validated_row(row):
+        """Return an insertable dict for a mapping of column values, applying the setter checks"""
+        return {"name": validate_name(row["name"]), "email": validate_email(row["email"])}
     
     @classmethod
     def create(cls, session, name, email):
+        """Add a user, raising ValueError if another user has the email in any letter case"""
         user = cls(name=name, email=email)
+        if cls.find_by_email(session, email) is not None:
+            raise DuplicateEmailError(f"A user with email {email} already exists")
         session.add(user)
-        session.commit()
+        try:
+            session.commit()
+        except IntegrityError as e:
+            # Another writer took the email since the check
+            session.rollback()
+            raise DuplicateEmailError(f"A user with email {email} already exists") from e
         return user
     
     @classmethod
-    def get_all(cls, session):
-        return session.query(cls).all()
+    def get_or_create(cls, session, name, email):
+        """The user with email (in any letter case), created with name if there is
+        none, and whether it was created"""
+        user = cls.find_by_email(session, email)
+        if user is not None:
+            return user, False
+        try:
+            return cls.create(session, name, email), True
+        except DuplicateEmailError:
+            user = cls.find_by_email(session, email)
+            if user is None:
+                raise
+            return user, False
     
     @classmethod
-    def find_by_id(cls, session, id):
-        return session.query(cls).filter_by(id=id).first()
+    def bulk_create(cls, session, rows, batch_size=BULK_BATCH_SIZE):
+        """Insert many users with one executemany and one commit per batch, returning
+        the row count. Each batch is checked for emails used twice or already taken,
+        with one query, before anything in it is written."""
+        statement = insert(cls.__table__)
+        total = 0
+        for batch in batched(rows, batch_size):
+            values = []
+            seen = {}
+            for row in batch:
+                number = total + len(values) + 1
+                try:
+                    value = cls.validated_row(row)
+                except KeyError as e:
+                    raise ValueError(f"Row {number}: missing column {e}") from e
+                except ValueError as e:
+                    raise ValueError(f"Row {number}: {e}") from e
+                key = normalize_email(value["email"])
+                if key in seen:
+                    raise DuplicateEmailError(f"Row {number}: email {value['email']} repeats row {seen[key][0]}")
+                seen[key] = (number, value["email"])
+                values.append(value)
+            taken = cls.ids_by_email(session, seen, chunk_size=len(seen))
+            if taken:
+                number, email = min(seen[key] for key in taken)
+                raise DuplicateEmailError(f"Row {number}: a user with email {email} already exists")
+            session.execute(statement, values)
+            session.commit()
+            total += len(values)
+        invalidate_cache(cls)
+        return total
+    
+    @classmethod
+    def get_all(cls, session, load=None, relationships=None):
+        return _query(session, cls, load, relationships).all()
+    
+    @classmethod
+    def iter_all(cls, session, batch_size=100, after_id=0, load=None, relationships=None):
+        return _iter_keyset(session, cls, batch_size, after_id, load, relationships)
+    
+    @classmethod
+    def row_fields(cls):
+        return {"id": (cls.id, ()), "name": (cls.name, ()), "email": (cls.email, ())}
+    
+    @classmethod
+    def rows(cls, session, columns=None, batch_size=1000, after_id=0, ids=None):
+        return _iter_rows(session, cls, columns, batch_size, after_id, ids)
+    
+    @classmethod
+    def find_by_id(cls, session, id, load=None, relationships=None):
+        if load is None:
+            return _cached_find(session, cls, id)
+        return _query(session, cls, load, relationships).filter_by(id=id).first()
+    
+    @classmethod
+    def find_by_email(cls, session, email):
+        """The user with email in any letter case, looked up through ix_users_email_key"""
+        return session.execute(select(cls).where(cls.email_key == normalize_email(email))).scalar_one_or_none()
+    
+    @classmethod
+    def ids_by_email(cls, session, emails, chunk_size=500):
+        """{normalized email: user id} for the emails that belong to users"""
+        keys = {normalize_email(email) for email in emails}
+        found = {}
+        for chunk in batched(keys, chunk_size):
+            found.update(session.execute(select(cls.email_key, cls.id).where(cls.email_key.in_(chunk))).all())
+        return found
     
     @classmethod
     def delete(cls, session, id):
-        user = cls.find_by_id(session, id)
-        if user:
-            session.delete(user)
-            session.commit()
-            return True
-        return False
+        return cls.delete_many(session, [id]) > 0
+    
+    @classmethod
+    def delete_many(cls, session, ids, chunk_size=500):
+        """Delete users with their workouts, workout exercises and records without
+        loading them, returning how many users were deleted"""
+        deleted = 0
+        for chunk in batched(set(ids), chunk_size):
+            workout_ids = select(Workout.id).where(Workout.user_id.in_(chunk))
+            _delete_where(session, WorkoutExercise, WorkoutExercise.workout_id.in_(workout_ids))
+            _delete_where(session, Workout, Workout.user_id.in_(chunk))
+            _delete_where(session, PersonalRecord, PersonalRecord.user_id.in_(chunk))
+            _delete_where(session, TrainingStats, TrainingStats.user_id.in_(chunk))
+            deleted += _delete_where(session, cls, cls.id.in_(chunk))
+        session.commit()
+        invalidate_cache(cls)
+        return deleted
 
 
 class Exercise(Base):
@@ -65,6 +559,7 @@ class Exercise(Base):
     
     # Relationships
     workout_exercises = relationship("WorkoutExercise", back_populates="exercise", cascade="all, delete-orphan")
+    eager_relationships = ("workout_exercises.workout",)
     
     def __init__(self, name, description=None):
         self.set_name(name)
@@ -83,21 +578,46 @@ class Exercise(Base):
         return exercise
     
     @classmethod
-    def get_all(cls, session):
-        return session.query(cls).all()
+    def get_all(cls, session, load=None, relationships=None):
+        if load is None:
+            return _cached_all(session, cls)
+        return _query(session, cls, load, relationships).all()
+    
+    @classmethod
+    def iter_all(cls, session, batch_size=100, after_id=0, load=None, relationships=None):
+        return _iter_keyset(session, cls, batch_size, after_id, load, relationships)
     
     @classmethod
-    def find_by_id(cls, session, id):
-        return session.query(cls).filter_by(id=id).first()
+    def row_fields(cls):
+        return {"id": (cls.id, ()), "name": (cls.name, ()), "description": (cls.description, ())}
+    
+    @classmethod
+    def rows(cls, session, columns=None, batch_size=1000, after_id=0, ids=None):
+        return _iter_rows(session, cls, columns, batch_size, after_id, ids)
+    
+    @classmethod
+    def find_by_id(cls, session, id, load=None, relationships=None):
+        if load is None:
+            return _cached_find(session, cls, id)
+        return _query(session, cls, load, relationships).filter_by(id=id).first()
     
     @classmethod
     def delete(cls, session, id):
-        exercise = cls.find_by_id(session, id)
-        if exercise:
-            session.delete(exercise)
-            session.commit()
-            return True
-        return False
+        return cls.delete_many(session, [id]) > 0
+    
+    @classmethod
+    def delete_many(cls, session, ids, chunk_size=500):
+        """Delete exercises with every logged set of them and their records,
+        returning how many exercises were deleted"""
+        deleted = 0
+        for chunk in batched(set(ids), chunk_size):
+            _delete_where(session, WorkoutExercise, WorkoutExercise.exercise_id.in_(chunk))
+            _delete_where(session, PersonalRecord, PersonalRecord.exercise_id.in_(chunk))
+            _delete_where(session, TrainingStats, TrainingStats.exercise_id.in_(chunk))
+            deleted += _delete_where(session, cls, cls.id.in_(chunk))
+        session.commit()
+        invalidate_cache(cls)
+        return deleted
 
 
 class Workout(Base):
@@ -108,9 +628,15 @@ class Workout(Base):
     date = Column(DateTime, default=datetime.now)
     user_id = Column(Integer, ForeignKey('users.id'))
     
+    __table_args__ = (
+        Index('ix_workouts_user_id_date', 'user_id', 'date'),
+        Index('ix_workouts_date', 'date'),
+    )
+    
     # Relationships
     user = relationship("User", back_populates="workouts")
     workout_exercises = relationship("WorkoutExercise", back_populates="workout", cascade="all, delete-orphan")
+    eager_relationships = ("user",)
     
     def __init__(self, name, user_id):
         self.set_name(name)
@@ -129,21 +655,67 @@ class Workout(Base):
         return workout
     
     @classmethod
-    def get_all(cls, session):
-        return session.query(cls).all()
+    def insert_rows(cls, session, values):
+        """Insert row dicts, which take ids above the current maximum, with one
+        executemany and count them into the rollups with one statement each. Does
+        not commit."""
+        if not values:
+            return
+        cls.fold_inserted(session, *_insert_logged(session, cls.__table__, values))
+    
+    @classmethod
+    def fold_inserted(cls, session, first_id, last_id):
+        """Count the just inserted workouts with ids first_id to last_id into the rollups"""
+        for rollup in (DailyRollup, WeeklyRollup):
+            rollup.add_workouts(session, first_id, last_id)
+    
+    @classmethod
+    def get_all(cls, session, load=None, relationships=None):
+        return _query(session, cls, load, relationships).all()
     
     @classmethod
-    def find_by_id(cls, session, id):
-        return session.query(cls).filter_by(id=id).first()
+    def iter_all(cls, session, batch_size=100, after_id=0, load=None, relationships=None):
+        return _iter_keyset(session, cls, batch_size, after_id, load, relationships)
+    
+    @classmethod
+    def row_fields(cls):
+        users = ((User, cls.user_id == User.id),)
+        return {"id": (cls.id, ()), "name": (cls.name, ()), "date": (cls.date, ()),
+                "user_id": (cls.user_id, ()), "user_name": (User.name, users)}
+    
+    @classmethod
+    def rows(cls, session, columns=None, batch_size=1000, after_id=0, ids=None):
+        return _iter_rows(session, cls, columns, batch_size, after_id, ids)
+    
+    @classmethod
+    def find_by_id(cls, session, id, load=None, relationships=None):
+        return _query(session, cls, load, relationships).filter_by(id=id).first()
+    
+    @classmethod
+    def between(cls, session, user_id, start, end, load=None, relationships=None):
+        """Workouts dated from start up to but not including end, oldest first;
+        user_id None means every user's"""
+        query = _query(session, cls, load, relationships).filter(cls.date >= start, cls.date < end)
+        if user_id is not None:
+            query = query.filter(cls.user_id == user_id)
+        return query.order_by(cls.date, cls.id).all()
     
     @classmethod
     def delete(cls, session, id):
-        workout = cls.find_by_id(session, id)
-        if workout:
-            session.delete(workout)
-            session.commit()
-            return True
-        return False
+        return cls.delete_many(session, [id]) > 0
+    
+    @classmethod
+    def delete_many(cls, session, ids, chunk_size=500):
+        """Delete workouts with their workout exercises, recomputing the affected
+        personal records, and return how many workouts were deleted"""
+        deleted = 0
+        for chunk in batched(set(ids), chunk_size):
+            pairs = exercise_pairs(session, WorkoutExercise.workout_id.in_(chunk))
+            _delete_where(session, WorkoutExercise, WorkoutExercise.workout_id.in_(chunk))
+            deleted += _delete_where(session, cls, cls.id.in_(chunk))
+            PersonalRecord.refresh_pairs(session, pairs)
+        session.commit()
+        return deleted
 
 
 class WorkoutExercise(Base):
@@ -156,9 +728,15 @@ class WorkoutExercise(Base):
     reps = Column(Integer, default=10)
     weight = Column(Float, default=0.0)
     
+    __table_args__ = (
+        Index('ix_workout_exercises_workout_id', 'workout_id'),
+        Index('ix_workout_exercises_exercise_id_workout_id', 'exercise_id', 'workout_id'),
+    )
+    
     # Relationships
     workout = relationship("Workout", back_populates="workout_exercises")
     exercise = relationship("Exercise", back_populates="workout_exercises")
+    eager_relationships = ("workout", "exercise")
     
     def __init__(self, workout_id, exercise_id, sets=3, reps=10, weight=0.0):
         self.workout_id = workout_id
@@ -168,19 +746,45 @@ class WorkoutExercise(Base):
         self.set_weight(weight)
     
     def set_sets(self, sets):
-        if sets < 0:
-            raise ValueError("Sets cannot be negative")
-        self.sets = sets
+        old_sets = self.sets
+        self.sets = validate_sets(sets)
+        if old_sets is not None and (old_sets > 0) != (self.sets > 0):
+            self._update_record(improved=self.sets > 0)
     
     def set_reps(self, reps):
-        if reps < 0:
-            raise ValueError("Reps cannot be negative")
-        self.reps = reps
+        old_reps = self.reps
+        self.reps = validate_reps(reps)
+        if old_reps is not None and self.reps != old_reps:
+            self._update_record(improved=self.reps > old_reps)
     
     def set_weight(self, weight):
-        if weight < 0:
-            raise ValueError("Weight cannot be negative")
-        self.weight = weight
+        old_weight = self.weight
+        self.weight = validate_weight(weight)
+        if old_weight is not None and self.weight != old_weight:
+            self._update_record(improved=self.weight > old_weight)
+    
+    def _update_record(self, improved):
+        # Keep the personal record for this (user, exercise) current: an
+        # improvement can only raise it, anything else may have lowered it
+        session = object_session(self)
+        if session is None or self.id is None or self.workout is None:
+            return
+        if improved:
+            PersonalRecord.record_lift(session, self.workout.user_id, self.exercise_id, self.sets, self.reps, self.weight)
+        else:
+            session.flush()
+            PersonalRecord.refresh_pairs(session, [(self.workout.user_id, self.exercise_id)])
+    
+    @staticmethod
+    def validated_row(row):
+        """Return an insertable dict for a mapping of column values, applying the setter checks"""
+        return {
+            "workout_id": row["workout_id"],
+            "exercise_id": row["exercise_id"],
+            "sets": validate_sets(row.get("sets", 3)),
+            "reps": validate_reps(row.get("reps", 10)),
+            "weight": validate_weight(row.get("weight", 0.0)),
+        }
     
     @classmethod
     def create(cls, session, workout_id, exercise_id, sets=3, reps=10, weight=0.0):
@@ -191,21 +795,584 @@ class WorkoutExercise(Base):
         return workout_exercise
     
     @classmethod
-    def get_all(cls, session):
-        return session.query(cls).all()
+    def bulk_create(cls, session, rows, batch_size=BULK_BATCH_SIZE):
+        """Insert many rows with one executemany and one commit per batch, returning the row count"""
+        total = 0
+        for batch in batched(rows, batch_size):
+            values = []
+            for row in batch:
+                try:
+                    values.append(cls.validated_row(row))
+                except KeyError as e:
+                    raise ValueError(f"Row {total + len(values) + 1}: missing column {e}") from e
+                except ValueError as e:
+                    raise ValueError(f"Row {total + len(values) + 1}: {e}") from e
+            cls.insert_rows(session, values)
+            session.commit()
+            total += len(values)
+        return total
+    
+    @classmethod
+    def insert_rows(cls, session, values):
+        """Insert validated row dicts, which take ids above the current maximum, with
+        one executemany, then bring the records and rollups up to date and mark the
+        training stats of the affected pairs stale, with one set-based statement
+        each. Does not commit."""
+        if not values:
+            return
+        cls.fold_inserted(session, *_insert_logged(session, cls.__table__, values, raw=True))
     
     @classmethod
-    def find_by_id(cls, session, id):
-        return session.query(cls).filter_by(id=id).first()
+    def fold_inserted(cls, session, first_id, last_id):
+        """Bring the records and rollups up to date with the just inserted workout
+        exercises with ids first_id to last_id, and mark their training stats stale"""
+        PersonalRecord.add_sets(session, first_id, last_id)
+        for rollup in (DailyRollup, WeeklyRollup, ExerciseRollup):
+            rollup.add_sets(session, first_id, last_id)
+        TrainingStats.mark_stale(session, first_id, last_id)
+    
+    @classmethod
+    def update_many(cls, session, workout_id=None, user_id=None, exercise_id=None,
+                    sets=None, reps=None, weight=None, add_sets=None, add_reps=None, add_weight=None):
+        """Set or shift sets, reps and weight on every workout exercise matching the
+        workout, user and exercise filters with one UPDATE, returning the row count"""
+        conditions = []
+        if workout_id is not None:
+            conditions.append(cls.workout_id == workout_id)
+        if user_id is not None:
+            conditions.append(cls.workout_id.in_(select(Workout.id).where(Workout.user_id == user_id)))
+        if exercise_id is not None:
+            conditions.append(cls.exercise_id == exercise_id)
+        if not conditions:
+            raise ValueError("Give a workout, user or exercise to update")
+        changes = {}
+        for column, value, delta, validate in ((cls.sets, sets, add_sets, validate_sets),
+                                               (cls.reps, reps, add_reps, validate_reps),
+                                               (cls.weight, weight, add_weight, validate_weight)):
+            if value is not None and delta is not None:
+                raise ValueError(f"Give either a new {column.key} or a change to it, not both")
+            if value is not None:
+                changes[column.key] = validate(value)
+            elif delta:
+                # Only the smallest current value can be pushed below zero
+                lowest = session.execute(select(func.min(column)).where(*conditions)).scalar()
+                if lowest is not None:
+                    validate(lowest + delta)
+                changes[column.key] = column + delta
+        if not changes:
+            raise ValueError("Nothing to update")
+        pairs = exercise_pairs(session, *conditions)
+        statement = update(cls).where(*conditions).values(changes).execution_options(synchronize_session="fetch")
+        updated = session.execute(statement).rowcount
+        PersonalRecord.refresh_pairs(session, pairs)
+        session.commit()
+        return updated
+    
+    @classmethod
+    def get_all(cls, session, load=None, relationships=None):
+        return _query(session, cls, load, relationships).all()
+    
+    @classmethod
+    def iter_all(cls, session, batch_size=100, after_id=0, load=None, relationships=None):
+        return _iter_keyset(session, cls, batch_size, after_id, load, relationships)
+    
+    @classmethod
+    def row_fields(cls):
+        workouts = ((Workout, cls.workout_id == Workout.id),)
+        exercises = ((Exercise, cls.exercise_id == Exercise.id),)
+        return {"id": (cls.id, ()), "workout_id": (cls.workout_id, ()), "workout_name": (Workout.name, workouts),
+                "exercise_id": (cls.exercise_id, ()), "exercise_name": (Exercise.name, exercises),
+                "sets": (cls.sets, ()), "reps": (cls.reps, ()), "weight": (cls.weight, ())}
+    
+    @classmethod
+    def rows(cls, session, columns=None, batch_size=1000, after_id=0, ids=None):
+        return _iter_rows(session, cls, columns, batch_size, after_id, ids)
+    
+    @classmethod
+    def find_by_id(cls, session, id, load=None, relationships=None):
+        return _query(session, cls, load, relationships).filter_by(id=id).first()
     
     @classmethod
     def delete(cls, session, id):
-        workout_exercise = cls.find_by_id(session, id)
-        if workout_exercise:
-            session.delete(workout_exercise)
+        return cls.delete_many(session, [id]) > 0
+    
+    @classmethod
+    def delete_many(cls, session, ids, chunk_size=500):
+        """Delete workout exercises by id, recomputing the affected personal
+        records, and return how many were deleted"""
+        deleted = 0
+        for chunk in batched(set(ids), chunk_size):
+            pairs = exercise_pairs(session, WorkoutExercise.id.in_(chunk))
+            deleted += _delete_where(session, cls, cls.id.in_(chunk))
+            PersonalRecord.refresh_pairs(session, pairs)
+        session.commit()
+        return deleted
+
+# Tables whose rows inserted by a Core statement are folded in by _log_statement_changes
+FOLDED_MODELS = {model.__tablename__: model for model in (Workout, WorkoutExercise)}
+
+class PersonalRecord(Base):
+    """Best weight and estimated 1RM per (user, exercise). The WorkoutExercise
+    setters, the flush hooks for new and moved rows, and the bulk, update_many and
+    delete_many paths keep it current; after any other Core UPDATE of workouts or
+    workout exercises call refresh_pairs() or rebuild()"""
+    __tablename__ = 'personal_records'
+    
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    exercise_id = Column(Integer, ForeignKey('exercises.id'), primary_key=True)
+    best_weight = Column(Float, nullable=False, default=0.0)
+    best_e1rm = Column(Float, nullable=False, default=0.0)
+    
+    @staticmethod
+    def estimate_1rm(weight, reps):
+        """Epley estimate of the one-rep max for a set of reps at weight"""
+        return weight * (1 + reps / 30.0)
+    
+    @classmethod
+    def _aggregate(cls):
+        # Best weight and estimated 1RM per (user, exercise) over sets that count
+        e1rm = WorkoutExercise.weight * (1 + WorkoutExercise.reps / 30.0)
+        return (select(Workout.user_id, WorkoutExercise.exercise_id,
+                       func.max(WorkoutExercise.weight), func.max(e1rm))
+                .join(Workout, WorkoutExercise.workout_id == Workout.id)
+                .where(Workout.user_id.is_not(None), WorkoutExercise.exercise_id.is_not(None),
+                       WorkoutExercise.sets > 0, WorkoutExercise.reps > 0)
+                .group_by(Workout.user_id, WorkoutExercise.exercise_id))
+    
+    @classmethod
+    def _upsert_best(cls, statement):
+        excluded = statement.excluded
+        return statement.on_conflict_do_update(
+            index_elements=[cls.user_id, cls.exercise_id],
+            set_={"best_weight": func.max(cls.best_weight, excluded.best_weight),
+                  "best_e1rm": func.max(cls.best_e1rm, excluded.best_e1rm)})
+    
+    @classmethod
+    def find(cls, session, user_id, exercise_id):
+        return session.get(cls, (user_id, exercise_id))
+    
+    @classmethod
+    def for_user(cls, session, user_id):
+        return session.query(cls).filter_by(user_id=user_id).order_by(cls.exercise_id).all()
+    
+    @classmethod
+    def record_lift(cls, session, user_id, exercise_id, sets, reps, weight):
+        """Raise the stored record for (user_id, exercise_id) if this set beats it"""
+        if user_id is None or exercise_id is None or sets <= 0 or reps <= 0:
+            return
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        statement = sqlite_insert(cls.__table__).values(
+            user_id=user_id, exercise_id=exercise_id,
+            best_weight=weight, best_e1rm=cls.estimate_1rm(weight, reps))
+        session.execute(cls._upsert_best(statement))
+    
+    @classmethod
+    def add_sets(cls, session, first_id, last_id):
+        """Fold the just inserted workout exercises with ids first_id to last_id into the records"""
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        query = cls._aggregate().where(WorkoutExercise.id.between(first_id, last_id))
+        statement = sqlite_insert(cls.__table__).from_select(
+            ["user_id", "exercise_id", "best_weight", "best_e1rm"], query)
+        session.execute(cls._upsert_best(statement))
+    
+    @classmethod
+    def refresh_pairs(cls, session, pairs, chunk_size=500):
+        """Recompute the records of the given (user_id, exercise_id) pairs from their history"""
+        pairs = [pair for pair in set(pairs) if None not in pair]
+        for chunk in batched(pairs, chunk_size):
+            session.execute(delete(cls.__table__).where(tuple_(cls.user_id, cls.exercise_id).in_(chunk)))
+            query = cls._aggregate().where(tuple_(Workout.user_id, WorkoutExercise.exercise_id).in_(chunk))
+            session.execute(insert(cls.__table__).from_select(
+                ["user_id", "exercise_id", "best_weight", "best_e1rm"], query))
+    
+    @classmethod
+    def rebuild(cls, session):
+        session.execute(delete(cls.__table__))
+        session.execute(insert(cls.__table__).from_select(
+            ["user_id", "exercise_id", "best_weight", "best_e1rm"], cls._aggregate()))
+        session.commit()
+    
+    @classmethod
+    def check_consistency(cls, session, tolerance=1e-6):
+        """Compare the stored records with a full recompute, returning the mismatches
+        as (user_id, exercise_id, stored, expected) where a missing side is None"""
+        stored = {(r.user_id, r.exercise_id): (r.best_weight, r.best_e1rm)
+                  for r in session.execute(select(cls.user_id, cls.exercise_id, cls.best_weight, cls.best_e1rm))}
+        expected = {(r[0], r[1]): (r[2], r[3]) for r in session.execute(cls._aggregate())}
+        mismatches = []
+        for pair in sorted(stored.keys() | expected.keys()):
+            have, want = stored.get(pair), expected.get(pair)
+            if have is None or want is None or any(abs(a - b) > tolerance for a, b in zip(have, want)):
+                mismatches.append((pair[0], pair[1], have, want))
+        return mismatches
+
+
+class _Rollup:
+    """Per-user workout count and volume per period, kept current by triggers
+    created in migration 5 and, for inserted workouts and sets, by add_workouts()
+    and add_sets(); period_of maps a workout date column to the period key"""
+    period_of = None
+    
+    @classmethod
+    def for_user(cls, session, user_id, start=None, end=None):
+        """Rows for user_id with periods from start up to but not including end"""
+        query = session.query(cls).filter(cls.user_id == user_id)
+        if start is not None:
+            query = query.filter(cls.period >= start)
+        if end is not None:
+            query = query.filter(cls.period < end)
+        return query.order_by(cls.period).all()
+    
+    @classmethod
+    def _aggregate(cls):
+        volumes = (select(WorkoutExercise.workout_id,
+                          func.sum(WorkoutExercise.sets * WorkoutExercise.reps * WorkoutExercise.weight).label("volume"))
+                   .group_by(WorkoutExercise.workout_id)
+                   .subquery())
+        period = cls.period_of(Workout.date)
+        return (select(Workout.user_id, period, func.count(), func.coalesce(func.sum(volumes.c.volume), 0.0))
+                .outerjoin(volumes, volumes.c.workout_id == Workout.id)
+                .where(Workout.user_id.is_not(None), Workout.date.is_not(None))
+                .group_by(Workout.user_id, period))
+    
+    @classmethod
+    @lru_cache(maxsize=None)
+    def _add_workouts_statement(cls):
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        period = cls.period_of(Workout.date)
+        counts = (select(Workout.user_id, period, func.count(), literal(0.0))
+                  .where(_inserted(Workout), Workout.user_id.is_not(None), period.is_not(None))
+                  .group_by(Workout.user_id, period))
+        statement = sqlite_insert(cls.__table__).from_select(["user_id", "period", "workouts", "volume"], counts)
+        return statement.on_conflict_do_update(
+            index_elements=[cls.user_id, cls.period], set_={"workouts": cls.workouts + statement.excluded.workouts})
+    
+    @classmethod
+    def add_workouts(cls, session, first_id, last_id):
+        """Count the just inserted workouts with ids first_id to last_id into their
+        periods, before any of their sets are added"""
+        session.connection().execute(cls._add_workouts_statement(), {"first_id": first_id, "last_id": last_id})
+    
+    @classmethod
+    @lru_cache(maxsize=None)
+    def _add_sets_statement(cls):
+        # Total the new sets per workout first, so each workout's date is bucketed once
+        per_workout = (select(WorkoutExercise.workout_id,
+                              func.sum(WorkoutExercise.sets * WorkoutExercise.reps * WorkoutExercise.weight).label("volume"))
+                       .where(_inserted(WorkoutExercise))
+                       .group_by(WorkoutExercise.workout_id)
+                       .subquery())
+        period = cls.period_of(Workout.date)
+        volumes = (select(Workout.user_id, period.label("period"), func.sum(per_workout.c.volume).label("volume"))
+                   .join(Workout, per_workout.c.workout_id == Workout.id)
+                   .group_by(Workout.user_id, period)
+                   .subquery())
+        table = cls.__table__
+        return (update(table)
+                .where(table.c.user_id == volumes.c.user_id, table.c.period == volumes.c.period)
+                .values(volume=table.c.volume + volumes.c.volume))
+    
+    @classmethod
+    def add_sets(cls, session, first_id, last_id):
+        """Add the volume of the just inserted workout exercises with ids first_id to
+        last_id to their workouts' periods"""
+        session.connection().execute(cls._add_sets_statement(), {"first_id": first_id, "last_id": last_id})
+
+    @classmethod
+    def rebuild(cls, session):
+        session.execute(delete(cls.__table__))
+        session.execute(insert(cls.__table__).from_select(["user_id", "period", "workouts", "volume"], cls._aggregate()))
+        session.commit()
+    
+    @classmethod
+    def check_consistency(cls, session, tolerance=1e-6):
+        """Compare the stored rollups with a full recompute, returning the mismatches
+        as (user_id, period, stored, expected) where a missing side is None"""
+        stored = {(r[0], r[1]): (r[2], r[3])
+                  for r in session.execute(select(cls.user_id, cls.period, cls.workouts, cls.volume))}
+        expected = {(r[0], r[1]): (r[2], r[3]) for r in session.execute(cls._aggregate())}
+        mismatches = []
+        for key in sorted(stored.keys() | expected.keys()):
+            have, want = stored.get(key), expected.get(key)
+            if have is None or want is None or have[0] != want[0] or abs(have[1] - want[1]) > tolerance * max(1.0, abs(want[1])):
+                mismatches.append((key[0], key[1], have, want))
+        return mismatches
+
+class DailyRollup(_Rollup, Base):
+    __tablename__ = 'daily_rollups'
+    
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    period = Column(String, primary_key=True)
+    workouts = Column(Integer, nullable=False, default=0)
+    volume = Column(Float, nullable=False, default=0.0)
+    
+    period_of = staticmethod(lambda date: func.date(date))
+
+class WeeklyRollup(_Rollup, Base):
+    __tablename__ = 'weekly_rollups'
+    
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    period = Column(String, primary_key=True)
+    workouts = Column(Integer, nullable=False, default=0)
+    volume = Column(Float, nullable=False, default=0.0)
+    
+    period_of = staticmethod(lambda date: func.strftime("%Y-%W", date))
+
+class ExerciseRollup(Base):
+    """Per-(user, exercise) count of logged sets and their total volume, kept
+    current by triggers created in migration 9 and, for inserted sets, by add_sets()"""
+    __tablename__ = 'exercise_rollups'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    exercise_id = Column(Integer, ForeignKey('exercises.id'), primary_key=True)
+    entries = Column(Integer, nullable=False, default=0)
+    volume = Column(Float, nullable=False, default=0.0)
+
+    @classmethod
+    def _aggregate(cls):
+        return (select(Workout.user_id, WorkoutExercise.exercise_id, func.count(),
+                       func.coalesce(func.sum(WorkoutExercise.sets * WorkoutExercise.reps * WorkoutExercise.weight), 0.0))
+                .join(Workout, WorkoutExercise.workout_id == Workout.id)
+                .where(Workout.user_id.is_not(None), WorkoutExercise.exercise_id.is_not(None))
+                .group_by(Workout.user_id, WorkoutExercise.exercise_id))
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def _add_sets_statement(cls):
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        statement = sqlite_insert(cls.__table__).from_select(
+            ["user_id", "exercise_id", "entries", "volume"], cls._aggregate().where(_inserted(WorkoutExercise)))
+        excluded = statement.excluded
+        return statement.on_conflict_do_update(
+            index_elements=[cls.user_id, cls.exercise_id],
+            set_={"entries": cls.entries + excluded.entries, "volume": cls.volume + excluded.volume})
+    
+    @classmethod
+    def add_sets(cls, session, first_id, last_id):
+        """Add the just inserted workout exercises with ids first_id to last_id to their pairs"""
+        session.connection().execute(cls._add_sets_statement(), {"first_id": first_id, "last_id": last_id})
+
+    @classmethod
+    def rebuild(cls, session):
+        session.execute(delete(cls.__table__))
+        session.execute(insert(cls.__table__).from_select(["user_id", "exercise_id", "entries", "volume"], cls._aggregate()))
+        session.commit()
+
+    @classmethod
+    def check_consistency(cls, session, tolerance=1e-6):
+        """Compare the stored rollups with a full recompute, returning the mismatches
+        as (user_id, exercise_id, stored, expected) where a missing side is None"""
+        stored = {(r[0], r[1]): (r[2], r[3])
+                  for r in session.execute(select(cls.user_id, cls.exercise_id, cls.entries, cls.volume))}
+        expected = {(r[0], r[1]): (r[2], r[3]) for r in session.execute(cls._aggregate())}
+        mismatches = []
+        for key in sorted(stored.keys() | expected.keys()):
+            have, want = stored.get(key), expected.get(key)
+            if have is None or want is None or have[0] != want[0] or abs(have[1] - want[1]) > tolerance * max(1.0, abs(want[1])):
+                mismatches.append((key[0], key[1], have, want))
+        return mismatches
+
+class TrainingStats(Base):
+    """Per-(user, exercise) smoothed estimated 1RM, its trend per set and the
+    latest set. Inserted sets fold straight in through fold_sets(); edited or
+    deleted sets mark the pair stale by the triggers created in migration 6, and
+    refresh() recomputes stale pairs from their history in insertion order."""
+    __tablename__ = 'training_stats'
+    
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    exercise_id = Column(Integer, ForeignKey('exercises.id'), primary_key=True)
+    observations = Column(Integer, nullable=False, default=0)
+    level = Column(Float, nullable=False, default=0.0)
+    trend = Column(Float, nullable=False, default=0.0)
+    last_sets = Column(Integer, nullable=False, default=0)
+    last_reps = Column(Integer, nullable=False, default=0)
+    last_weight = Column(Float, nullable=False, default=0.0)
+    last_date = Column(DateTime)
+    stale = Column(Integer, nullable=False, default=0)
+    
+    @staticmethod
+    def fold(history, stats=None):
+        """Stats for one pair from its (sets, reps, weight, date) rows in insertion
+        order, continuing from stats if given"""
+        stats = dict(stats) if stats else None
+        for sets, reps, weight, date in history:
+            e1rm = weight * (1 + reps / 30.0)
+            if stats is None:
+                stats = {"observations": 1, "level": e1rm, "trend": 0.0}
+            else:
+                level = LEVEL_SMOOTHING * e1rm + (1 - LEVEL_SMOOTHING) * (stats["level"] + stats["trend"])
+                stats["trend"] = TREND_SMOOTHING * (level - stats["level"]) + (1 - TREND_SMOOTHING) * stats["trend"]
+                stats["level"] = level
+                stats["observations"] += 1
+            stats.update(last_sets=sets, last_reps=reps, last_weight=weight, last_date=date)
+        return stats
+    
+    @classmethod
+    def _history(cls, *conditions):
+        return (select(Workout.user_id, WorkoutExercise.exercise_id, WorkoutExercise.sets,
+                       WorkoutExercise.reps, WorkoutExercise.weight, Workout.date)
+                .join(Workout, WorkoutExercise.workout_id == Workout.id)
+                .where(Workout.user_id.is_not(None), WorkoutExercise.exercise_id.is_not(None),
+                       WorkoutExercise.sets > 0, WorkoutExercise.reps > 0, *conditions)
+                .order_by(Workout.user_id, WorkoutExercise.exercise_id, WorkoutExercise.id))
+    
+    @classmethod
+    def _computed(cls, session, *conditions):
+        # One ordered pass over the history, folding each pair as it goes by
+        computed = {}
+        rows = session.execute(cls._history(*conditions))
+        for (user_id, exercise_id), history in groupby(rows, lambda row: (row[0], row[1])):
+            computed[user_id, exercise_id] = cls.fold(row[2:] for row in history)
+        return computed
+    
+    @classmethod
+    @lru_cache(maxsize=None)
+    def _fold_sets_queries(cls):
+        pairs = (select(Workout.user_id, WorkoutExercise.exercise_id)
+                 .join(Workout, WorkoutExercise.workout_id == Workout.id)
+                 .where(_inserted(WorkoutExercise)))
+        return cls._history(_inserted(WorkoutExercise)), select(cls.__table__).where(tuple_(cls.user_id, cls.exercise_id).in_(pairs))
+    
+    @classmethod
+    def fold_sets(cls, session, first_id, last_id):
+        """Fold the just inserted workout exercises with ids first_id to last_id into
+        the stats of their pairs in insertion order; stale pairs are left for refresh()"""
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        history, current = cls._fold_sets_queries()
+        ids = {"first_id": first_id, "last_id": last_id}
+        connection = session.connection()
+        added = connection.execute(history, ids).all()
+        if not added:
+            return
+        fields = ("observations", "level", "trend", "last_sets", "last_reps", "last_weight", "last_date")
+        stored = {(row.user_id, row.exercise_id): row for row in connection.execute(current, ids)}
+        values = []
+        for (user_id, exercise_id), rows in groupby(added, lambda row: (row[0], row[1])):
+            row = stored.get((user_id, exercise_id))
+            if row is not None and row.stale:
+                continue
+            start = {field: getattr(row, field) for field in fields} if row is not None else None
+            values.append(dict(cls.fold((added_row[2:] for added_row in rows), start),
+                               user_id=user_id, exercise_id=exercise_id, stale=0))
+        if values:
+            statement = sqlite_insert(cls.__table__)
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=[cls.user_id, cls.exercise_id],
+                set_={field: getattr(statement.excluded, field) for field in fields}), values)
+    
+    @classmethod
+    @lru_cache(maxsize=None)
+    def _mark_stale_statement(cls):
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        pairs = (select(Workout.user_id, WorkoutExercise.exercise_id, literal(1)).distinct()
+                 .join(Workout, WorkoutExercise.workout_id == Workout.id)
+                 .where(_inserted(WorkoutExercise), Workout.user_id.is_not(None), WorkoutExercise.exercise_id.is_not(None),
+                        WorkoutExercise.sets > 0, WorkoutExercise.reps > 0))
+        statement = sqlite_insert(cls.__table__).from_select(["user_id", "exercise_id", "stale"], pairs)
+        return statement.on_conflict_do_update(index_elements=[cls.user_id, cls.exercise_id], set_={"stale": 1})
+    
+    @classmethod
+    def mark_stale(cls, session, first_id, last_id):
+        """Mark the pairs of the just inserted workout exercises with ids first_id to
+        last_id stale, for refresh() to recompute when they are next read"""
+        session.connection().execute(cls._mark_stale_statement(), {"first_id": first_id, "last_id": last_id})
+    
+    @classmethod
+    def refresh(cls, session, user_id=None, chunk_size=500):
+        """Recompute the stale pairs (of user_id only, if given), returning how many"""
+        query = select(cls.user_id, cls.exercise_id).where(cls.stale != 0)
+        if user_id is not None:
+            query = query.where(cls.user_id == user_id)
+        pairs = [tuple(row) for row in session.execute(query)]
+        for chunk in batched(pairs, chunk_size):
+            # The user_id test lets the history be read through ix_workouts_user_id_date
+            computed = cls._computed(session, Workout.user_id.in_({pair[0] for pair in chunk}),
+                                     tuple_(Workout.user_id, WorkoutExercise.exercise_id).in_(chunk))
+            session.execute(delete(cls.__table__).where(tuple_(cls.user_id, cls.exercise_id).in_(chunk)))
+            if computed:
+                session.execute(insert(cls.__table__), [dict(stats, user_id=user_id, exercise_id=exercise_id, stale=0)
+                                                        for (user_id, exercise_id), stats in computed.items()])
+        if pairs:
             session.commit()
-            return True
-        return False
+        return len(pairs)
+    
+    @classmethod
+    def for_user(cls, session, user_id, exercise_ids=None):
+        query = session.query(cls).filter(cls.user_id == user_id)
+        if exercise_ids is not None:
+            query = query.filter(cls.exercise_id.in_(exercise_ids))
+        return query.order_by(cls.exercise_id).all()
+    
+    @classmethod
+    def rebuild(cls, session):
+        computed = cls._computed(session)
+        session.execute(delete(cls.__table__))
+        if computed:
+            session.execute(insert(cls.__table__), [dict(stats, user_id=user_id, exercise_id=exercise_id, stale=0)
+                                                    for (user_id, exercise_id), stats in computed.items()])
+        session.commit()
+    
+    @classmethod
+    def check_consistency(cls, session, tolerance=1e-6):
+        """Compare the stored stats of pairs that are not stale with a full
+        recompute, returning the mismatches as (user_id, exercise_id, stored, expected)"""
+        fields = ("observations", "level", "trend", "last_sets", "last_reps", "last_weight")
+        stored = {(r.user_id, r.exercise_id): tuple(getattr(r, field) for field in fields)
+                  for r in session.execute(select(cls).where(cls.stale == 0)).scalars()}
+        stale = {tuple(r) for r in session.execute(select(cls.user_id, cls.exercise_id).where(cls.stale != 0))}
+        expected = {pair: tuple(stats[field] for field in fields)
+                    for pair, stats in cls._computed(session).items() if pair not in stale}
+        mismatches = []
+        for pair in sorted(stored.keys() | expected.keys()):
+            have, want = stored.get(pair), expected.get(pair)
+            if have is None or want is None or any(abs(a - b) > tolerance * max(1.0, abs(b)) for a, b in zip(have, want)):
+                mismatches.append((pair[0], pair[1], have, want))
+        return mismatches
 
-# Create database tables
-Base.metadata.create_all(engine)
\ No newline at end of file
+
+class Change(Base):
+    """One insert, update or delete in the change log read by sync.py. seq only
+    grows; origin_id and origin_seq name the database a change copied in by sync
+    was first made in, and are None for changes made here."""
+    __tablename__ = 'change_log'
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    seq = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)
+    data = Column(String)
+    origin_id = Column(String)
+    origin_seq = Column(Integer)
+    
+    @classmethod
+    def since(cls, session, after_seq=0, limit=None):
+        """Named-tuple rows of the changes after after_seq, oldest first"""
+        query = select(*cls.__table__.columns).where(cls.seq > after_seq).order_by(cls.seq)
+        if limit is not None:
+            query = query.limit(limit)
+        return session.execute(query).all()
+
+class SyncState(Base):
+    """This database's id (is_self) and, per other database, how far sync has got:
+    pulled_seq through its change log, applied_seq through the changes made there"""
+    __tablename__ = 'sync_state'
+    
+    database_id = Column(String, primary_key=True)
+    is_self = Column(Integer, nullable=False, default=0)
+    pulled_seq = Column(Integer, nullable=False, default=0)
+    applied_seq = Column(Integer, nullable=False, default=0)
+
+class SyncId(Base):
+    """The local id of a row copied in from another database, keyed by the
+    database it was made in and its id there"""
+    __tablename__ = 'sync_ids'
+    
+    origin_id = Column(String, primary_key=True)
+    table_name = Column(String, primary_key=True)
+    origin_row_id = Column(Integer, primary_key=True)
+    local_id = Column(Integer, nullable=False)
+    
+    __table_args__ = (
+        Index('ix_sync_ids_table_name_local_id', 'table_name', 'local_id'),
+    )
@@ -0,0 +1,103 @@
+"""Run the per-user reports on several processes at once.
+
+    with ReportPool(workers=4) as pool:
+        results = pool.run(["volume_by_user", "workout_frequency"])
+
+Users are split into contiguous id ranges of roughly equal size and every
+(report, range) pair is a task for a ProcessPoolExecutor. Each worker process
+opens its own engine on the database file (WAL mode lets the readers run side
+by side), runs the report from reports.py for its range and sends the rows
+back. Ranges never share a user, so the merged result is just the shards' rows
+in the report's own order, the same rows the report returns when run directly.
+"""
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+
+import reports
+from db import load_settings, make_engine
+from models import User
+
+REPORTS = ("volume_by_user", "volume_by_exercise", "volume_by_week", "workout_frequency", "personal_records")
+
+# The order each report's rows come in. Shards cover ascending id ranges, so
+# reports ordered by user first merge by concatenation; volume_by_user, ordered by
+# volume, needs a real merge.
+MERGE_KEYS = {
+    "volume_by_user": lambda row: -row.volume,
+}
+
+# More shards than workers, so a shard of heavy users does not leave the other
+# workers idle at the end
+SHARDS_PER_WORKER = 4
+
+_session = None
+
+def _start_worker(url):
+    global _session
+    _session = sessionmaker(bind=make_engine({"url": url}))()
+
+def _run_shard(name, user_range):
+    try:
+        return getattr(reports, name)(_session, user_range=user_range)
+    finally:
+        # End the read transaction so the next task sees newly committed rows
+        _session.rollback()
+
+def user_ranges(session, shards):
+    """Split the users into at most shards (low, high) id ranges of similar size"""
+    ids = session.execute(select(User.id).order_by(User.id)).scalars().all()
+    if not ids:
+        return []
+    shards = max(1, min(shards, len(ids)))
+    bounds = [ids[len(ids) * i // shards] for i in range(shards)] + [ids[-1] + 1]
+    return list(zip(bounds, bounds[1:]))
+
+def merge(name, parts):
+    """Combine the shards' rows of one report, given in ascending range order"""
+    key = MERGE_KEYS.get(name)
+    if key is None:
+        return [row for part in parts for row in part]
+    return list(heapq.merge(*parts, key=key))
+
+class ReportPool:
+    """A pool of worker processes bound to one database; reuse it across run() calls
+    so the workers' engines and page caches stay warm"""
+    def __init__(self, workers=None, url=None, shards=None):
+        self.url = url or load_settings()["url"]
+        if make_url(self.url).database in (None, "", ":memory:"):
+            raise ValueError("Parallel reports need a database file, not an in-memory database")
+        self.workers = workers or os.cpu_count() or 1
+        self.shards = shards or self.workers * SHARDS_PER_WORKER
+        self._executor = ProcessPoolExecutor(self.workers, initializer=_start_worker, initargs=(self.url,))
+        self._engine = make_engine({"url": self.url})
+
+    def run(self, names=REPORTS):
+        """Run the named reports over every user, returning {name: rows}"""
+        unknown = [name for name in names if name not in REPORTS]
+        if unknown:
+            raise ValueError(f"Unknown reports: {', '.join(unknown)}")
+        with sessionmaker(bind=self._engine)() as session:
+            ranges = user_ranges(session, self.shards)
+        futures = {name: [self._executor.submit(_run_shard, name, user_range) for user_range in ranges]
+                   for name in names}
+        return {name: merge(name, [future.result() for future in parts]) for name, parts in futures.items()}
+
+    def close(self):
+        self._executor.shutdown()
+        self._engine.dispose()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def run_reports(names=REPORTS, workers=None, url=None):
+    """Run the named reports once on a fresh pool, returning {name: rows}"""
+    with ReportPool(workers, url) as pool:
+        return pool.run(names)
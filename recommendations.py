@@ -0,0 +1,63 @@
+"""Next-session targets for each exercise a user trains (progressive overload).
+
+Suggestions come from TrainingStats, which the database keeps current as sets
+are logged, so a whole program is one query rather than a scan of the history:
+
+- one set logged so far ("new"): repeat it
+- bodyweight exercises ("bodyweight"): one more rep
+- estimated 1RM trending up ("progress"): the weight the forecast 1RM (level +
+  trend) allows at the same reps, rounded down to WEIGHT_STEP, at least one step
+  and at most MAX_INCREASE above the last weight
+- trending down by more than DELOAD_TREND of the level per set ("deload"):
+  DELOAD_FACTOR of the last weight
+- otherwise ("hold"): the same weight for one more rep
+"""
+import math
+from collections import namedtuple
+
+from sqlalchemy import select
+
+from models import Exercise, TrainingStats
+
+WEIGHT_STEP = 2.5
+MAX_INCREASE = 0.05
+DELOAD_TREND = 0.02
+DELOAD_FACTOR = 0.9
+
+Recommendation = namedtuple("Recommendation", "exercise_id exercise_name sets reps weight reason "
+                                              "last_sets last_reps last_weight")
+
+def _round_down(weight):
+    return math.floor(weight / WEIGHT_STEP + 1e-9) * WEIGHT_STEP
+
+def suggest(stats):
+    """(sets, reps, weight, reason) for the next session from one TrainingStats row"""
+    sets, reps, weight = stats.last_sets, stats.last_reps, stats.last_weight
+    if stats.observations < 2:
+        return sets, reps, weight, "new"
+    if weight <= 0:
+        return sets, reps + 1, weight, "bodyweight"
+    if stats.trend > 0:
+        forecast = (stats.level + stats.trend) / (1 + reps / 30.0)
+        ceiling = max(_round_down(weight * (1 + MAX_INCREASE)), weight + WEIGHT_STEP)
+        return sets, reps, min(max(_round_down(forecast), weight + WEIGHT_STEP), ceiling), "progress"
+    if stats.trend < -DELOAD_TREND * stats.level:
+        return sets, reps, _round_down(weight * DELOAD_FACTOR), "deload"
+    return sets, reps + 1, weight, "hold"
+
+def recommend(session, user_id, exercise_ids=None):
+    """Recommendations for every exercise user_id has logged (or just exercise_ids),
+    ordered by exercise name"""
+    TrainingStats.refresh(session, user_id)
+    query = (select(TrainingStats, Exercise.name)
+             .join(Exercise, TrainingStats.exercise_id == Exercise.id)
+             .where(TrainingStats.user_id == user_id)
+             .order_by(Exercise.name, Exercise.id))
+    if exercise_ids is not None:
+        query = query.where(TrainingStats.exercise_id.in_(exercise_ids))
+    recommendations = []
+    for stats, name in session.execute(query):
+        sets, reps, weight, reason = suggest(stats)
+        recommendations.append(Recommendation(stats.exercise_id, name, sets, reps, weight, reason,
+                                              stats.last_sets, stats.last_reps, stats.last_weight))
+    return recommendations
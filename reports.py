@@ -0,0 +1,79 @@
+"""Training volume reports aggregated in SQL.
+
+Volume is sets x reps x weight summed over workout exercises. Every report is a
+single query, so nothing is loaded row by row into Python; the per-exercise and
+weekly volumes read the rollup tables that triggers keep current instead of
+aggregating every logged set.
+
+Every report takes user_id to cover one user, or user_range=(low, high) to cover
+the users with low <= id < high; parallel_reports runs them on shards that way.
+"""
+from sqlalchemy import func, select
+
+from models import User, Exercise, Workout, WorkoutExercise, PersonalRecord, WeeklyRollup, ExerciseRollup
+
+WEEK_FORMAT = "%Y-%W"
+
+def volume_expression():
+    return func.coalesce(func.sum(WorkoutExercise.sets * WorkoutExercise.reps * WorkoutExercise.weight), 0.0)
+
+def _for_users(query, column, user_id=None, user_range=None):
+    if user_id is not None:
+        query = query.where(column == user_id)
+    if user_range is not None:
+        query = query.where(column >= user_range[0], column < user_range[1])
+    return query
+
+def _volume_query(*group_by, user_id=None, user_range=None):
+    query = (select(*group_by, volume_expression().label("volume"))
+             .select_from(WorkoutExercise)
+             .join(Workout, WorkoutExercise.workout_id == Workout.id)
+             .group_by(*group_by))
+    return _for_users(query, Workout.user_id, user_id, user_range)
+
+def volume_by_user(session, user_id=None, user_range=None):
+    """Rows of (user_id, name, volume), largest volume first"""
+    totals = _volume_query(Workout.user_id, user_id=user_id, user_range=user_range).subquery()
+    query = (select(User.id.label("user_id"), User.name, totals.c.volume)
+             .join(totals, totals.c.user_id == User.id)
+             .order_by(totals.c.volume.desc()))
+    return session.execute(query).all()
+
+def volume_by_exercise(session, user_id=None, user_range=None):
+    """Rows of (user_id, exercise_id, exercise_name, volume) ordered by user then volume.
+
+    Read from the exercise_rollups table, so sets of workouts without a user are
+    left out."""
+    query = (select(ExerciseRollup.user_id, ExerciseRollup.exercise_id, Exercise.name.label("exercise_name"),
+                    ExerciseRollup.volume)
+             .join(Exercise, ExerciseRollup.exercise_id == Exercise.id)
+             .order_by(ExerciseRollup.user_id, ExerciseRollup.volume.desc()))
+    return session.execute(_for_users(query, ExerciseRollup.user_id, user_id, user_range)).all()
+
+def volume_by_week(session, user_id=None, user_range=None):
+    """Rows of (user_id, week, volume) where week is "YYYY-WW" with Monday-based weeks.
+
+    Read from the weekly_rollups table, so a week whose workouts have no sets
+    shows a volume of 0 and workouts without a user or date are left out."""
+    query = (select(WeeklyRollup.user_id, WeeklyRollup.period.label("week"), WeeklyRollup.volume)
+             .order_by(WeeklyRollup.user_id, WeeklyRollup.period))
+    return session.execute(_for_users(query, WeeklyRollup.user_id, user_id, user_range)).all()
+
+def workout_frequency(session, user_id=None, user_range=None):
+    """Rows of (user_id, workouts, active_weeks, first_date, last_date) ordered by user"""
+    query = (select(Workout.user_id, func.count(Workout.id).label("workouts"),
+                    func.count(func.distinct(func.strftime(WEEK_FORMAT, Workout.date))).label("active_weeks"),
+                    func.min(Workout.date).label("first_date"), func.max(Workout.date).label("last_date"))
+             .where(Workout.user_id.is_not(None))
+             .group_by(Workout.user_id)
+             .order_by(Workout.user_id))
+    return session.execute(_for_users(query, Workout.user_id, user_id, user_range)).all()
+
+def personal_records(session, user_id=None, user_range=None):
+    """Rows of (user_id, exercise_id, exercise_name, best_weight, best_e1rm) ordered by
+    user then exercise"""
+    query = (select(PersonalRecord.user_id, PersonalRecord.exercise_id, Exercise.name.label("exercise_name"),
+                    PersonalRecord.best_weight, PersonalRecord.best_e1rm)
+             .join(Exercise, PersonalRecord.exercise_id == Exercise.id)
+             .order_by(PersonalRecord.user_id, PersonalRecord.exercise_id))
+    return session.execute(_for_users(query, PersonalRecord.user_id, user_id, user_range)).all()
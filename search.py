@@ -0,0 +1,45 @@
+"""Ranked full-text search over exercises and workouts.
+
+The search_index FTS5 table is created by migration 4 and kept current by
+triggers on the exercises and workouts tables, so every write path (ORM, bulk
+inserts, set-based deletes) updates it without help from Python.
+"""
+import re
+from collections import namedtuple
+
+from sqlalchemy import text
+
+KINDS = ("exercise", "workout")
+
+SearchResult = namedtuple("SearchResult", "kind id name snippet score")
+
+# Name matches weigh ten times as much as description matches
+SEARCH_SQL = """
+SELECT rowid, name, snippet(search_index, 1, '[', ']', '...', 12) AS snippet,
+       bm25(search_index, 10.0, 1.0) AS score
+FROM search_index
+WHERE search_index MATCH :query {kind_filter}
+ORDER BY score
+LIMIT :limit
+"""
+
+def match_expression(query):
+    """Turn free text into an FTS5 query: every word must match, as a prefix"""
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", query))
+
+def search(session, query, limit=20, kind=None):
+    """Best matches for query as SearchResult rows, best first; kind limits them
+    to "exercise" or "workout" results"""
+    expression = match_expression(query)
+    if not expression:
+        return []
+    kind_filter = ""
+    params = {"query": expression, "limit": limit}
+    if kind is not None:
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+        kind_filter = "AND rowid % 2 = :kind"
+        params["kind"] = KINDS.index(kind)
+    rows = session.execute(text(SEARCH_SQL.format(kind_filter=kind_filter)), params)
+    return [SearchResult(KINDS[rowid % 2], rowid // 2, name, snippet, -score)
+            for rowid, name, snippet, score in rows]
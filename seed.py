@@ -1,15 +1,26 @@
-from models import Session, User, Exercise, Workout, WorkoutExercise
+from instrumentation import enable_from_env
 from datetime import datetime, timedelta
+from itertools import islice
+import argparse
 import logging
+import random
 
+# The models (and SQLAlchemy) are imported where they are used, so --help is quick
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def clear_data(session):
     """Clear existing data from all tables"""
+    from models import (User, Exercise, Workout, WorkoutExercise, PersonalRecord, DailyRollup, WeeklyRollup,
+                        ExerciseRollup, TrainingStats)
     try:
         logger.info("Clearing existing data...")
+        session.query(PersonalRecord).delete()
+        session.query(DailyRollup).delete()
+        session.query(WeeklyRollup).delete()
+        session.query(ExerciseRollup).delete()
+        session.query(TrainingStats).delete()
         session.query(WorkoutExercise).delete()
         session.query(Workout).delete()
         session.query(Exercise).delete()
@@ -22,6 +33,7 @@ def clear_data(session):
 
 def seed_users(session):
     """Seed users table with sample data"""
+    from models import User
     users = [
         User(name="John Doe", email="john.doe@example.com"),
         User(name="Jane Smith", email="jane.smith@example.com"),
@@ -35,6 +47,7 @@ def seed_users(session):
 
 def seed_exercises(session):
     """Seed exercises table with common exercises"""
+    from models import Exercise
     exercises = [
         Exercise(
             name="Push-ups",
@@ -76,6 +89,7 @@ def seed_exercises(session):
 
 def seed_workouts(session, users):
     """Seed workouts table with sample data"""
+    from models import Workout
     workouts = [
         Workout(
             user_id=users[0].id,
@@ -105,6 +119,7 @@ def seed_workouts(session, users):
 
 def seed_workout_exercises(session, workouts, exercises):
     """Seed workout_exercises table linking workouts and exercises"""
+    from models import WorkoutExercise, PersonalRecord
     workout_exercises = [
         WorkoutExercise(workout_id=workouts[0].id, exercise_id=exercises[0].id, sets=3, reps=15),
         WorkoutExercise(workout_id=workouts[0].id, exercise_id=exercises[1].id, sets=3, reps=10),
@@ -115,12 +130,121 @@ def seed_workout_exercises(session, workouts, exercises):
     ]
     session.add_all(workout_exercises)
     session.commit()
+    PersonalRecord.rebuild(session)
     logger.info(f"Added {len(workout_exercises)} workout exercises")
 
-def main():
+FIRST_NAMES = ["John", "Jane", "Mike", "Sarah", "Amara", "Kwame", "Li", "Sofia", "Omar", "Priya", "Lucas", "Zara"]
+LAST_NAMES = ["Doe", "Smith", "Johnson", "Wilson", "Okafor", "Mensah", "Chen", "Garcia", "Haddad", "Patel"]
+WORKOUT_NAMES = ["Morning Strength Training", "Evening Cardio", "Full Body Workout", "Upper Body Focus",
+                 "Lower Body Day", "Push Day", "Pull Day", "Leg Day"]
+GENERATED_START = datetime(2024, 1, 1)
+
+def _max_id(session, model):
+    from sqlalchemy import func
+    return session.query(func.max(model.id)).scalar() or 0
+
+def _insert_batches(session, model, rows, batch_size):
+    """Insert row dicts with one executemany and commit per batch, returning the row count"""
+    from sqlalchemy import insert
+    from models import Workout
+    statement = insert(model.__table__)
+    rows = iter(rows)
+    total = 0
+    while batch := list(islice(rows, batch_size)):
+        if model is Workout:
+            Workout.insert_rows(session, batch)
+        else:
+            session.execute(statement, batch)
+        session.commit()
+        total += len(batch)
+    return total
+
+def generate(session, users, workouts_per_user, exercises_per_workout, exercises=8, seed=0,
+             batch_size=None):
+    """Append a deterministic synthetic training history: the same arguments and
+    seed always produce the same rows. Returns the row count per table."""
+    from models import User, Exercise, Workout, WorkoutExercise, BULK_BATCH_SIZE
+    batch_size = batch_size or BULK_BATCH_SIZE
+    rng = random.Random(seed)
+    user_base, exercise_base, workout_base = (_max_id(session, model) for model in (User, Exercise, Workout))
+
+    def user_rows():
+        for i in range(1, users + 1):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            yield {"id": user_base + i, "name": f"{first} {last}",
+                   "email": f"{first.lower()}.{last.lower()}.{user_base + i}@example.com"}
+
+    def exercise_rows():
+        for i in range(1, exercises + 1):
+            yield {"id": exercise_base + i, "name": f"Exercise {exercise_base + i}", "description": None}
+
+    def workout_rows():
+        for u in range(users):
+            day = 0
+            for w in range(workouts_per_user):
+                day += rng.randint(1, 4)
+                yield {"id": workout_base + u * workouts_per_user + w + 1, "name": rng.choice(WORKOUT_NAMES),
+                       "user_id": user_base + u + 1,
+                       "date": GENERATED_START + timedelta(days=day, hours=rng.randint(6, 20))}
+
+    def workout_exercise_rows():
+        for workout_id in range(workout_base + 1, workout_base + users * workouts_per_user + 1):
+            for _ in range(exercises_per_workout):
+                yield {"workout_id": workout_id, "exercise_id": exercise_base + rng.randint(1, exercises),
+                       "sets": rng.randint(1, 5), "reps": rng.randint(1, 12),
+                       "weight": rng.randint(0, 80) * 2.5}
+
+    counts = {
+        "users": _insert_batches(session, User, user_rows(), batch_size),
+        "exercises": _insert_batches(session, Exercise, exercise_rows(), batch_size),
+        "workouts": _insert_batches(session, Workout, workout_rows(), batch_size),
+        "workout_exercises": WorkoutExercise.bulk_create(session, workout_exercise_rows(), batch_size),
+    }
+    for table, count in counts.items():
+        logger.info(f"Generated {count} {table}")
+    return counts
+
+def import_file(session, path, batch_size):
+    """Stream workout exercises from a CSV or JSONL file into the database"""
+    from importer import import_workout_exercises
+    logger.info(f"Importing workout exercises from {path}...")
+    count = import_workout_exercises(session, path, batch_size)
+    logger.info(f"Imported {count} workout exercises")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Seed the fitness tracker database")
+    parser.add_argument("--import", dest="import_path", metavar="PATH",
+                        help="import workout exercises from a .csv or .jsonl file instead of seeding sample data")
+    parser.add_argument("--batch-size", type=int,
+                        help="rows per insert transaction when importing or generating (default: models.BULK_BATCH_SIZE)")
+    generator = parser.add_argument_group("synthetic data", "generate a large deterministic dataset instead of the samples")
+    generator.add_argument("--users", type=int, help="number of users to generate")
+    generator.add_argument("--workouts-per-user", type=int, default=20)
+    generator.add_argument("--exercises-per-workout", type=int, default=5)
+    generator.add_argument("--exercises", type=int, default=8, help="size of the generated exercise catalog")
+    generator.add_argument("--seed", type=int, default=0, help="random seed; equal seeds give equal data")
+    generator.add_argument("--append", action="store_true", help="keep existing data instead of clearing it first")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main function to seed the database"""
+    args = parse_args(argv)
+    enable_from_env()
+    from models import Session, BULK_BATCH_SIZE
+    args.batch_size = args.batch_size or BULK_BATCH_SIZE
     session = Session()
     try:
+        if args.import_path:
+            import_file(session, args.import_path, args.batch_size)
+            return
+        if args.users is not None:
+            logger.info("Generating synthetic data...")
+            if not args.append:
+                clear_data(session)
+            generate(session, args.users, args.workouts_per_user, args.exercises_per_workout,
+                     args.exercises, args.seed, args.batch_size)
+            logger.info("Database seeding completed successfully!")
+            return
         logger.info("Starting database seeding...")
         clear_data(session)
         users = seed_users(session)
@@ -0,0 +1,352 @@
+"""Incremental sync between fitness databases through their change logs.
+
+    python app.py sync other-gym.db          # copy in the other database's new changes
+    python app.py sync other-gym.db --both   # and send it ours
+
+Every database has a random id and a change log (models.Change) with a growing
+seq. pull() reads a peer's log from the seq it stopped at last time and replays
+each change here, logging it again with the database it was first made in, so
+changes travel on through further syncs in any direction without being applied
+twice: per origin database, only changes past the last one applied are replayed.
+
+A row is known everywhere by the database it was created in and its id there.
+Copied rows always get a fresh local id, recorded in sync_ids, so ids from
+different databases never clash. Conflicts are settled as follows:
+
+- a user arriving with an email already used here (in any letter case) is the
+  same person: the incoming user is merged into the local one and their
+  workouts attach to it
+- an update that would give a user an email another local user has keeps the
+  local email
+- a row changed in both places keeps whichever change was replayed last
+
+Each batch of changes commits together with the position reached, so an
+interrupted sync resumes where it stopped. Derived tables (personal records,
+rollups, training stats, search) are kept current the same way as for local
+writes.
+"""
+import json
+from collections import namedtuple
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import DateTime, bindparam, func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import sessionmaker
+
+from db import make_engine
+from migrations import LOGGED_TABLES, upgrade
+from models import (Base, Change, SyncId, SyncState, User, Exercise, Workout, WorkoutExercise, PersonalRecord,
+                    invalidate_cache, normalize_email, batched, exercise_pairs)
+
+DEFAULT_BATCH_SIZE = 10000
+MODELS = {model.__tablename__: model for model in (User, Exercise, Workout, WorkoutExercise)}
+
+SyncResult = namedtuple("SyncResult", "pulled applied skipped conflicts")
+
+def open_database(path):
+    """A session on another database file, upgrading its schema if needed"""
+    engine = make_engine({"url": f"sqlite:///{path}"})
+    upgrade(engine, Base.metadata)
+    return sessionmaker(bind=engine)()
+
+def database_id(session):
+    return session.execute(select(SyncState.database_id).where(SyncState.is_self == 1)).scalar_one()
+
+def _references(table):
+    # {column name: referenced table} for the foreign keys between logged tables
+    return {column.name: next(iter(column.foreign_keys)).column.table.name
+            for column in Base.metadata.tables[table].columns if column.foreign_keys}
+
+REFERENCES = {table: _references(table) for table in LOGGED_TABLES}
+DATE_COLUMNS = {table: [column.name for column in Base.metadata.tables[table].columns
+                        if isinstance(column.type, DateTime)] for table in LOGGED_TABLES}
+
+class _IdMap:
+    """Translates one batch's peer ids to local ids through (origin, origin id)"""
+    def __init__(self, session, peer, self_id, peer_id):
+        self.session = session
+        self.peer = peer
+        self.self_id = self_id
+        self.peer_id = peer_id
+        self.origins = {}
+        self.local = {}
+        self.new = []
+
+    def load(self, refs, created):
+        """Look up every (table, peer id) in refs, a few hundred ids per query.
+        created holds the rows the batch inserts, which cannot be here yet if the
+        peer made them"""
+        by_table = {}
+        for table, id in refs:
+            by_table.setdefault(table, set()).add(id)
+        wanted = {}  # {(table, origin database): [origin ids]}
+        for table, ids in by_table.items():
+            for chunk in batched(ids, 500):
+                rows = self.peer.execute(select(SyncId.local_id, SyncId.origin_id, SyncId.origin_row_id)
+                                         .where(SyncId.table_name == table, SyncId.local_id.in_(chunk)))
+                for local_id, origin_id, origin_row_id in rows:
+                    self.origins[table, local_id] = (origin_id, origin_row_id)
+            for id in ids:
+                origin = self.origins.setdefault((table, id), (self.peer_id, id))
+                if origin[0] == self.self_id:
+                    self.local[origin[0], table, origin[1]] = origin[1]
+                elif origin[0] != self.peer_id or (table, id) not in created:
+                    wanted.setdefault((table, origin[0]), []).append(origin[1])
+        for (table, origin_id), origin_row_ids in wanted.items():
+            for chunk in batched(origin_row_ids, 500):
+                rows = self.session.execute(select(SyncId.origin_row_id, SyncId.local_id)
+                                            .where(SyncId.origin_id == origin_id, SyncId.table_name == table,
+                                                   SyncId.origin_row_id.in_(chunk)))
+                for origin_row_id, local_id in rows:
+                    self.local[origin_id, table, origin_row_id] = local_id
+
+    def origin(self, table, peer_row_id):
+        return self.origins[table, peer_row_id]
+
+    def local_id(self, table, peer_row_id):
+        origin_id, origin_row_id = self.origin(table, peer_row_id)
+        return self.local.get((origin_id, table, origin_row_id))
+
+    def add(self, table, peer_row_id, local_id):
+        origin_id, origin_row_id = self.origin(table, peer_row_id)
+        self.local[origin_id, table, origin_row_id] = local_id
+        self.new.append({"origin_id": origin_id, "table_name": table,
+                         "origin_row_id": origin_row_id, "local_id": local_id})
+
+    def save(self):
+        if self.new:
+            # An id SQLite hands out again after its row was deleted maps to the new row
+            statement = sqlite_insert(SyncId.__table__)
+            self.session.execute(statement.on_conflict_do_update(
+                index_elements=[SyncId.origin_id, SyncId.table_name, SyncId.origin_row_id],
+                set_={"local_id": statement.excluded.local_id}), self.new)
+            self.new = []
+
+class _Replay:
+    def __init__(self, session, peer):
+        self.session = session
+        self.peer = peer
+        self.self_id = database_id(session)
+        self.peer_id = database_id(peer)
+        if self.self_id == self.peer_id:
+            raise ValueError("Cannot sync a database with itself (or with a copy of itself)")
+        states = {state.database_id: state for state in session.query(SyncState)}
+        self.pulled = states[self.peer_id].pulled_seq if self.peer_id in states else 0
+        self.applied = {id: state.applied_seq for id, state in states.items()}
+        self.counts = {"pulled": 0, "applied": 0, "skipped": 0, "conflicts": 0}
+        self.log = []
+
+    def _local_data(self, table, data, ids):
+        """A change's column values with references translated to local ids, or
+        None if it refers to a row that is not here"""
+        data = dict(data)
+        for column, target in REFERENCES[table].items():
+            if data.get(column) is not None:
+                data[column] = ids.local_id(target, data[column])
+                if data[column] is None:
+                    return None
+        return data
+
+    def _record(self, table, local_id, op, data, origin):
+        self.log.append({"table_name": table, "row_id": local_id, "op": op,
+                         "data": None if data is None else json.dumps(data),
+                         "origin_id": origin[0], "origin_seq": origin[1]})
+        self.counts["applied"] += 1
+
+    @staticmethod
+    def _typed(table, data):
+        values = dict(data)
+        for column in DATE_COLUMNS[table]:
+            if values.get(column) is not None:
+                values[column] = datetime.fromisoformat(values[column])
+        return values
+
+    def _insert(self, table, changes, ids):
+        model = MODELS[table]
+        next_id = (self.session.execute(select(func.max(model.id))).scalar() or 0) + 1
+        rows = []
+        emails = {}
+        if table == "users":
+            emails = User.ids_by_email(self.session, [data["email"] for _, data, _ in changes])
+        for change, data, origin in changes:
+            if ids.local_id(table, change.row_id) is not None:
+                self.counts["skipped"] += 1
+                continue
+            data = self._local_data(table, data, ids)
+            if data is None:
+                self.counts["conflicts"] += 1
+                continue
+            if table == "users" and normalize_email(data["email"]) in emails:
+                ids.add(table, change.row_id, emails[normalize_email(data["email"])])
+                self.counts["conflicts"] += 1
+                continue
+            ids.add(table, change.row_id, next_id)
+            if table == "users":
+                emails[normalize_email(data["email"])] = next_id
+            rows.append(dict(self._typed(table, data), id=next_id))
+            self._record(table, next_id, "insert", data, origin)
+            next_id += 1
+        if rows and table in ("workouts", "workout_exercises"):
+            model.insert_rows(self.session, rows)
+        elif rows:
+            self.session.execute(model.__table__.insert(), rows)
+        ids.save()
+
+    def _update(self, table, changes, ids):
+        model = MODELS[table]
+        rows = []
+        for change, data, origin in changes:
+            local_id = ids.local_id(table, change.row_id)
+            data = None if local_id is None else self._local_data(table, data, ids)
+            if data is None:
+                self.counts["skipped"] += 1
+                continue
+            if table == "users":
+                # An update whose email clashed further up the chain arrives without one
+                if "email" in data:
+                    owner = User.ids_by_email(self.session, [data["email"]]).get(normalize_email(data["email"]))
+                    if owner is not None and owner != local_id:
+                        del data["email"]
+                        self.counts["conflicts"] += 1
+                # One at a time, so the email check sees the updates before it
+                if data:
+                    self.session.execute(update(model.__table__).where(model.id == local_id)
+                                         .values(**self._typed(table, data)))
+            else:
+                rows.append(dict(self._typed(table, data), _id=local_id))
+            self._record(table, local_id, "update", data, origin)
+        if not rows:
+            return
+        local_ids = [row["_id"] for row in rows]
+        pairs = self._pairs(table, local_ids)
+        columns = [column for column in rows[0] if column != "_id"]
+        statement = (update(model.__table__).where(model.__table__.c.id == bindparam("_id"))
+                     .values({column: bindparam(column) for column in columns}))
+        self.session.connection().execute(statement, rows)
+        PersonalRecord.refresh_pairs(self.session, pairs + self._pairs(table, local_ids))
+        if table == "users" or table == "exercises":
+            invalidate_cache(model)
+
+    def _pairs(self, table, local_ids):
+        # (user, exercise) pairs whose personal records rows of table affect
+        if table == "workout_exercises":
+            return [pair for chunk in batched(local_ids, 500)
+                    for pair in exercise_pairs(self.session, WorkoutExercise.id.in_(chunk))]
+        if table == "workouts":
+            return [pair for chunk in batched(local_ids, 500)
+                    for pair in exercise_pairs(self.session, WorkoutExercise.workout_id.in_(chunk))]
+        return []
+
+    def _delete(self, table, changes, ids):
+        local_ids = []
+        for change, _, origin in changes:
+            local_id = ids.local_id(table, change.row_id)
+            if local_id is None:
+                self.counts["skipped"] += 1
+                continue
+            local_ids.append(local_id)
+            self._record(table, local_id, "delete", None, origin)
+        if local_ids:
+            # Rows made here that the delete takes with it are deleted here, as far as
+            # other databases are concerned
+            for child, child_id in self._cascaded(table, local_ids):
+                self.log.append({"table_name": child, "row_id": child_id, "op": "delete"})
+            # delete_many commits, so the position reached must already be written
+            self._save_position(changes[-1][0].seq)
+            MODELS[table].delete_many(self.session, local_ids)
+
+    def _cascaded(self, table, local_ids):
+        # (table, id) of the rows delete_many removes along with local_ids, children first
+        workouts = []
+        if table == "users":
+            workouts = [id for chunk in batched(local_ids, 500) for id in self.session.execute(
+                select(Workout.id).where(Workout.user_id.in_(chunk)).order_by(Workout.id)).scalars()]
+        elif table == "workouts":
+            workouts = local_ids
+        owner, parents = (WorkoutExercise.exercise_id, local_ids) if table == "exercises" else \
+            (WorkoutExercise.workout_id, workouts)
+        entries = [id for chunk in batched(parents, 500) for id in self.session.execute(
+            select(WorkoutExercise.id).where(owner.in_(chunk)).order_by(WorkoutExercise.id)).scalars()]
+        skip = {(change["table_name"], change["row_id"]) for change in self.log if change["op"] == "delete"}
+        rows = [("workout_exercises", id) for id in entries]
+        if table == "users":
+            rows += [("workouts", id) for id in workouts]
+        return [row for row in rows if row not in skip]
+
+    def _save_position(self, seq):
+        if self.log:
+            self.session.execute(Change.__table__.insert(), self.log)
+            self.log = []
+        states = [{"database_id": id, "applied_seq": seq_applied, "pulled_seq": 0}
+                  for id, seq_applied in self.applied.items() if id not in (self.self_id, self.peer_id)]
+        states.append({"database_id": self.peer_id, "applied_seq": self.applied.get(self.peer_id, 0),
+                       "pulled_seq": seq})
+        statement = sqlite_insert(SyncState.__table__)
+        for state in states:
+            pulled = state["pulled_seq"] if state["database_id"] == self.peer_id else SyncState.pulled_seq
+            self.session.execute(statement.values(**state).on_conflict_do_update(
+                index_elements=[SyncState.database_id],
+                set_={"applied_seq": state["applied_seq"], "pulled_seq": pulled}))
+
+    def run(self, batch_size):
+        while True:
+            batch = Change.since(self.peer, self.pulled, batch_size)
+            if not batch:
+                return
+            self.counts["pulled"] += len(batch)
+            pending = []
+            refs = set()
+            created = set()
+            marks = dict(self.applied)
+            for change in batch:
+                origin = (change.origin_id or self.peer_id, change.origin_seq or change.seq)
+                if origin[0] == self.self_id or origin[1] <= marks.get(origin[0], 0):
+                    self.counts["skipped"] += 1
+                    continue
+                marks[origin[0]] = origin[1]
+                data = None if change.data is None else json.loads(change.data)
+                pending.append((change, data, origin))
+                refs.add((change.table_name, change.row_id))
+                if change.op == "insert":
+                    created.add((change.table_name, change.row_id))
+                if data is not None:
+                    refs.update((target, data[column]) for column, target in REFERENCES[change.table_name].items()
+                                if data.get(column) is not None)
+            ids = _IdMap(self.session, self.peer, self.self_id, self.peer_id)
+            ids.load(refs, created)
+            for (table, op), run in groupby(pending, lambda entry: (entry[0].table_name, entry[0].op)):
+                changes = list(run)
+                for _, _, (origin_id, origin_seq) in changes:
+                    self.applied[origin_id] = origin_seq
+                if op == "insert":
+                    self._insert(table, changes, ids)
+                elif op == "update":
+                    self._update(table, changes, ids)
+                else:
+                    self._delete(table, changes, ids)
+            self.pulled = batch[-1].seq
+            self._save_position(self.pulled)
+            self.session.commit()
+            self.peer.rollback()
+
+def pull(session, peer, batch_size=DEFAULT_BATCH_SIZE):
+    """Replay the changes peer has made or received since the last pull, returning a SyncResult"""
+    replay = _Replay(session, peer)
+    session.info["sync_replay"] = True
+    try:
+        replay.run(batch_size)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.info.pop("sync_replay", None)
+    invalidate_cache(User)
+    invalidate_cache(Exercise)
+    return SyncResult(**replay.counts)
+
+def sync(session, peer, batch_size=DEFAULT_BATCH_SIZE):
+    """Pull in both directions, returning (result here, result in peer)"""
+    here = pull(session, peer, batch_size)
+    there = pull(peer, session, batch_size)
+    return here, there
@@ -0,0 +1,149 @@
+"""Log a whole workout in memory and save it in one transaction.
+
+    log = WorkoutSession("Leg Day", user_id=3)
+    log.add(exercise_id=1, sets=5, reps=5, weight=100)
+    log.add(exercise_id=4, sets=3, reps=12, weight=40)
+    workout = log.commit(session)
+
+Entries are checked with the same rules as the WorkoutExercise setters when
+they are added, and each one is appended to a journal file (JSON lines, synced
+to disk) before add() returns, so a crash loses nothing: pending() finds the
+unsaved journals in FITNESS_JOURNAL_DIR (default fitness-drafts) and open()
+resumes one, dropping an entry torn by the crash. commit() inserts the workout, its exercises and the personal
+record updates, commits once and then deletes the journal. If the process dies
+after that commit but before the journal is deleted, the next commit() finds
+the saved workout by user, name and start time and does not insert it again.
+"""
+import json
+import os
+import uuid
+from datetime import datetime
+
+from sqlalchemy import select
+
+from models import User, Exercise, Workout, WorkoutExercise
+
+JOURNAL_DIR = os.environ.get("FITNESS_JOURNAL_DIR", "fitness-drafts")
+
+class WorkoutSession:
+    def __init__(self, name, user_id, journal_dir=None, date=None, path=None):
+        Workout(name, user_id)  # validates the name
+        self.name = name
+        self.user_id = user_id
+        self.date = date or datetime.now()
+        self.entries = []
+        self.path = path
+        if path is None:
+            directory = journal_dir or JOURNAL_DIR
+            os.makedirs(directory, exist_ok=True)
+            self.path = os.path.join(directory, f"workout-{uuid.uuid4().hex}.jsonl")
+            self._journal({"op": "start", "name": name, "user_id": user_id, "date": self.date.isoformat()})
+
+    def _journal(self, entry):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def add(self, exercise_id, sets=3, reps=10, weight=0.0):
+        """Buffer one exercise, returning its position in the workout"""
+        row = WorkoutExercise.validated_row(
+            {"workout_id": None, "exercise_id": exercise_id, "sets": sets, "reps": reps, "weight": weight})
+        self._journal({"op": "add", "exercise_id": exercise_id, "sets": row["sets"],
+                       "reps": row["reps"], "weight": row["weight"]})
+        self.entries.append(row)
+        return len(self.entries) - 1
+
+    def remove(self, index):
+        """Drop the entry at index (negative counts from the end)"""
+        if not -len(self.entries) <= index < len(self.entries):
+            raise ValueError("No such entry in this workout")
+        index %= len(self.entries)
+        self._journal({"op": "remove", "index": index})
+        del self.entries[index]
+
+    def discard(self):
+        """Forget the workout without saving it"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _saved(self, session):
+        # A workout committed by an earlier run whose journal was not yet removed
+        return session.execute(
+            select(Workout).filter_by(user_id=self.user_id, name=self.name, date=self.date)
+        ).scalars().first()
+
+    def commit(self, session):
+        """Save the workout and all its entries in one transaction and return the Workout"""
+        if not self.entries:
+            raise ValueError("Add at least one exercise before saving the workout")
+        saved = self._saved(session)
+        if saved is not None:
+            self.discard()
+            return saved
+        if session.get(User, self.user_id) is None:
+            raise ValueError("User not found")
+        exercise_ids = {row["exercise_id"] for row in self.entries}
+        found = set(session.execute(select(Exercise.id).where(Exercise.id.in_(exercise_ids))).scalars())
+        if exercise_ids - found:
+            raise ValueError(f"Exercises not found: {', '.join(map(str, sorted(exercise_ids - found)))}")
+        workout = Workout(self.name, self.user_id)
+        workout.date = self.date
+        try:
+            session.add(workout)
+            session.flush()
+            WorkoutExercise.insert_rows(session, [dict(row, workout_id=workout.id) for row in self.entries])
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        self.discard()
+        return workout
+
+    @classmethod
+    def open(cls, path):
+        """Rebuild an unsaved workout from its journal, cutting off a line torn by a
+        crash mid-write so that later entries start on a line of their own"""
+        with open(path, "rb") as f:
+            data = f.read()
+        entries = []
+        end = 0
+        for line in data.splitlines(keepends=True):
+            # Only the last line can be torn, by a crash mid-write
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+            end += len(line)
+        if not entries or entries[0].get("op") != "start":
+            raise ValueError(f"{path} is not a workout journal")
+        if end < len(data):
+            with open(path, "r+b") as f:
+                f.truncate(end)
+                os.fsync(f.fileno())
+        start = entries[0]
+        log = cls(start["name"], start["user_id"], date=datetime.fromisoformat(start["date"]), path=path)
+        for entry in entries[1:]:
+            if entry["op"] == "add":
+                log.entries.append(WorkoutExercise.validated_row(dict(entry, workout_id=None)))
+            elif entry["op"] == "remove":
+                del log.entries[entry["index"]]
+        return log
+
+def pending(journal_dir=None):
+    """Unsaved workouts left in the journal directory, oldest first"""
+    directory = journal_dir or JOURNAL_DIR
+    if not os.path.isdir(directory):
+        return []
+    paths = [os.path.join(directory, name) for name in os.listdir(directory)
+             if name.startswith("workout-") and name.endswith(".jsonl")]
+    logs = []
+    for path in paths:
+        try:
+            logs.append(WorkoutSession.open(path))
+        except ValueError:
+            # Torn before its first entry was written, so there is nothing to resume
+            continue
+    return sorted(logs, key=lambda log: log.date)